@@ -0,0 +1,170 @@
+import glob
+import hashlib
+import os
+import pickle
+import time
+from kana_kanji_emit import save_bytes
+from kana_kanji_profile import measure
+
+class StageCache:
+    # Checkpoint the result of each named stage of the dictionary generator,
+    # keyed by a hash of the stage's input files, the keys of the stages it
+    # depends upon, its parameters, and the generator code itself.  A stage
+    # whose key is unchanged is loaded from the cache instead of being rerun.
+    # If a StageProfiler is given, each stage run or loaded is recorded in it.
+    def __init__(self, cacheDir, codeDir, enabled=True, profiler=None):
+        self.cacheDir = cacheDir
+        self.enabled = enabled
+        self.profiler = profiler
+        self.fileDigests = {}
+        # The code version covers every Python file of the generator, so any
+        # change to the code invalidates all of the cached stages.
+        codeHash = hashlib.sha256()
+        for codePath in sorted(glob.glob(os.path.join(codeDir, '*.py'))):
+            codeHash.update(self.file_digest(codePath).encode())
+        self.codeVersion = codeHash.hexdigest()
+        # Output files of the emitter stages, and whether each was updated.
+        self.outputs = []
+        if self.enabled:
+            os.makedirs(self.cacheDir, exist_ok=True)
+
+    def file_digest(self, path):
+        # Content hash of a file, computed once per run.
+        if path not in self.fileDigests:
+            fileHash = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    fileHash.update(block)
+            self.fileDigests[path] = fileHash.hexdigest()
+        return self.fileDigests[path]
+
+    def stage_key(self, name, files=(), deps=(), params=()):
+        stageHash = hashlib.sha256()
+        stageHash.update(name.encode())
+        stageHash.update(self.codeVersion.encode())
+        for path in files:
+            stageHash.update(os.path.basename(path).encode())
+            stageHash.update(self.file_digest(path).encode())
+        for dep in deps:
+            stageHash.update(dep.encode())
+        stageHash.update(repr(tuple(params)).encode())
+        return stageHash.hexdigest()
+
+    def _entry_path(self, name, key):
+        return os.path.join(self.cacheDir, f"{name}-{key[:16]}.pkl")
+
+    def _load(self, name, key):
+        entryPath = self._entry_path(name, key)
+        if not self.enabled or not os.path.exists(entryPath):
+            return None
+        with open(entryPath, 'rb') as f:
+            return pickle.load(f)
+
+    def _store(self, name, key, value):
+        if not self.enabled:
+            return
+        # Only the latest result of a stage is kept.
+        for stalePath in glob.glob(os.path.join(self.cacheDir, f"{name}-*.pkl")):
+            os.remove(stalePath)
+        with open(self._entry_path(name, key), 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _call(self, name, func, args):
+        if self.profiler is None:
+            return func(*args)
+        return self.profiler.call(name, func, args)
+
+    def _submit(self, executor, func, args):
+        # The stage is measured in the worker process running it.
+        if self.profiler is None:
+            return executor.submit(func, *args)
+        return executor.submit(measure, func, args, self.profiler.traceMemory)
+
+    def _gather(self, name, future):
+        if self.profiler is None:
+            return future.result()
+        result, metrics = future.result()
+        self.profiler.add(name, metrics)
+        return result
+
+    def run(self, name, func, args=(), files=(), deps=(), params=()):
+        # Run a stage that returns a result, or load its cached result.
+        # Returns the result and the stage key, for use by later stages.
+        key = self.stage_key(name, files, deps, params)
+        start = time.perf_counter()
+        entry = self._load(name, key)
+        if entry is not None:
+            print(f"Stage '{name}' is unchanged, loaded from the stage cache.")
+            if self.profiler is not None:
+                self.profiler.loaded(name, time.perf_counter() - start, entry['result'])
+            return entry['result'], key
+
+        result = self._call(name, func, args)
+        self._store(name, key, {'result': result})
+        return result, key
+
+    def _restore_outputs(self, name, key, outputs):
+        # Write the cached contents of the output files of an emitter stage.
+        # Returns False if the stage is not in the cache.
+        start = time.perf_counter()
+        entry = self._load(name, key)
+        if entry is None:
+            return False
+        print(f"Stage '{name}' is unchanged, writing outputs from the stage cache.")
+        for outPath in outputs:
+            self.outputs.append((outPath, save_bytes(outPath, entry['outputs'][os.path.basename(outPath)])))
+        if self.profiler is not None:
+            self.profiler.loaded(name, time.perf_counter() - start)
+        return True
+
+    def _store_outputs(self, name, key, outputs, updated):
+        for outPath in outputs:
+            self.outputs.append((outPath, updated))
+        contents = {}
+        for outPath in outputs:
+            # Keyed by file name, so the cache serves any output directory.
+            with open(outPath, 'rb') as f:
+                contents[os.path.basename(outPath)] = f.read()
+        self._store(name, key, {'outputs': contents})
+
+    def run_emitter(self, name, func, args=(), outputs=(), files=(), deps=(), params=()):
+        # Run a stage that writes output files, or write the cached contents
+        # of those files.  The stage function returns whether its output was
+        # updated.  Returns the stage key.
+        key = self.stage_key(name, files, deps, params)
+        if not self._restore_outputs(name, key, outputs):
+            self._store_outputs(name, key, outputs, self._call(name, func, args))
+        return key
+
+    def run_emitters(self, stages, executor=None):
+        # Run independent emitter stages, each given as a dict of the arguments
+        # of run_emitter().  The stages that are not in the cache are submitted
+        # to the executor, if one is given, to run concurrently.  Results are
+        # gathered in the order the stages are given, so the cache and the
+        # output report do not depend on which stage finishes first.
+        # Returns the stage keys.
+        keys = []
+        pending = []
+        for stage in stages:
+            key = self.stage_key(stage['name'], stage.get('files', ()), stage.get('deps', ()),
+                                 stage.get('params', ()))
+            keys.append(key)
+            if self._restore_outputs(stage['name'], key, stage['outputs']):
+                continue
+            if executor is not None:
+                result = self._submit(executor, stage['func'], stage['args'])
+            else:
+                result = self._call(stage['name'], stage['func'], stage['args'])
+            pending.append((stage, key, result))
+
+        for stage, key, result in pending:
+            updated = self._gather(stage['name'], result) if executor is not None else result
+            self._store_outputs(stage['name'], key, stage['outputs'], updated)
+        return keys
+
+    def print_output_report(self):
+        # Outputs whose content did not change were not rewritten.
+        updated = [os.path.basename(path) for path, changed in self.outputs if changed]
+        unchanged = [os.path.basename(path) for path, changed in self.outputs if not changed]
+        print(f"Updated outputs: {', '.join(updated) if updated else 'none'}")
+        print(f"Unchanged outputs (not rewritten): {', '.join(unchanged) if unchanged else 'none'}")
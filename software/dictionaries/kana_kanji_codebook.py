@@ -0,0 +1,168 @@
+from kana_kanji_emit import c_bytes
+
+# Byte pair encoding of the English meaning strings (Kanji meanings and
+# dictionary word meanings), decoded by meaning_text() in kdict.cpp.
+#
+# Encoded string format, terminated by a NUL as before:
+#   0x02-0x7f  - The ASCII character itself.
+#   0x80-0xff  - Token (byte - 0x80) of the codebook, which expands to the
+#                bytes meaning_tokens[meaning_token_offsets[t]] up to, but
+#                not including, meaning_tokens[meaning_token_offsets[t + 1]].
+#   0x01 b     - The byte b itself, for the bytes 0x80-0xff of the few
+#                meanings that are not ASCII.
+# The codebook is emitted to kanji_ms.h, with MEANING_TEXT_SIZE, the size of
+# a buffer holding the longest decoded meaning, and KDICT_MEANING_CODEBOOK,
+# which selects the decoder.
+MEANING_TOKENS = 128
+MEANING_TOKEN_BASE = 0x80
+MEANING_ESCAPE = 0x01
+
+CODEBOOK = """/* Meaning codebook: {count} tokens, {size} bytes. */
+#define KDICT_MEANING_CODEBOOK
+#define MEANING_TEXT_SIZE {textSize}
+const uint16_t meaning_token_offsets[] = {{
+  {offsets}}};
+const char meaning_tokens[] =
+  "{tokens}";
+"""
+
+class MeaningCodebook:
+    # Trained on the distinct meanings, each counted once as each is stored
+    # once in the string pool (and mostly once without it).  Each round, the
+    # most frequent pair of adjacent symbols of the meanings is merged into a
+    # new token, for as long as a pair occurs more than once.  The bytes
+    # 0x80-0xff of non-ASCII meanings are never merged.
+    def __init__(self, texts, tokenCount=MEANING_TOKENS):
+        unique = list(dict.fromkeys(texts))
+        for text in unique:
+            if chr(0) in text or chr(MEANING_ESCAPE) in text:
+                raise ValueError(f"Meaning {text!r} holds a reserved byte.")
+        words = [list(text.encode('utf8')) for text in unique]
+        pairCounts = {}
+        pairWords = {}
+        def count(ndx, word, step):
+            for pair in zip(word, word[1:]):
+                if not mergeable(pair[0]) or not mergeable(pair[1]):
+                    continue
+                pairCounts[pair] = pairCounts.get(pair, 0) + step
+                if step > 0:
+                    pairWords.setdefault(pair, set()).add(ndx)
+                elif pairCounts[pair] == 0:
+                    del pairCounts[pair]
+
+        for ndx, word in enumerate(words):
+            count(ndx, word, 1)
+
+        # Symbols 256 and up are tokens, token t being symbol 256 + t.
+        self.merges = []
+        while len(self.merges) < tokenCount and pairCounts:
+            best = max(pairCounts.items(), key=lambda item: (item[1], item[0]))
+            if best[1] < 2:
+                break
+            pair = best[0]
+            symbol = 256 + len(self.merges)
+            self.merges.append(pair)
+            for ndx in pairWords.pop(pair):
+                count(ndx, words[ndx], -1)
+                words[ndx] = merge_pair(words[ndx], pair, symbol)
+                count(ndx, words[ndx], 1)
+            pairCounts.pop(pair, None)
+
+        self.expansions = []
+        for first, second in self.merges:
+            self.expansions.append(self.expand(first) + self.expand(second))
+        self.ranks = {pair: rank for rank, pair in enumerate(self.merges)}
+        self.encoded = {}
+        self.textSize = max([len(text.encode('utf8')) for text in unique], default=0) + 1
+
+    def expand(self, symbol):
+        return bytes([symbol]) if symbol < 256 else self.expansions[symbol - 256]
+
+    def encode(self, text):
+        # Apply the merges in the order they were learnt, as in training, then
+        # map the symbols to the encoded bytes.
+        if text in self.encoded:
+            return self.encoded[text]
+        word = list(text.encode('utf8'))
+        while True:
+            ranked = [self.ranks[pair] for pair in zip(word, word[1:]) if pair in self.ranks]
+            if not ranked:
+                break
+            rank = min(ranked)
+            word = merge_pair(word, self.merges[rank], 256 + rank)
+        data = bytearray()
+        for symbol in word:
+            if symbol >= 256:
+                data.append(MEANING_TOKEN_BASE + symbol - 256)
+            elif symbol >= MEANING_TOKEN_BASE:
+                data.extend([MEANING_ESCAPE, symbol])
+            else:
+                data.append(symbol)
+        self.encoded[text] = bytes(data)
+        return self.encoded[text]
+
+    def decode(self, data):
+        # Reference of meaning_text() in kdict.cpp.
+        text = bytearray()
+        ndx = 0
+        while ndx < len(data):
+            byte = data[ndx]
+            if byte == MEANING_ESCAPE:
+                ndx += 1
+                text.append(data[ndx])
+            elif byte >= MEANING_TOKEN_BASE:
+                text.extend(self.expansions[byte - MEANING_TOKEN_BASE])
+            else:
+                text.append(byte)
+            ndx += 1
+        return bytes(text).decode('utf8')
+
+    def verify(self, texts):
+        # Every meaning must decode to itself, and its encoding must hold no
+        # NUL, and fit MEANING_TEXT_SIZE when decoded.
+        for text in texts:
+            data = self.encode(text)
+            if 0 in data or self.decode(data) != text:
+                raise ValueError(f"Meaning {text!r} does not round trip through the codebook.")
+            if len(text.encode('utf8')) >= self.textSize:
+                raise ValueError(f"Meaning {text!r} does not fit MEANING_TEXT_SIZE.")
+
+    def tokens_size(self):
+        return sum(len(expansion) for expansion in self.expansions)
+
+    def render(self):
+        offsets = [0]
+        for expansion in self.expansions:
+            offsets.append(offsets[-1] + len(expansion))
+        rows = [', '.join(str(offset) for offset in offsets[ndx:ndx + 16]) for ndx in range(0, len(offsets), 16)]
+        return CODEBOOK.format(count=len(self.expansions), size=self.tokens_size() + 2 * len(offsets),
+                               textSize=self.textSize, offsets=',\n  '.join(rows),
+                               tokens=c_bytes(b''.join(self.expansions)))
+
+def mergeable(symbol):
+    # ASCII bytes and tokens are merged, the escaped bytes are not.
+    return symbol < MEANING_TOKEN_BASE or symbol >= 256
+
+def merge_pair(word, pair, symbol):
+    # Replace the occurrences of pair in word, from left to right.
+    merged = []
+    ndx = 0
+    while ndx < len(word):
+        if ndx + 1 < len(word) and word[ndx] == pair[0] and word[ndx + 1] == pair[1]:
+            merged.append(symbol)
+            ndx += 2
+        else:
+            merged.append(word[ndx])
+            ndx += 1
+    return merged
+
+def print_codebook_report(codebook, meanings):
+    # meanings are the meaning strings of the headers, repeats included.
+    unique = list(dict.fromkeys(meanings))
+    rawBytes = sum(len(text.encode('utf8')) + 1 for text in unique)
+    encodedBytes = sum(len(codebook.encode(text)) + 1 for text in unique)
+    bookBytes = codebook.tokens_size() + 2 * (len(codebook.expansions) + 1)
+    print(f"Meaning codebook: {len(codebook.expansions)} tokens of up to "
+          f"{max([len(expansion) for expansion in codebook.expansions], default=0)} bytes, {bookBytes} bytes.")
+    print(f"  {len(unique)} distinct meanings, {rawBytes} bytes as text, {encodedBytes} bytes encoded "
+          f"({100 * encodedBytes / max(rawBytes, 1):.1f}%): {rawBytes - encodedBytes - bookBytes} bytes saved.")
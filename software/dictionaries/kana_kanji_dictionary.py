@@ -1,7 +1,23 @@
 import xml.etree.ElementTree as ET
 import pandas as pd
 import itertools
-import mmh3
+import gzip
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from kana_kanji_cache import StageCache
+from kana_kanji_profile import StageProfiler
+from kana_kanji_postings import PostingLists
+from kana_kanji_strings import build_string_pool, print_string_pool_report
+from kana_kanji_codebook import MeaningCodebook, print_codebook_report
+from kana_kanji_emit import (HeaderBuffer, KANJI_MD_TYPE, KANJI_MS, KANJI_MD, meaning_literal, meaning_value,
+                             write_onyomi_header, write_kunyomi_header, write_nanori_header,
+                             write_dictionary_header)
+from kana_kanji_reverse import KanjiReverseIndex, write_kanji_index_header
+from kana_kanji_trie import DEFAULT_TOP_K, build_kana_trie, write_kana_trie_header
+from kana_kanji_footprint import (kanji_ms_footprint, kanji_md_footprint, onyomi_footprint,
+                                  kunyomi_footprint, nanori_footprint, dictionary_footprint,
+                                  kanji_index_footprint, kana_trie_footprint, print_footprint_report)
 
 def ranges(i):
     for a, b in itertools.groupby(enumerate(i), lambda pair: pair[1] - pair[0]):
@@ -23,49 +39,133 @@ def reverse_Bits(n, no_of_bits):
         n >>= 1
     return result
 
-def print_balanced_bst(sList, prefix, outFile):
-    # If the list is empty, return an empty string (null pointer).
-    if not sList:
-        return 0
-    
-    # Length of list.
-    n = len(sList)
-    # Midpoint of list.
-    mid = n // 2
-    # The key for the node is the middle element of the list.
-    key = sList[mid]
-    # The left (lower) list consists of list elements to left of key.
-    lList = sList[0:mid]
-    # The right (higher) list consists of list elements to right of key.
-    rList = sList[mid+1:n]
-    # Recurse on balanced BST for the left and right lists.
-    lNode = print_balanced_bst(lList, prefix, outFile)
-    rNode = print_balanced_bst(rList, prefix, outFile)
-    
-    # Print the C structure representing the node.
-    # Data Type 4?: Node for balanced binary tree.
-    # typedef struct bbt_node {
-    #   const uint64_t key;
-    #   const reading_md* onmd;
-    #   const bbt_node * const lnode;
-    #   const bbt_node * const rnode;
-    # } bbt_node;
-    lCurl = '{'
-    rCurl = '}'
-    print(f"const bbt_node {prefix}_node{key} {lCurl}", end='', file=outFile)
-    print(f"{key}, &{prefix}_md{key},", end='', file=outFile)
-    if lNode != 0:
-        print(f" &{prefix}_node{lNode},", end='', file=outFile)
+def iter_kanjidic2(xmlPath):
+    # Stream the 'character' elements of Kanji Dictionary 2 one at a time,
+    # rather than holding the whole element tree in memory.  The file may
+    # be plain XML or gzip-compressed XML (as distributed by EDRDG).
+    if xmlPath.endswith('.gz'):
+        xmlFile = gzip.open(xmlPath, 'rb')
     else:
-        print(" NULL,", end='', file=outFile)
-
-    if rNode != 0:
-        print(f" &{prefix}_node{rNode}", end='', file=outFile)
-    else:
-        print(" NULL", end='', file=outFile)
-
-    print(f"{rCurl};", file=outFile)
-    return key
+        xmlFile = open(xmlPath, 'rb')
+
+    with xmlFile:
+        context = ET.iterparse(xmlFile, events=('start', 'end'))
+        # The first event is the start of the root element.
+        _, root = next(context)
+        for event, elem in context:
+            if event == 'end' and elem.tag == 'character':
+                yield elem
+                # The character has been processed, so release its subtree
+                # and drop it from the root so that memory use stays flat.
+                elem.clear()
+                root.clear()
+
+class RowAccumulator:
+    # Gather the rows of a DataFrame into plain per-column lists, so that the
+    # DataFrame is constructed once at the end rather than being copied by a
+    # pd.concat() for every row that is added.
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.data = {name: [] for name in self.columns}
+
+    @classmethod
+    def from_frame(cls, df):
+        # Start from the rows of an existing DataFrame.
+        acc = cls(df.columns)
+        for name in acc.columns:
+            acc.data[name] = df[name].tolist()
+        return acc
+
+    def __len__(self):
+        return len(self.data[self.columns[0]])
+
+    def append(self, *values):
+        # Add a row, with the values given in column order.
+        for name, value in zip(self.columns, values):
+            self.data[name].append(value)
+
+    def column(self, name):
+        return self.data[name]
+
+    def find(self, name, value):
+        # Return the row positions where the column holds the value.
+        return [ndx for ndx, item in enumerate(self.data[name]) if item == value]
+
+    def to_frame(self):
+        return pd.DataFrame(self.data, columns=self.columns)
+
+class ReadingIndex(RowAccumulator):
+    # Inverted index from a reading (the first column) to its postings, one
+    # posting per Kanji or word, held as a list in each of the other columns.
+    # Readings are located through a dictionary, so adding a posting takes
+    # constant time.  If uniqueName names a posting column, a posting whose
+    # value in that column is already present for the reading is handed to
+    # the merge function instead of being appended.
+    def __init__(self, columns, uniqueName=None, merge=None):
+        super().__init__(columns)
+        self.postingNames = self.columns[1:]
+        self.uniqueName = uniqueName
+        self.merge = merge
+        self.readingRow = {}
+        self.uniqueSlot = []
+
+    def add(self, reading, *values):
+        # Add a posting for the reading, with values given in posting column
+        # order.  Returns False if the posting was merged into an existing one.
+        values = dict(zip(self.postingNames, values))
+        row = self.readingRow.get(reading)
+        if row is None:
+            self.readingRow[reading] = len(self)
+            self.append(reading, *[[values[name]] for name in self.postingNames])
+            if self.uniqueName is not None:
+                self.uniqueSlot.append({values[self.uniqueName]: 0})
+            return True
+
+        postings = {name: self.data[name][row] for name in self.postingNames}
+        if self.uniqueName is not None:
+            slots = self.uniqueSlot[row]
+            slot = slots.get(values[self.uniqueName])
+            if slot is not None:
+                self.merge(postings, slot, values)
+                return False
+            slots[values[self.uniqueName]] = len(postings[self.uniqueName])
+
+        for name in self.postingNames:
+            postings[name].append(values[name])
+        return True
+
+def merge_meanings(postings, slot, values):
+    # Merge function for a ReadingIndex that joins the meaning of a word that
+    # appears more than once for the same reading onto the existing meaning.
+    # The words are added in rank order, so the word keeps its first rank.
+    postings['MeaningList'][slot] = postings['MeaningList'][slot] + ", " + values['MeaningList']
+
+def word_key_index(readings, words):
+    # Map each (reading, word) pair to the list of rows holding it, so that
+    # another word list can be joined against these rows with one lookup per
+    # word rather than a scan of all of the rows.
+    keyIndex = {}
+    for ndx, key in enumerate(zip(readings, words)):
+        keyIndex.setdefault(key, []).append(ndx)
+    return keyIndex
+
+def kanji_coverage_report(source, dfSource, wordName, kanjiSet):
+    # List each word of a word source that uses Kanji outside of the set of
+    # supported Kanji, along with the unsupported Kanji.  Characters below
+    # U+4E00 are Kana or punctuation and are not checked.  As with the removal
+    # of Kana-only words, anything above is treated as Kanji, so full-width
+    # Latin letters (which are not in the font either) are reported too.
+    report = RowAccumulator(['Source', 'Row', 'Reading', 'Word', 'Unsupported'])
+    for ndx, reading, word in zip(dfSource.index, dfSource['Reading'], dfSource[wordName]):
+        unsupported = ''.join(kanji for kanji in word if kanji >= '一' and kanji not in kanjiSet)
+        if unsupported:
+            report.append(source, ndx, reading, word, unsupported)
+
+    report = report.to_frame()
+    print(f"{len(report)} of {len(dfSource)} words in {source} use unsupported Kanji.")
+    for reading, word, unsupported in zip(report['Reading'], report['Word'], report['Unsupported']):
+        print(f"  {source}: {word} ({reading}) uses characters not in the Kanji subset: {unsupported}")
+    return report
 
 # List of Kanji that are more frequent in Kanji lists othen than
 # Kanji Dictionary 2.  Removed '𠮟', as it is very rarely used.
@@ -82,1129 +182,493 @@ altKanji = ['昧', '碗', '潰', '柵', '璧', '賦', '頁', '覗', '廻', '箇'
             '遜', '遡', '遵', '酎', '醒', '采', '錮', '頓', '頰', '顎',
             '骸', '鬱']
 
-# Load in the Novel 5K CSV file.
-dfN5K = pd.read_csv('./Novel_5K.csv')
-# Add a column indicating match with KanjiDict 2.
-dfN5K['Matched'] = 0
-
-print("Extracting usable kanji from kanjidic2.xml....")
-# Read in the XML file containing Kanji Dictionary 2.
-tree = ET.parse('./kanjidic2.xml')
-# Reference the root of the tree.
-root = tree.getroot()
-
-# Create a new dataframe to hold the usable kanji entries.
-# Usable kanji must have some reading or nanori.
-df1 = pd.DataFrame(columns = ['UCS', 'Kanji', 'KD2_Rank', 'N5K_Rank', 'Meanings', 'OnReadings', 'KunReadings', 'Nanori'])
-
-for character in root.findall('character'):
-    # Extract the Unicode value for the Kanji character.
-    ucs = character.find("codepoint/cp_value/[@cp_type='ucs']").text
-    # Extract the Kanji character itself.
-    kanji = character.find("literal").text
-    # Attempt to extract the frequency ranking value.
-    freq_tag = character.find("misc/freq")
-    # Assign arbitrary frequency rank if no ranking is found.
-    if freq_tag is not None:
-        freq = int(freq_tag.text)
-    elif kanji in altKanji:
-        freq = 8000
-    else:
-        freq = 10000
-
-    # Find Novel 5K ranking for the Kanji character.
-    ndxList = dfN5K.index[dfN5K['Kanji'] == kanji].tolist()
-    if len(ndxList) != 0:
-        # The Kanji is present in Novel 5K and there should be only one instance.
-        ndx = ndxList[0]
-        # Obtain Novel 5K frequency ranking value.
-        n5kRank = dfN5K.iloc[ndx]['Source Order']
-        dfN5K.at[ndx, 'Matched'] = dfN5K.at[ndx, 'Matched'] + 1
-    else:
-        # The Kanji is not present Novel 5K data set, so use a default value.
-        # print(f'Kanji {kanji} is not found in Novel 5K.')
-        n5kRank = 10000
-
-    if freq < 10000 and n5kRank == 10000:
-        n5kRank = 9000
-        print(f'Kanji: {kanji} ({ucs}) is in Kanji Dict 2 ({freq}) but not in Novel 5K ({n5kRank})!')
-        # Preserve KanjiDict2 ranking if low enough.
-        if freq < 8000:
-            n5kRank = freq
-
-    # Construct list of meanings.
-    meanings = []
-    for meaning in character.findall("reading_meaning/rmgroup/meaning"):
-        if meaning.attrib == {}:
-            meanings.append(meaning.text)
-
-    meanings = ', '.join(meanings)
-
-    # Construct list of onyomi.
-    on_list = []
-    # Test if r_type='ja_on' exists before iterating.
-    for on_item in character.findall("reading_meaning/rmgroup/reading/[@r_type='ja_on']"):
-        on_list.append(on_item.text)
-    
-    # Construct list of kunyomi.
-    kun_list = []
-    # Test if r_type='ja_kun' exists before iterating.
-    for kun_item in character.findall("reading_meaning/rmgroup/reading/[@r_type='ja_kun']"):
-        kun_list.append(kun_item.text)
-    
-    # Construct list of nanori.
-    nan_list = []
-    # Test if an nanori exists before iterating.
-    for nan_item in character.findall("reading_meaning/nanori"):
-        nan_list.append(nan_item.text)
-
-    # If there are no readings for this kanji, so skip further processing.
-    if len(on_list) == 0 and len(kun_list) == 0 and len(nan_list) == 0:
-        print(f"Unicode {ucs}, with frequency {freq}, has no readings or nanori!")
-        continue
-
-    # Construct and concatenate a new row to DataFrame 1.
-    new_row = pd.DataFrame([[ucs, kanji, freq, n5kRank, meanings, on_list, kun_list, nan_list]],
-                           columns=['UCS', 'Kanji', 'KD2_Rank', 'N5K_Rank', 'Meanings', 'OnReadings', 'KunReadings', 'Nanori'])
-    df1 = pd.concat([df1, new_row], ignore_index=True)
-
-print("Done extracting usable kanji from kanjidic2.xml.")
-
-# Discard all Kanji with a rank of 10000, as they are too rare.
-df1Subset = df1.loc[df1['N5K_Rank'] < 10000]
-
-# Sort the subset according to the Novel 5K frequency ranking.  This is done
-# to allow the file content to be reduced from the end of the file and still
-# provide the most common Kanji.
-df1Sort = df1Subset.sort_values(by='N5K_Rank').copy()
-
-# This Unicode-ordered list of Kana and Kanji characters are used generate
-# The font bitmap data for LVGL using the LGVL Online Font Converter
-# (https://lvgl.io/tools/fontconverter).  The name of the font is KanaKanjiFontSmall.
-# The size is 32 pixels with 1 bpp.  Font used is Noto_Sans_Mono_CJK_JP-Regular.otf.
-# Sort the subset according to Kanji Unicode and generate an ordered list.
-df1KanjiSort = df1Subset.sort_values(by='UCS').copy()
-kanjiHexList = df1KanjiSort['UCS'].tolist()
-# Covert ordered list to ranges to reduce size of list.
-kanjiIntList = []
-for kanjiHex in kanjiHexList:
-    # Make string of Kana bytes look like a hex number.
-    kanjiHex = "0x" + kanjiHex
-    # Convert hex to interger value for sorting purposes.
-    kanjiIntList.append(int(kanjiHex, 16))
-
-# Convert the ranges to a Python list
-kanjiRangeList = list(ranges(kanjiIntList))
-
-# Write out the list, with Hiragana and Katakana ranges first,
-# followed by the Kanji ranges.  Ranges that have only one
-# Kanji Unicode are specified a single Kanji Unicode.
-with open("./kana_kanji_subset.txt", "w") as f:
-    print("0x2B06, 0x2B07, 0x3005, 0x3041-0x3096, 0x309D-0x309E", end='', file=f)
-    print(", 0x30A1-0x30F7, 0x30FC-0x30FE", end='', file=f)
+
+def extract_kanji(n5kPath, kd2Path):
+    # Stage: extract the usable Kanji from Kanji Dictionary 2, ranking each
+    # with its Novel 5K frequency ranking.  Returns DataFrame 1.
+    # Load in the Novel 5K CSV file.
+    dfN5K = pd.read_csv(n5kPath)
+    # Index the Novel 5K Kanji, mapping each Kanji to its row and its frequency
+    # ranking.  Should a Kanji appear more than once, its first row is used.
+    n5kIndex = {}
+    for ndx, (kanji, sourceOrder) in enumerate(zip(dfN5K['Kanji'], dfN5K['Source Order'])):
+        if kanji not in n5kIndex:
+            n5kIndex[kanji] = (ndx, sourceOrder)
+
+    # Rows of Novel 5K matched with KanjiDict 2, one entry per match.
+    n5kMatchList = []
+
+    print("Extracting usable kanji from kanjidic2.xml....")
+
+    # Create a new dataframe to hold the usable kanji entries.
+    # Usable kanji must have some reading or nanori.
+    df1Rows = RowAccumulator(['UCS', 'Kanji', 'KD2_Rank', 'N5K_Rank', 'Meanings', 'OnReadings', 'KunReadings', 'Nanori'])
+
+    # Stream each character element from the XML file.
+    for character in iter_kanjidic2(kd2Path):
+        # Extract the Unicode value for the Kanji character.
+        ucs = character.find("codepoint/cp_value/[@cp_type='ucs']").text
+        # Extract the Kanji character itself.
+        kanji = character.find("literal").text
+        # Attempt to extract the frequency ranking value.
+        freq_tag = character.find("misc/freq")
+        # Assign arbitrary frequency rank if no ranking is found.
+        if freq_tag is not None:
+            freq = int(freq_tag.text)
+        elif kanji in altKanji:
+            freq = 8000
+        else:
+            freq = 10000
+
+        # Find Novel 5K ranking for the Kanji character.
+        n5kEntry = n5kIndex.get(kanji)
+        if n5kEntry is not None:
+            # The Kanji is present in Novel 5K, so obtain its row and
+            # frequency ranking value.
+            ndx, n5kRank = n5kEntry
+            n5kMatchList.append(ndx)
+        else:
+            # The Kanji is not present Novel 5K data set, so use a default value.
+            # print(f'Kanji {kanji} is not found in Novel 5K.')
+            n5kRank = 10000
+
+        if freq < 10000 and n5kRank == 10000:
+            n5kRank = 9000
+            print(f'Kanji: {kanji} ({ucs}) is in Kanji Dict 2 ({freq}) but not in Novel 5K ({n5kRank})!')
+            # Preserve KanjiDict2 ranking if low enough.
+            if freq < 8000:
+                n5kRank = freq
+
+        # Construct list of meanings.
+        meanings = []
+        for meaning in character.findall("reading_meaning/rmgroup/meaning"):
+            if meaning.attrib == {}:
+                meanings.append(meaning.text)
+
+        meanings = ', '.join(meanings)
+
+        # Construct list of onyomi.
+        on_list = []
+        # Test if r_type='ja_on' exists before iterating.
+        for on_item in character.findall("reading_meaning/rmgroup/reading/[@r_type='ja_on']"):
+            on_list.append(on_item.text)
+
+        # Construct list of kunyomi.
+        kun_list = []
+        # Test if r_type='ja_kun' exists before iterating.
+        for kun_item in character.findall("reading_meaning/rmgroup/reading/[@r_type='ja_kun']"):
+            kun_list.append(kun_item.text)
+
+        # Construct list of nanori.
+        nan_list = []
+        # Test if an nanori exists before iterating.
+        for nan_item in character.findall("reading_meaning/nanori"):
+            nan_list.append(nan_item.text)
+
+        # If there are no readings for this kanji, so skip further processing.
+        if len(on_list) == 0 and len(kun_list) == 0 and len(nan_list) == 0:
+            print(f"Unicode {ucs}, with frequency {freq}, has no readings or nanori!")
+            continue
+
+        # Add a new row for DataFrame 1.
+        df1Rows.append(ucs, kanji, freq, n5kRank, meanings, on_list, kun_list, nan_list)
+
+    # Construct DataFrame 1 from the accumulated rows.
+    df1 = df1Rows.to_frame()
+    # Add a column indicating match with KanjiDict 2.
+    dfN5K['Matched'] = pd.Series(n5kMatchList, dtype='int64').value_counts().reindex(dfN5K.index, fill_value=0)
+    print("Done extracting usable kanji from kanjidic2.xml.")
+
+    return df1
+
+
+def write_kana_kanji_subset(df1Subset, outPath):
+    # Stage: write the Kana and Kanji Unicode ranges for the font converter.
+    # This Unicode-ordered list of Kana and Kanji characters are used generate
+    # The font bitmap data for LVGL using the LGVL Online Font Converter
+    # (https://lvgl.io/tools/fontconverter).  The name of the font is KanaKanjiFontSmall.
+    # The size is 32 pixels with 1 bpp.  Font used is Noto_Sans_Mono_CJK_JP-Regular.otf.
+    # Sort the subset according to Kanji Unicode and generate an ordered list,
+    # converting the hex Unicode strings to integers.
+    kanjiIntList = [int(kanjiHex, 16) for kanjiHex in sorted(df1Subset['UCS'])]
+
+    # Covert ordered list to ranges to reduce size of list.
+    kanjiRangeList = list(ranges(kanjiIntList))
+
+    # Write out the list, with Hiragana and Katakana ranges first,
+    # followed by the Kanji ranges.  Ranges that have only one
+    # Kanji Unicode are specified a single Kanji Unicode.
+    out = HeaderBuffer()
+    out.write("0x2B06, 0x2B07, 0x3005, 0x3041-0x3096, 0x309D-0x309E")
+    out.write(", 0x30A1-0x30F7, 0x30FC-0x30FE")
     for subrange in kanjiRangeList:
         if subrange[0] == subrange[1]:
-            startRange = "{:04x}".format(subrange[0])
-            print(f", 0x{startRange}", end='', file=f)
+            out.write(f", 0x{subrange[0]:04x}")
         else:
-            startRange = "{:04x}".format(subrange[0])
-            endRange = "{:04x}".format(subrange[1])
-            print(f", 0x{startRange}-0x{endRange}", end='', file=f)
-
-# Print out the meaning strings for each Kanji, ordered by Novel 5K
-# frequency ranking, to a file.
-struct_data = []
-# Open Kanji meaning string file for appended writing.
-with open("./kanji_ms.h", "w") as f:
-    # Iterate on the rows of he sorted dataframe.
-    for idx, row in df1Sort.iterrows():
-        # The Unicode character is the unique part of each bitmap name.
-        ucs_name = str.upper(row['UCS'])
-        # Add bitmap name and Novel 5K rank to structure data.
-        struct_data.append([ucs_name, row['N5K_Rank']])
-        # Data structure 2: Kanji meaning string.
-        # const char kanji_ms<UCS>[] = "<Kanji UCS meaning string>";
-        print(f"const char kanji_ms{ucs_name}[] = \"{row['Meanings']}\";", file=f)
-
-f.close()
-
-# Open Kanji metadata file for appended writing.  Now the metadata only needs
-# to convey the Unicode value, the frequency rank, and meaning.  The actual
-# font bitmaps are obtained from KanaKanjiFontSmall, using the utf8 Unicode
-# value as the character selector.
-with open("./kanji_md.h", "w") as f:
+            out.write(f", 0x{subrange[0]:04x}-0x{subrange[1]:04x}")
+    return out.save(outPath)
+
+
+def write_kanji_ms(df1Sort, outPath, sharedStrings=None, meaningCodec=None):
+    # Stage: write the Kanji meaning strings header (kanji_ms.h).
+    # Print out the meaning strings for each Kanji, ordered by Novel 5K
+    # frequency ranking.  The Unicode character is the unique part of each
+    # string name.
+    # Data structure 2: Kanji meaning string.
+    # const char kanji_ms<UCS>[] = "<Kanji UCS meaning string>";
+    # With a string pool, the header holds the pool instead, which has the
+    # meanings and the strings of the reading headers.  With a meaning
+    # codebook, the codebook comes first, and the meanings are encoded.
+    out = HeaderBuffer()
+    if meaningCodec is not None:
+        meaningCodec.verify(df1Sort['Meanings'])
+        out.write(meaningCodec.render())
+    if sharedStrings is not None:
+        out.write(sharedStrings.render())
+        return out.save(outPath)
+    for ucs, meaning in zip(df1Sort['UCS'], df1Sort['Meanings']):
+        out.emit(KANJI_MS, ucs=ucs.upper(), meaning=meaning_literal(meaning, meaningCodec))
+    return out.save(outPath)
+
+
+def write_kanji_md(df1Sort, outPath, sharedStrings=None, meaningCodec=None):
+    # Stage: write the Kanji metadata header (kanji_md.h).
+    # Now the metadata only needs to convey the Unicode value, the frequency
+    # rank, and meaning.  The actual font bitmaps are obtained from
+    # KanaKanjiFontSmall, using the utf8 Unicode value as the character selector.
     # Data Type 1: Kanji metadata.
-    # typedef struct kanji_md {
-    #     const uint16_t unicode;    // Kanji unicode
-    #     const uint16_t rank;       // Kanji frequency rank
-    #     const char* const meaning; // Meanings for the Kanji
-    # };
-    # Print the structure definition.
-    print("#ifndef KANJI_METADATA_TYPE", file=f)
-    print("#define KANJI_METADATA_TYPE", file=f)
-    print("typedef struct kanji_md {", file=f)
-    print("  const uint16_t unicode;", file=f)
-    print("  const uint16_t rank;", file=f)
-    print("  const char* const meaning;", file=f)
-    print("} kanji_md;", file=f)
-    print("#endif\n", file=f)
-
-    # Iterate on the elements of the structure data array.
-    # [ucs_name, row['N5K_Rank']]
-    open_curl = "{"
-    close_curl = "}"
-    for item in struct_data:
-        ucs = item[0]
-        rank = item[1]
-        print(f"const kanji_md kanji_md{ucs} = ", end='', file=f)
-        print(f"{open_curl}0x{ucs}, {rank}, ", end='', file=f)
-        print(f"kanji_ms{ucs}{close_curl};", file=f)
-
-f.close()
-
-print("Building onyomi-to-kanji cross refrence")
-df2 = pd.DataFrame(columns = ['Onyomi', 'affixList', 'freqList', 'UCSList'])
-
-print("Building kunyomi-to-kanji cross refrence")
-df3 = pd.DataFrame(columns = ['Kunyomi', 'okuriList', 'affixList', 'freqList', 'UCSList'])
-
-print("Building nanori-to-kanji cross refrence")
-df4 = pd.DataFrame(columns = ['Nanori', 'okuriList', 'freqList', 'UCSList'])
-
-# Process each row of DataFrame 1 
-for df1_ndx, row in df1Subset.iterrows():
-    # Iterate on each onyomi for this row.
-    for onyomi in row['OnReadings']:
-        # Detect presence of leading hyphen - yes, there are a few present in onyomi.
-        # Remember the presence of the suffix before the strip.
-        if onyomi.startswith('-'):
-            affix = 'suffix'
-        else:
-            affix = 'none'
-
-        # Parse out hyphens - yes, there are a few present in onyomi.
-        onyomi = onyomi.strip('-')
-
-        # Attempt to find the onyomi in DataFrame 2.
-        ndxList = df2.index[df2['Onyomi'] == onyomi].tolist()
-        if len(ndxList) != 0:
-            # The onyomi is present and there should be only one instance.
-            ndx = ndxList[0]
-            # Add the suffix flag to list for the onyomi.
-            df2.iloc[ndx]['affixList'].append(affix)
-            # Add frequency ranking value to list for the onyomi.
-            df2.iloc[ndx]['freqList'].append(row['N5K_Rank'])
-            # Add unicode value to list for the onyomi.
-            df2.iloc[ndx]['UCSList'].append(row['UCS'])
-        else:
-            # The onyomi is not present in DataFrame 2, so add it, as well
-            # as the frequency ranking and unicode values.
-            new_row = pd.DataFrame([[onyomi, [affix], [row['N5K_Rank']], [row['UCS']]]],
-                                   columns=['Onyomi', 'affixList','freqList', 'UCSList'])
-            # Add the new row into DataFrame 2.
-            df2 = pd.concat([df2, new_row], ignore_index=True)
-            
-    # Iterate on each kunyomi for this row.
-    for kunyomi in row['KunReadings']:
-        # Parse out hyphens and okurigana.
-        # CHECK THIS FOR CORRECTNESS!!!!
-        if kunyomi.startswith('-'):
-            affix = 'suffix'
-        elif kunyomi.endswith('-'):
-            affix = 'prefix'
+    # const kanji_md kanji_md<UCS> = {0x<UCS>, <rank>, kanji_ms<UCS>};
+    # With a string pool, the meaning is the address of the string in the pool.
+    out = HeaderBuffer()
+    out.write(KANJI_MD_TYPE)
+    for ucs, rank, meaning in zip(df1Sort['UCS'], df1Sort['N5K_Rank'], df1Sort['Meanings']):
+        if sharedStrings is None:
+            meaningRef = f"kanji_ms{ucs.upper()}"
         else:
-            affix = 'none'
-        
-        kunyomi = kunyomi.strip('-')
-        kunyomi = kunyomi.split('.')
-        if len(kunyomi) == 1:
-            okurigana = ''
-        elif len(kunyomi) == 2:
-            okurigana = kunyomi[1]
-        else:
-            print('Too many dots!')
-
-        kunyomi = kunyomi[0]
-        # Attempt to find the kunyomi in DataFrame 3.
-        ndxList = df3.index[df3['Kunyomi'] == kunyomi].tolist()
-        if len(ndxList) != 0:
-            # The kunyomi is present and there should be only one instance.
-            ndx = ndxList[0]
-            # Determine whether unicode is already in the list.
-            if row['UCS'] not in df3.iloc[ndx]['UCSList']:
-                # Add okurigana value as a list to list for the kunyomi.
-                df3.iloc[ndx]['okuriList'].append(okurigana)
-                # Add the affix flag as a list to list for the kunyomi.
-                df3.iloc[ndx]['affixList'].append(affix)
-                # Add frequency ranking value to list for the kunyomi.
-                df3.iloc[ndx]['freqList'].append(row['N5K_Rank'])
-                # Add unicode value to list for the kunyomi.
-                df3.iloc[ndx]['UCSList'].append(row['UCS'])
+            meaningRef = sharedStrings.ref(meaning_value(meaning, meaningCodec))
+        out.emit(KANJI_MD, ucs=ucs.upper(), rank=rank, meaning=meaningRef)
+    return out.save(outPath)
+
+
+def build_reading_cross_references(df1Subset):
+    # Stage: build the onyomi, kunyomi, and nanori to Kanji cross references.
+    # Returns the posting lists of each (df2Sort, df3Sort, df4Sort), sorted by
+    # reading, with the Kanji of each reading sorted by frequency rank.
+    # Each reading of a Kanji is gathered as a row of plain columns, which
+    # PostingLists groups by reading in typed arrays.
+    print("Building onyomi-to-kanji cross refrence")
+    df2Rows = RowAccumulator(['Onyomi', 'affix', 'freq', 'UCS'])
+
+    print("Building kunyomi-to-kanji cross refrence")
+    df3Rows = RowAccumulator(['Kunyomi', 'okurigana', 'affix', 'freq', 'UCS'])
+
+    print("Building nanori-to-kanji cross refrence")
+    df4Rows = RowAccumulator(['Nanori', 'okurigana', 'freq', 'UCS'])
+
+    # Process each row of DataFrame 1 
+    for df1_ndx, row in df1Subset.iterrows():
+        ucs = int(row['UCS'], 16)
+        # Iterate on each onyomi for this row.
+        for onyomi in row['OnReadings']:
+            # Detect presence of leading hyphen - yes, there are a few present in onyomi.
+            # Remember the presence of the suffix before the strip.
+            if onyomi.startswith('-'):
+                affix = 'suffix'
             else:
-                # The unicode is already there for this kunyomi, so...
-                #print('Duplicate kunyomi for the same kanji character')
-                #print('Make a sublist of okurigana for that kunyomi')
-                # Find index of the unicode that is already in the list.
-                uNdx = df3.iloc[ndx]['UCSList'].index(row['UCS'])
-                # Append the new okurigana to the indexed list in the okurigana list.
-                oList = df3.iloc[ndx]['okuriList'][uNdx]
-                if type(oList) is not list:
-                    df3.iloc[ndx]['okuriList'][uNdx] = [oList, okurigana]
-                else:
-                    oList.append(okurigana)
-                    df3.iloc[ndx]['okuriList'][uNdx] = oList
-
-                # Append the new affix to the indexed list in the affix list.
-                aList = df3.iloc[ndx]['affixList'][uNdx]
-                if type(aList) is not list:
-                    df3.iloc[ndx]['affixList'][uNdx] = [aList, affix]
-                else:
-                    aList.append(affix)
-                    df3.iloc[ndx]['affixList'][uNdx] = aList
-
-        else:
-            # The onyomi is not present in DataFrame 3, so add it, as well
-            # as the okurigana, frequency ranking, and unicode values.
-            new_row = pd.DataFrame([[kunyomi, [okurigana], [affix], [row['N5K_Rank']], [row['UCS']]]],
-                                   columns=['Kunyomi', 'okuriList', 'affixList', 'freqList', 'UCSList'])
-            # Add the new row into DataFrame 3.
-            df3 = pd.concat([df3, new_row], ignore_index=True)
-
-    # Iterate on each nanori for this row.
-    for nanori in row['Nanori']:
-        # Attempt to find the nanori in DataFrame 4.
-
-        nanori = nanori.split('.')
-        if len(nanori) == 1:
-            okurigana = ''
-        elif len(nanori) == 2:
-            okurigana = nanori[1]
-        else:
-            print('Too many dots!')
-
-        nanori = nanori[0]
-        ndxList = df4.index[df4['Nanori'] == nanori].tolist()
-        if len(ndxList) != 0:
-            # The nanori is present and there should be only one instance.
-            ndx = ndxList[0]
-            # Add okurigana value to list for the kunyomi.
-            df4.iloc[ndx]['okuriList'].append(okurigana)
-            # Add frequency ranking value to list for the nanori.
-            df4.iloc[ndx]['freqList'].append(row['N5K_Rank'])
-            # Add unicode value to list for the nanori.
-            df4.iloc[ndx]['UCSList'].append(row['UCS'])
-        else:
-            # The nanori is not present in DataFrame 4, so add it, as well
-            # as the frequency ranking and unicode values.
-            new_row = pd.DataFrame([[nanori, [okurigana], [row['N5K_Rank']], [row['UCS']]]],
-                                   columns=['Nanori', 'okuriList', 'freqList', 'UCSList'])
-            # Add the new row into DataFrame 4.
-            df4 = pd.concat([df4, new_row], ignore_index=True)
-
-# Sort frequency and unicode lists of DataFrame 2 with frequency list acting as key.
-for df2_ndx, row in df2.iterrows():
-    list1, list2, list3 = (list(t) for t in zip(*sorted(zip(row['freqList'], row['affixList'], row['UCSList']))))
-    df2.iloc[df2_ndx]['freqList'] = list1
-    df2.iloc[df2_ndx]['affixList'] = list2
-    df2.iloc[df2_ndx]['UCSList'] = list3
-
-# Sort DataFrame 2 so that onyomi are in acending alphabetical order.
-df2Sort = df2.sort_values('Onyomi', ignore_index=True)
-
-# Sort frequency, okurigana, and unicode lists of DataFrame 3 with frequency list acting as key.
-for df3_ndx, row in df3.iterrows():
-    #list1, list2, list3, list4 = (list(t) for t in zip(*sorted(zip(row['freqList'], row['okuriList'], row['affixList'], row['UCSList']))))
-    pickList = sorted(range(len(row['freqList'])), key=lambda k: row['freqList'][k])
-    list1 = []
-    list2 = []
-    list3 = []
-    list4 = []
-    for ndx in pickList:
-        list1.append(row['freqList'][ndx])
-        list2.append(row['okuriList'][ndx])
-        list3.append(row['affixList'][ndx])
-        list4.append(row['UCSList'][ndx])
-
-    df3.iloc[df3_ndx]['freqList'] = list1
-    df3.iloc[df3_ndx]['okuriList'] = list2
-    df3.iloc[df3_ndx]['affixList'] = list3
-    df3.iloc[df3_ndx]['UCSList'] = list4
-
-# Sort DataFrame 3 so that kunyomi are in acending alphabetical order.
-df3Sort = df3.sort_values('Kunyomi', ignore_index=True)
-
-# Sort frequency and unicode lists of DataFrame 4 with frequency list acting as key.
-for df4_ndx, row in df4.iterrows():
-    list1, list2, list3 = (list(t) for t in zip(*sorted(zip(row['freqList'], row['okuriList'], row['UCSList']))))
-    df4.iloc[df4_ndx]['freqList'] = list1
-    df4.iloc[df4_ndx]['okuriList'] = list2
-    df4.iloc[df4_ndx]['UCSList'] = list3
-    #print(f"Row {df4_ndx} {df4.iloc[df4_ndx]['Nanori']} {df4.iloc[df4_ndx]['freqList']} {df4.iloc[df4_ndx]['UCSList']}")
-
-# Sort DataFrame 4 so that nanori are in acending alphabetical order.
-df4Sort = df4.sort_values('Nanori', ignore_index=True)
-
-# Load Kana character to hex map as an associative array.  The Kana (column 0)
-# is treated as the index and there is no header.
-kanaMap = pd.read_csv('./kana_list.csv', index_col=0, header=None)
-# Convert the DataFrame into a Series.
-kanaMap = kanaMap.squeeze()
-
-# START OF ONYOMI OUTPUT PROCESSING
-# Add column to hold integer value that is the decimal representation of the
-# concatenated lower bytes of the Katakana characters of the Onyomi string.
-# After all rows are processed, none should contain the default value.
-df2Sort['kanaBytes'] = ""
-df2Sort['KanaInt'] = 0
-
-# Enumeration for describing enhancements to onyomi, kunyomi, and
-# nanori readings, and jukujikun.
-# enum affix_enum {
-#   none,   // No enhancments to reading (e.g., xyz).
-#   prefix, // Reading is a prefix (e.g., wxyz-).
-#   suffix, // Reading is a suffix (e.g., -wxyz).
-#   jword,  // Japanese word string with jukujikun or irregular reading.
-#   meaning // English meaning string for Japanese word enumerated above.
-# };
-
-# Data Type 2: Structure typedef of metadata for Okurigana (and other readings)
-# typedef struct okuri_md {
-#   const uint8_t len;      // Number of enumerations/character arrays.
-#   const affix_enum *alist; // Pointer ot array of enumerations, one for each character array.
-#   const char **clist;      // Pointer to array of character arrays, for for each enumeration.
-# } okuri_md;
-
-# Data Type 3: Structure typedef of metadata for Reading
-# typedef struct reading_md {
-#   const uint16_t len;             // Number of Okurigana and Kanji structures.
-#   const okuri_md * const * olist; // Pointer to array of okurigana metadata structures.
-#   const kanji_md * const * klist; // Pointer to array of kanji metadata structures.
-# } reading_md;
-# Data structure 3:  Array of Kanji metadata structures referenced by a
-# specific onyomi, kunyomi, or nanori.  The order of the Kanji metadata
-# structures in the list is the ascending order of Kanji frequency rank
-# The value of XXXX is the numeric represenation of the kana for the
-# onyomi, kunyomi, or nanori.
-# const kanji_md const kmXXXX[] = {&kanji_md<UCS1>, &kanji_md<UCS2>, ... &kanji_md<UCSn>};
-open_curl = "{"
-close_curl = "}"
-with open("onyomi.h", "w") as f:
-    # The Onyomi data does not contain any okurigana, but there are Onyomi some that are
-    # suffixes. This requires creating and initializing okurigana metadata structure arrays.
-    print("/* onyomi.h */\n", file=f)
-    print("#ifndef AFFIX_ENUM", file=f)
-    print("#define AFFIX_ENUM", file=f)
-    print("enum affix_enum {", file=f)
-    print("  none,   // No enhancments to reading (e.g., xyz).", file=f)
-    print("  prefix, // Reading is a prefix (e.g., wxyz-).", file=f)
-    print("  suffix, // Reading is a suffix (e.g., -wxyz).", file=f)
-    print("  jword,  // Japanese word string with jukujikun or irregular reading.", file=f)
-    print("  meaning // English meaning string for Japanese word enumerated above.", file=f)
-    print("};", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef OKURI_METADATA_TYPE", file=f)
-    print("#define OKURI_METADATA_TYPE", file=f)
-    print("typedef struct okuri_md {", file=f)
-    print("  const uint8_t len;", file=f)
-    print("  const affix_enum * const alist;", file=f)
-    print("  const char **clist;", file=f)
-    print("} okuri_md;", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef READING_METADATA_TYPE", file=f)
-    print("#define READING_METADATA_TYPE", file=f)
-    print("typedef struct reading_md {", file=f)
-    print("  const uint16_t len;", file=f)
-    print("  const okuri_md * const * olist;", file=f)
-    print("  const kanji_md * const * klist;", file=f)
-    print("} reading_md;", file=f)
-    print("#endif", file=f)
-
-    # Iterate on each onyomi to create an array of kanji metadata for each onyomi.
-    for df2_ndx, row in df2Sort.iterrows():
-        # Convert syllables of Kana into a number string for naming and
-        # referencing of structure array.
-        kanaBytes = ""
-        for kana in row['Onyomi']:
-            kanaBytes = kanaBytes + kanaMap[kana]
-
-        # Convert to a byte string.
-        kanaBytesStr = bytes.fromhex(kanaBytes)
-        # Generate 32-bit hash
-        kanaInt = mmh3.hash(kanaBytesStr, signed=False)
-        kanaBytes = hex(kanaInt)
-        # Fill KanaBytes and KanaInt columns for the row.
-        df2Sort.at[df2_ndx, 'KanaBytes'] = kanaBytes
-        df2Sort.at[df2_ndx, 'KanaInt'] = kanaInt
-
-        # For onyomi, there is only affix information. Either 'none' or 'suffix'.
-        # There is always only one affix value for each onyomi reading, further
-        # simplifying the generation script.
-        allNoneList = all(ele == 'none' for ele in row['affixList'])
-        if not allNoneList:
-            sndx = 0
-            for affix in row['affixList']:
-                print(f"const affix_enum on_affix{kanaBytes}_{sndx:02d}[] = ", end='', file=f)
-                print(f"{open_curl}{affix}{close_curl};", file=f)
-                
-                print(f"const okuri_md on_okuri_md{kanaBytes}_{sndx:02d} = ", end='', file=f)
-                print(f"{open_curl}1, on_affix{kanaBytes}_{sndx:02}, NULL{close_curl};", file=f)
-
-                sndx += 1
-            
-            print(f"const okuri_md * on_okuri{kanaBytes}[] = ", end='', file=f)
-            delimit = '{'
-            for ndx in range(sndx):
-               print(f"{delimit}&on_okuri_md{kanaBytes}_{ndx:02}", end='', file=f)
-               delimit = ', '
-
-            print('};', file=f)
-
-        delimit = '{'
-        print(f"const kanji_md * const on_kanji{kanaBytes}[] = ", end='', file=f)
-        for ucs in row['UCSList']:
-            ucs_name = str.upper(ucs)
-            print(f"{delimit}&kanji_md{ucs_name}", end='', file=f)
-            delimit = ', '
-
-        print('};', file=f)
-        print(f"const reading_md onyomi_md{kanaBytes} = ", end='', file=f)
-        if allNoneList:
-            print(f"{open_curl}{len(row['UCSList'])}, NULL, on_kanji{kanaBytes}{close_curl};", file=f)
-        else:
-            print(f"{open_curl}{len(row['UCSList'])}, on_okuri{kanaBytes}, on_kanji{kanaBytes}{close_curl};", file=f)
-    
-    # Data type 3: Node for balanced binary tree.
-    # typedef struct bbt_node {
-    #   const uint32_t key;
-    #   const reading_md* rmd;
-    #   const bbt_node * const lnode;
-    #   const bbt_node * const rnode;
-    # };
-    print("\n#ifndef BBT_NODE_TYPE", file=f)
-    print("#define BBT_NODE_TYPE", file=f)
-    print("typedef struct bbt_node {", file=f)
-    print("  const uint32_t key;", file=f)
-    print("  const reading_md* rmd;", file=f)
-    print("  const bbt_node * const lnode;", file=f)
-    print("  const bbt_node * const rnode;", file=f)
-    print("} bbt_node;", file=f)
-    print("#endif", file=f)
-
-    # Pull out the KanaBytes and KanaInt colums from the sorted
-    # onyomi DataFrame (df2Sort).
-    df2Sub = df2Sort[['KanaBytes', 'KanaInt']]
-    # Sort according to KanaInt.
-    df2SubSort = df2Sub.sort_values('KanaInt', ignore_index=True)
-    # Form a list from the sorted KanaBytes column.
-    onyomiList = df2SubSort['KanaBytes'].tolist()
-    # Generate the node data structures for the Balanced Binary Structure Tree.
-    root_node = print_balanced_bst(onyomiList, "onyomi", f)
-    # Generate a pointer to the root node.
-    print(f"const bbt_node *onyomi_root_node = &onyomi_node{root_node};", file=f)
-
-f.close()
-
-# START OF KUNYOMI OUTPUT PROCESSING
-# Add column to hold integer value that is the decimal representation of the
-# concatenated lower bytes of the Katakana characters of the Onyomi string.
-# After all rows are processed, none should contain the default value.
-df3Sort['kanaBytes'] = ""
-df3Sort['KanaInt'] = 0
-
-# Enumeration for describing enhancements to onyomi, kunyomi, and
-# nanori readings, and jukujikun.
-# enum affix_enum {
-#   none,   // No enhancments to reading (e.g., xyz).
-#   prefix, // Reading is a prefix (e.g., wxyz-).
-#   suffix, // Reading is a suffix (e.g., -wxyz).
-#   jword,  // Japanese word string with jukujikun or irregular reading.
-#   meaning // English meaning string for Japanese word enumerated above.
-# };
-
-# Data Type 2: Structure typedef of metadata for Okurigana (and other readings)
-# typedef struct okuri_md {
-#   const uint8_t len;      // Number of enumerations/character arrays.
-#   const affix_enum *alist; // Pointer ot array of enumerations, one for each character array.
-#   const char **clist;      // Pointer to array of character arrays, for for each enumeration.
-# } okuri_md;
-
-# Data Type 3: Structure typedef of metadata for Reading
-# typedef struct reading_md {
-#   const uint16_t len;             // Number of Okurigana and Kanji structures.
-#   const okuri_md * const * olist; // Pointer to array of okurigana metadata structures.
-#   const kanji_md * const * klist; // Pointer to array of kanji metadata structures.
-# } reading_md;
-# Data structure 3:  Array of Kanji metadata structures referenced by a
-# specific onyomi, kunyomi, or nanori.  The order of the Kanji metadata
-# structures in the list is the ascending order of Kanji frequency rank
-# The value of XXXX is the numeric represenation of the kana for the
-# onyomi, kunyomi, or nanori.
-# const kanji_md const kmXXXX[] = {&kanji_md<UCS1>, &kanji_md<UCS2>, ... &kanji_md<UCSn>};
-open_curl = "{"
-close_curl = "}"
-with open("kunyomi.h", "w") as f:
-    print("/* kunyomi.h */\n", file=f)
-    print("#ifndef AFFIX_ENUM", file=f)
-    print("#define AFFIX_ENUM", file=f)
-    print("enum affix_enum {", file=f)
-    print("  none,   // No enhancments to reading (e.g., xyz).", file=f)
-    print("  prefix, // Reading is a prefix (e.g., wxyz-).", file=f)
-    print("  suffix, // Reading is a suffix (e.g., -wxyz).", file=f)
-    print("  jword,  // Japanese word string with jukujikun or irregular reading.", file=f)
-    print("  meaning // English meaning string for Japanese word enumerated above.", file=f)
-    print("};", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef OKURI_METADATA_TYPE", file=f)
-    print("#define OKURI_METADATA_TYPE", file=f)
-    print("typedef struct okuri_md {", file=f)
-    print("  const uint8_t len;", file=f)
-    print("  const affix_enum * const alist;", file=f)
-    print("  const char **clist;", file=f)
-    print("} okuri_md;", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef READING_METADATA_TYPE", file=f)
-    print("#define READING_METADATA_TYPE", file=f)
-    print("typedef struct reading_md {", file=f)
-    print("  const uint16_t len;", file=f)
-    print("  const okuri_md * const * olist;", file=f)
-    print("  const kanji_md * const * klist;", file=f)
-    print("} reading_md;", file=f)
-    print("#endif", file=f)
-
-    # Iterate on each kunyomi to create an array of kanji metadata for each kunyomi.
-    for df3_ndx, row in df3Sort.iterrows():
-        # Convert syllables of Kana into a number string for naming and
-        # referencing of structure array.
-        kanaBytes = ""
-        for kana in row['Kunyomi']:
-            kanaBytes = kanaBytes + kanaMap[kana]
-
-        # Convert to a byte string.
-        kanaBytesStr = bytes.fromhex(kanaBytes)
-        # Generate 32-bit hash
-        kanaInt = mmh3.hash(kanaBytesStr, signed=False)
-        kanaBytes = hex(kanaInt)
-        # Fill KanaBytes and KanaInt columns for the row.
-        df3Sort.at[df3_ndx, 'KanaBytes'] = kanaBytes
-        df3Sort.at[df3_ndx, 'KanaInt'] = kanaInt
-
-        # Determine whether all affix values are 'none'.  Assume true.
-        allNoneList = True
-        for ele in row['affixList']:
-            if type(ele) == list:
-                allNoneList = all(subEle == 'none' for subEle in ele)
+                affix = 'none'
+
+            # Parse out hyphens - yes, there are a few present in onyomi.
+            onyomi = onyomi.strip('-')
+
+            # Add the suffix flag, frequency ranking, and unicode value for the onyomi.
+            df2Rows.append(onyomi, affix, row['N5K_Rank'], ucs)
+
+        # Iterate on each kunyomi for this row.
+        for kunyomi in row['KunReadings']:
+            # Parse out hyphens and okurigana.
+            # CHECK THIS FOR CORRECTNESS!!!!
+            if kunyomi.startswith('-'):
+                affix = 'suffix'
+            elif kunyomi.endswith('-'):
+                affix = 'prefix'
             else:
-                if ele != 'none':
-                    allNoneList = False
-            # At this point, a false result will exit the loop.
-            if allNoneList == False:
-                break
-
-        # Determine whether all okurigana values are empty strings.  Assume true.
-        allEmptyList = True
-        for ele in row['okuriList']:
-            if type(ele) == list:
-                allEmptyList = all(subEle == '' for subEle in ele)
+                affix = 'none'
+
+            kunyomi = kunyomi.strip('-')
+            kunyomi = kunyomi.split('.')
+            if len(kunyomi) == 1:
+                okurigana = ''
+            elif len(kunyomi) == 2:
+                okurigana = kunyomi[1]
             else:
-                if ele != '':
-                    allEmptyList = False
-            # At this point, a false result will exit the loop.
-            if allEmptyList == False:
-                break
-
-        if allNoneList == False or allEmptyList == False:
-            # Iterate on each element of affixList / okuriList for each kanji.
-            sndx = 0
-            for ndx in range(len(row['UCSList'])):
-                print(f"const affix_enum kun_affix{kanaBytes}_{sndx:02d}[] = ", end='', file=f)
-                ele = row['affixList'][ndx]
-                if type(ele) == list:
-                    arrSize = len(ele)
-                    # Create a array of two or more affix enumeration values for a given kanji.
-                    delimit = '{'
-                    for affix in ele:
-                        print(f"{delimit}{affix}", end='', file=f)
-                        delimit = ', '
-
-                    print('};', file=f)
-                else:
-                    arrSize = 1
-                    # Create array containing a single affix enumeration for a given kanji.
-                    print(f"{open_curl}{ele}{close_curl};", file=f)
-
-                print(f"const char *kun_olist{kanaBytes}_{sndx:02d}[] = ", end='', file=f)
-                ele = row['okuriList'][ndx]
-                if type(ele) == list:
-                    # Create array of two or more okurigana strings for a given kanji.
-                    delimit = '{'
-                    for okuri in ele:
-                        print(f"{delimit}\"", end='', file=f)
-                        # Create array of UTF-8 char strings for the okurigana.
-                        odd = True
-                        for nybble in [*okuri.encode('utf8').hex()]:
-                            if odd:
-                                print(f"\\x{nybble}", end='', file=f)
-                            else:
-                                print(f"{nybble}", end='', file=f)
-
-                            odd ^= True
-
-                        print("\"", end='', file=f)
-                        delimit = ', '
-
-                    print('};', file=f)
-                else:
-                    # Create a UTF-8 char strings for the okurigana.
-                    print("{\"", end='', file=f)
-                    odd = True
-                    for nybble in [*ele.encode('utf8').hex()]:
-                        if odd:
-                            print(f"\\x{nybble}", end='', file=f)
-                        else:
-                            print(f"{nybble}", end='', file=f)
-
-                        odd ^= True
-
-                    print("\"};", file=f)
-
-                print(f"const okuri_md kun_okuri_md{kanaBytes}_{sndx:02d} = ", end='', file=f)
-                print(f"{open_curl}{arrSize}, kun_affix{kanaBytes}_{sndx:02d}, kun_olist{kanaBytes}_{sndx:02d}{close_curl};", file=f)
-                sndx += 1
-            
-            # Now generate array of okurigana structures of same length as kanji.
-            print(f"const okuri_md * const kun_okuri{kanaBytes}[] = ", end='', file=f)
-            delimit = '{'
-            for ndx in range(sndx):
-                print(f"{delimit}&kun_okuri_md{kanaBytes}_{ndx:02d}", end='', file=f)
-                delimit = ", "
-
-            print("};", file=f)
-
-        # Generate the Kanji data structure for this reading.
-        delimit = '{'
-        print(f"const kanji_md * const kun_kanji{kanaBytes}[] = ", end='', file=f)
-        for ucs in row['UCSList']:
-            ucs_name = str.upper(ucs)
-            print(f"{delimit}&kanji_md{ucs_name}", end='', file=f)
-            delimit = ', '
-
-        print('};', file=f)
-        print(f"const reading_md kunyomi_md{kanaBytes} = ", end='', file=f)
-
-        print(f"{open_curl}{len(row['UCSList'])},", end='', file=f)
-        if allNoneList and allEmptyList:
-            print(f" NULL,", end='', file=f)
-        else:
-            print(f" kun_okuri{kanaBytes},", end='', file=f)
-    
-        print(f" kun_kanji{kanaBytes}{close_curl};", file=f)
-
-    # Data type 3: Node for balanced binary tree.
-    # typedef struct bbt_node {
-    #   const uint32_t key;
-    #   const reading_md* rmd;
-    #   const bbt_node * const lnode;
-    #   const bbt_node * const rnode;
-    # };
-    print("\n#ifndef BBT_NODE_TYPE", file=f)
-    print("#define BBT_NODE_TYPE", file=f)
-    print("typedef struct bbt_node {", file=f)
-    print("  const uint32_t key;", file=f)
-    print("  const reading_md* rmd;", file=f)
-    print("  const bbt_node * const lnode;", file=f)
-    print("  const bbt_node * const rnode;", file=f)
-    print("} bbt_node;", file=f)
-    print("#endif", file=f)
-
-    # Pull out the KanaBytes and KanaInt colums from the sorted
-    # onyomi DataFrame (df2Sort).
-    df3Sub = df3Sort[['KanaBytes', 'KanaInt']]
-    # Sort according to KanaInt.
-    df3SubSort = df3Sub.sort_values('KanaInt', ignore_index=True)
-    # Form a list from the sorted KanaBytes column.
-    kunyomiList = df3SubSort['KanaBytes'].tolist()
-    # Generate the node data structures for the Balanced Binary Structure Tree.
-    root_node = print_balanced_bst(kunyomiList, "kunyomi", f)
-    # Generate a pointer to the root node.
-    print(f"const bbt_node *kunyomi_root_node = &kunyomi_node{root_node};", file=f)
-
-f.close()
-# END OF KUNYOMI OUTPUT PROCESSING
-
-# START OF NANORI OUTPUT PROCESSING
-# Add column to hold integer value that is the decimal representation of the
-# concatenated lower bytes of the Katakana characters of the Onyomi string.
-# After all rows are processed, none should contain the default value.
-df4Sort['kanaBytes'] = ""
-df4Sort['KanaInt'] = 0
-
-# Enumeration for describing enhancements to onyomi, kunyomi, and
-# nanori readings, and jukujikun.
-# enum affix_enum {
-#   none,   // No enhancments to reading (e.g., xyz).
-#   prefix, // Reading is a prefix (e.g., wxyz-).
-#   suffix, // Reading is a suffix (e.g., -wxyz).
-#   jword,  // Japanese word string with jukujikun or irregular reading.
-#   meaning // English meaning string for Japanese word enumerated above.
-# };
-
-# Data Type 2: Structure typedef of metadata for Okurigana (and other readings)
-# typedef struct okuri_md {
-#   const uint8_t len;      // Number of enumerations/character arrays.
-#   const affix_enum *alist; // Pointer ot array of enumerations, one for each character array.
-#   const char **clist;      // Pointer to array of character arrays, for for each enumeration.
-# } okuri_md;
-
-# Data Type 3: Structure typedef of metadata for Reading
-# typedef struct reading_md {
-#   const uint16_t len;             // Number of Okurigana and Kanji structures.
-#   const okuri_md * const * olist; // Pointer to array of okurigana metadata structures.
-#   const kanji_md * const * klist; // Pointer to array of kanji metadata structures.
-# } reading_md;
-# Data structure 3:  Array of Kanji metadata structures referenced by a
-# specific onyomi, kunyomi, or nanori.  The order of the Kanji metadata
-# structures in the list is the ascending order of Kanji frequency rank
-# The value of XXXX is the numeric represenation of the kana for the
-# onyomi, kunyomi, or nanori.
-# const kanji_md const kmXXXX[] = {&kanji_md<UCS1>, &kanji_md<UCS2>, ... &kanji_md<UCSn>};
-open_curl = "{"
-close_curl = "}"
-with open("nanori.h", "w") as f:
-    print("/* nanori.h */\n", file=f)
-    print("#ifndef AFFIX_ENUM", file=f)
-    print("#define AFFIX_ENUM", file=f)
-    print("enum affix_enum {", file=f)
-    print("  none,   // No enhancments to reading (e.g., xyz).", file=f)
-    print("  prefix, // Reading is a prefix (e.g., wxyz-).", file=f)
-    print("  suffix, // Reading is a suffix (e.g., -wxyz).", file=f)
-    print("  jword,  // Japanese word string with jukujikun or irregular reading.", file=f)
-    print("  meaning // English meaning string for Japanese word enumerated above.", file=f)
-    print("};", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef OKURI_METADATA_TYPE", file=f)
-    print("#define OKURI_METADATA_TYPE", file=f)
-    print("typedef struct okuri_md {", file=f)
-    print("  const uint8_t len;", file=f)
-    print("  const affix_enum * const alist;", file=f)
-    print("  const char **clist;", file=f)
-    print("} okuri_md;", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef READING_METADATA_TYPE", file=f)
-    print("#define READING_METADATA_TYPE", file=f)
-    print("typedef struct reading_md {", file=f)
-    print("  const uint16_t len;", file=f)
-    print("  const okuri_md * const * olist;", file=f)
-    print("  const kanji_md * const * klist;", file=f)
-    print("} reading_md;", file=f)
-    print("#endif", file=f)
-
-    # Iterate on each onyomi to create an array of kanji metadata for each nanori.
-    for df4_ndx, row in df4Sort.iterrows():
-        # Convert syllables of Kana into a number string for naming and
-        # referencing of structure array.
-        kanaBytes = ""
-        for kana in row['Nanori']:
-            kanaBytes = kanaBytes + kanaMap[kana]
-
-        # Convert to a byte string.
-        kanaBytesStr = bytes.fromhex(kanaBytes)
-        # Generate 32-bit hash
-        kanaInt = mmh3.hash(kanaBytesStr, signed=False)
-        kanaBytes = hex(kanaInt)
-        # Fill KanaBytes and KanaInt columns for the row.
-        df4Sort.at[df4_ndx, 'KanaBytes'] = kanaBytes
-        df4Sort.at[df4_ndx, 'KanaInt'] = kanaInt
-
-        # There are no affix values.
-        # Determine whether all okurigana values are empty strings.  Assume true.
-        allEmptyList = True
-        for ele in row['okuriList']:
-            if type(ele) == list:
-                allEmptyList = all(subEle == '' for subEle in ele)
+                print('Too many dots!')
+
+            kunyomi = kunyomi[0]
+            # Add the okurigana, affix flag, frequency ranking, and unicode value
+            # for the kunyomi.
+            df3Rows.append(kunyomi, okurigana, affix, row['N5K_Rank'], ucs)
+
+        # Iterate on each nanori for this row.
+        for nanori in row['Nanori']:
+            nanori = nanori.split('.')
+            if len(nanori) == 1:
+                okurigana = ''
+            elif len(nanori) == 2:
+                okurigana = nanori[1]
             else:
-                if ele != '':
-                    allEmptyList = False
-            # At this point, a false result will exit the loop.
-            if allEmptyList == False:
-                break
-
-        if allEmptyList == False:
-            # Iterate on each element of affixList / okuriList for each kanji.
-            sndx = 0
-            for ndx in range(len(row['UCSList'])):
-                print(f"const char *na_olist{kanaBytes}_{sndx:02d}[] = ", end='', file=f)
-                ele = row['okuriList'][ndx]
-                if type(ele) == list:
-                    # Create array of two or more okurigana strings for a given kanji.
-                    delimit = '{'
-                    for okuri in ele:
-                        print(f"{delimit}\"", end='', file=f)
-                        # Create array of UTF-8 char strings for the okurigana.
-                        odd = True
-                        for nybble in [*okuri.encode('utf8').hex()]:
-                            if odd:
-                                print(f"\\x{nybble}", end='', file=f)
-                            else:
-                                print(f"{nybble}", end='', file=f)
-
-                            odd ^= True
-
-                        print("\"", end='', file=f)
-                        delimit = ', '
-
-                    print('};', file=f)
-                else:
-                    # Create a UTF-8 char strings for the okurigana.
-                    print("{\"", end='', file=f)
-                    odd = True
-                    for nybble in [*ele.encode('utf8').hex()]:
-                        if odd:
-                            print(f"\\x{nybble}", end='', file=f)
-                        else:
-                            print(f"{nybble}", end='', file=f)
-
-                        odd ^= True
-
-                    print("\"};", file=f)
-
-                print(f"const okuri_md na_okuri_md{kanaBytes}_{sndx:02d} = ", end='', file=f)
-                print(f"{open_curl}{arrSize}, NULL, na_olist{kanaBytes}_{sndx:02d}{close_curl};", file=f)
-                sndx += 1
-            
-            # Now generate array of okurigana structures of same length as kanji
-            print(f"const okuri_md * const na_okuri{kanaBytes}[] = ", end='', file=f)
-            delimit = '{'
-            for ndx in range(sndx):
-                print(f"{delimit}&na_okuri_md{kanaBytes}_{ndx:02d}", end='', file=f)
-                delimit = ", "
-
-            print("};", file=f)
-
-        delimit = '{'
-        print(f"const kanji_md * const na_kanji{kanaBytes}[] = ", end='', file=f)
-        for ucs in row['UCSList']:
-            ucs_name = str.upper(ucs)
-            print(f"{delimit}&kanji_md{ucs_name}", end='', file=f)
-            delimit = ', '
-
-        print('};', file=f)
-        print(f"const reading_md nanori_md{kanaBytes} = ", end='', file=f)
-        if allEmptyList:
-            print(f"{open_curl}{len(row['UCSList'])}, NULL, na_kanji{kanaBytes}{close_curl};", file=f)
+                print('Too many dots!')
+
+            nanori = nanori[0]
+            # Add the okurigana, frequency ranking, and unicode value for the nanori.
+            df4Rows.append(nanori, okurigana, row['N5K_Rank'], ucs)
+
+    # Group the onyomi, ordering the Kanji of each by frequency.  The readings
+    # are in ascending alphabetical order.
+    df2Sort = PostingLists(df2Rows.column('Onyomi'), df2Rows.column('freq'), df2Rows.column('UCS'),
+                           affix=df2Rows.column('affix'))
+
+    # Group the kunyomi, ordering the Kanji of each by frequency.  A Kanji
+    # with more than one okurigana for the same kunyomi keeps them, and their
+    # affixes, as the sub-postings of a single posting.
+    df3Sort = PostingLists(df3Rows.column('Kunyomi'), df3Rows.column('freq'), df3Rows.column('UCS'),
+                           affix=df3Rows.column('affix'), okuri=df3Rows.column('okurigana'), mergeKanji=True)
+
+    # Group the nanori, ordering the Kanji of each by frequency.
+    df4Sort = PostingLists(df4Rows.column('Nanori'), df4Rows.column('freq'), df4Rows.column('UCS'),
+                           okuri=df4Rows.column('okurigana'))
+
+    print(f"Cross references: {sum(postings.nbytes() for postings in (df2Sort, df3Sort, df4Sort))} bytes "
+          f"of posting lists for {len(df2Sort)} onyomi, {len(df3Sort)} kunyomi, and {len(df4Sort)} nanori.")
+    return df2Sort, df3Sort, df4Sort
+
+
+def load_kana_map(kanaPath):
+    # Load Kana character to hex map as an associative array.  The Kana (column 0)
+    # is treated as the index and there is no header.
+    kanaMap = pd.read_csv(kanaPath, index_col=0, header=None)
+    # Convert the DataFrame into a Series.
+    kanaMap = kanaMap.squeeze()
+
+    return kanaMap
+
+
+def merge_word_sources(df1Subset, c10kPath, c5kPath, c6kPath, jukuPath, dropUnsupported):
+    # Stage: merge the Core 10K, Core 5K, Core 6K, and Jukujikun word lists
+    # into the part dictionary.  Words using Kanji outside of the subset are
+    # always reported, and dropped if dropUnsupported is True.
+    print("Building the dictionary, starting with the Core 10K List.")
+
+    # Set of supported Kanji, for checking the coverage of the word lists.
+    supportedKanji = set(df1Subset['Kanji'])
+
+    # Load in the Core 10K CSV file.
+    dfC10K = pd.read_csv(c10kPath, sep='\t')
+    print(f"There are {len(dfC10K.index)} readings in Core 10K.")
+
+    # Determine if each Kanji in each word is one of the 6100+ most common Kanji.
+    c10kReport = kanji_coverage_report('Core10K', dfC10K, 'Kanji', supportedKanji)
+    if dropUnsupported:
+        dfC10K = dfC10K.drop(c10kReport['Row'])
+
+    dfPart1 = dfC10K[['Reading', 'Kanji', 'Definition']].copy()
+    # Add the rank column with a default value of -1.
+    # Add the source column with a default value of 'Core10K'.
+    dfPart1['Rank'] = -1
+    dfPart1['Source'] = 'Core10K'
+
+    print(f"The part dictionary starts with {len(dfPart1.index)} readings.")
+
+    # Load in the modified Core 5K Frequency (Nayr) CSV file.
+    dfC5K = pd.read_csv(c5kPath, sep='\t')
+    print(f"There are {len(dfC5K.index)} readings in Core 5K.")
+
+    # Determine if each Kanji in each word is one of the 6100+ most common Kanji.
+    c5kReport = kanji_coverage_report('Core5K', dfC5K, 'Kanji', supportedKanji)
+    if dropUnsupported:
+        dfC5K = dfC5K.drop(c5kReport['Row'])
+
+    # Gather the rows of the part dictionary, starting with those of Core 10K.
+    dfPart1Rows = RowAccumulator.from_frame(dfPart1)
+    rankCol = dfPart1Rows.column('Rank')
+    # Index the Core 10K rows on reading and Kanji.
+    c10kIndex = word_key_index(dfC10K['Reading'], dfC10K['Kanji'])
+    for reading, kanji, definition, c5kRank in zip(dfC5K['Reading'], dfC5K['Kanji'], dfC5K['Definition'], dfC5K['#']):
+        # Find any Core 10K rows matching both the C5K reading and Kanji.
+        rndxList = c10kIndex.get((reading, kanji))
+        if rndxList is not None:
+            # Core 5K is ordered according to Frequency (highest first), so
+            # use index of row in Core 5K dataframe as rank (more or less).
+            # dfPart1 is a copy of Core 10K for any row matched.
+            for rndx in rndxList:
+                rankCol[rndx] = c5kRank
         else:
-            print(f"{open_curl}{len(row['UCSList'])}, na_okuri{kanaBytes}, na_kanji{kanaBytes}{close_curl};", file=f)
-    
-    # Data type 3: Node for balanced binary tree.
-    # typedef struct bbt_node {
-    #   const uint32_t key;
-    #   const onyomi_md* onmd;
-    #   const bbt_node * const lnode;
-    #   const bbt_node * const rnode;
-    # };
-    print("\n#ifndef BBT_NODE_TYPE", file=f)
-    print("#define BBT_NODE_TYPE", file=f)
-    print("typedef struct bbt_node {", file=f)
-    print("  const uint32_t key;", file=f)
-    print("  const reading_md* md;", file=f)
-    print("  const bbt_node * const lnode;", file=f)
-    print("  const bbt_node * const rnode;", file=f)
-    print("} bbt_node;", file=f)
-    print("#endif", file=f)
-
-    # Pull out the KanaBytes and KanaInt colums from the sorted
-    # onyomi DataFrame (df2Sort).
-    df4Sub = df4Sort[['KanaBytes', 'KanaInt']]
-    # Sort according to KanaInt.
-    df4SubSort = df4Sub.sort_values('KanaInt', ignore_index=True)
-    # Form a list from the sorted KanaBytes column.
-    nanoriList = df4SubSort['KanaBytes'].tolist()
-    # Generate the node data structures for the Balanced Binary Structure Tree.
-    root_node = print_balanced_bst(nanoriList, "nanori", f)
-    # Generate a pointer to the root node.
-    print(f"const bbt_node *nanori_root_node = &nanori_node{root_node};", file=f)
-
-f.close()
-
-# END OF NANORI OUTPUT PROCESSING
-
-print("Building the dictionary, starting with the Core 10K List.")
-
-# Load in the Core 10K CSV file.
-dfC10K = pd.read_csv('./Core10k.csv', sep='\t')
-print(f"There are {len(dfC10K.index)} readings in Core 10K.")
-
-dfPart1 = dfC10K[['Reading', 'Kanji', 'Definition']].copy()
-# Add the rank column with a default value of -1.
-# Add the source column with a default value of 'Core10K'.
-dfPart1['Rank'] = -1
-dfPart1['Source'] = 'Core10K'
-
-print(f"The part dictionary starts with {len(dfPart1.index)} readings.")
-
-# Load in the modified Core 5K Frequency (Nayr) CSV file.
-dfC5K = pd.read_csv('./Core5kFrequencyMod3.csv', sep='\t')
-print(f"There are {len(dfC5K.index)} readings in Core 5K.")
-
-# Iterate on each row.
-for dfC5K_ndx, row in dfC5K.iterrows():
-    # Determine if each Kanji in the Word is one of the 6100+ most common Kanji.
-    goodWord = True
-    for kanji in row['Kanji']:
-        # Skip non-kanji characters.
-        if kanji < '一':
-            continue
-        if len(df1Subset.loc[df1Subset['Kanji'] == kanji]) == 0:
-            print('Kanji not found')
-            goodWord = False
-
-for c5k_ndx, row in dfC5K.iterrows():
-    # Find any matching readings in the full set for the C5K reading.
-    rndxList = dfC10K.index[dfC10K['Reading'] == row['Reading']].tolist()
-    if len(rndxList) > 0:
-        # For matched readings, iterate on each one to search for Kanji.
-        unmatched = True
-        for rndx in rndxList:
-            # Check if the C5K Kanji entry matches any of them.
-            if dfC10K.iloc[rndx]['Kanji'] == row['Kanji']:
-                # Core 5K is ordered according to Frequency (highest first), so
-                # use index of row in Core 5K dataframe as rank (more or less).
-                # dfPart1 is a copy of Core 10K for any row matched.
-                dfPart1.at[rndx, 'Rank'] = row['#']
-                unmatched = False
-                #break
-    else:
-        unmatched = True
-        
-    if unmatched:
-        # Core 5K is ordered according to Frequency (highest first), so
-        # use index of row in Core 5K dataframe as rank (more or less).
-        new_row = pd.DataFrame([[row['Reading'], row['Kanji'], row['Definition'], row['#'], 'Core5K']],
-                                    columns=['Reading', 'Kanji', 'Definition', 'Rank', 'Source'])
-        dfPart1 = pd.concat([dfPart1, new_row], ignore_index=True)
-
-print(f"The part dictionary now has {len(dfPart1.index)} readings.")
-dfPart2 = dfPart1.copy()
-
-# Load in the modified Core 6K CSV file.
-dfC6K = pd.read_csv('./Core6kMod.csv', sep='\t')
-
-for dfC6K_ndx, row in dfC6K.iterrows():
-    # Determine if each Kanji in the Word is one of the 6100+ most common Kanji.
-    goodWord = True
-    for kanji in row['Kanji']:
-        # Skip non-kanji characters
-        if kanji < '一':
-            continue
-        if len(df1Subset.loc[df1Subset['Kanji'] == kanji]) == 0:
-            print('Kanji not found')
-            goodWord = False
-
-print(f"There are {len(dfC6K.index)} readings in Core 6K.")
-for c6k_ndx, row in dfC6K.iterrows():
-    # Find any matching readings in the full set for the C6K reading.
-    rndxList = dfPart1.index[dfPart1['Reading'] == row['Reading']].tolist()
-    if len(rndxList) > 0:
-        # For matched readings, iterate on each one to search for Kanji.
-        unmatched = True
-        for rndx in rndxList:
-            # Check if the C6K Kanji entry matches any of them.
-            if dfPart1.iloc[rndx]['Kanji'] == row['Kanji']:
-                unmatched = False
-                break
-    else:
-        unmatched = True
-        
-    if unmatched:
-        new_row = pd.DataFrame([[row['Reading'], row['Kanji'], row['Definition'], -1, 'Core6K']],
-                                    columns=['Reading', 'Kanji', 'Definition', 'Rank', 'Source'])
-        dfPart2 = pd.concat([dfPart2, new_row], ignore_index=True)
-
-print(f"The part dictionary now has {len(dfPart2.index)} readings.")
-dfPart3 = dfPart2.copy()
-
-# Load in the modified Jukujikun readings file.
-dfJuku = pd.read_csv('./jukujikun_mod.txt', sep='\t')
-
-for dfJuku_ndx, row in dfJuku.iterrows():
-    # Determine if each Kanji in the Word is one of the 6100+ most common Kanji.
-    goodWord = True
-    for kanji in row['Word']:
-        # Skip non-kanji characters
-        if kanji < '一':
-            continue
-        if len(df1Subset.loc[df1Subset['Kanji'] == kanji]) == 0:
-            print('Kanji not found')
-            goodWord = False
-
-print(f"There are {len(dfJuku.index)} formal and informal Jukujikun readings")
-# Iterate on the rows of the Jukujikun readings
-for juku_ndx, row in dfJuku.iterrows():
-    # For each Jukjikun reading entry, search for
-    # Find any matching readings in the full set for the Jukujikun reading.
-    rndxList = dfPart2.index[dfPart2['Reading'] == row['Reading']].tolist()
-    if len(rndxList) > 0:
-        # For matched readings, iterate on each one to search for Kanji.
-        unmatched = True
-        for rndx in rndxList:
-            # Check if the C6K Kanji entry matches any of them.
-            if dfPart2.iloc[rndx]['Kanji'] == row['Word']:
-                unmatched = False
-                break
-    else:
-        unmatched = True
-        
-    if unmatched:
-        new_row = pd.DataFrame([[row['Reading'], row['Word'], row['Meaning'], -1, 'Juku']],
-                                    columns=['Reading', 'Kanji', 'Definition', 'Rank', 'Source'])
-        dfPart3 = pd.concat([dfPart3, new_row], ignore_index=True)
-
-print(f"The part dictionary now has {len(dfPart3.index)} readings.")
-
-# Load the 44492 Japanese words frequency file
-df44492 = pd.read_csv('./44492-japanese-words-latin-lines-removed.txt', sep='\t')
-
-for ndxLemma, row in df44492.iterrows():
-    rndxList = dfPart3.index[dfPart3['Kanji'] == row['Lemma']].tolist()
-    if len(rndxList) == 1:
-        # Note that if rank has already been set to a positive number,
-        # it will be overwritten.
-        dfPart3.at[rndxList[0], 'Rank'] = ndxLemma + 1
-    elif len(rndxList) > 1:
-        #print(f"There are {len(rndxList)} rows in the Full dictionary with the same Kanji: {rndxList}")
-        for ndx in rndxList:
-            dfPart3.at[ndx, 'Rank'] = ndxLemma + 1
-
-# Determine which words did not get ranked.
-noRankList = dfPart3.index[dfPart3['Rank'] == -1].tolist()
-print(f"After applying ranking, there are {len(noRankList)} entries without ranking.")
-
-# Remove unranked words from the dictionary.
-dfDict1 = dfPart3.drop(noRankList)
-print(f"The initial dictionary has {len(dfDict1)} entries.")
-
-print("Removing dictionary entries where there only Kana in the 'Kanji'.")
-# Remove dictionary rows with 'Kanji' entries containing no Kanji.
-noKanjiList = []
-for dfDict1_ndx, row in dfDict1.iterrows():
-    # Iterate on each character in 'Kanji', removing any that are actually all Kana.
-    dropWord = True
-    for kanjiChar in row['Kanji']:
-        if kanjiChar >= '一':
-            dropWord = False
-            break
-
-    # If word has some Kanji, add it to the new list.
-    if dropWord == True:
-        noKanjiList.append(dfDict1_ndx)        
-        
-dfDict2 = dfDict1.drop(noKanjiList).sort_values('Rank', ignore_index=True)
-print(f"There are {len(dfDict2)} entries with Kanji")
+            # Core 5K is ordered according to Frequency (highest first), so
+            # use index of row in Core 5K dataframe as rank (more or less).
+            dfPart1Rows.append(reading, kanji, definition, c5kRank, 'Core5K')
+
+    dfPart1 = dfPart1Rows.to_frame()
+    print(f"The part dictionary now has {len(dfPart1.index)} readings.")
+    dfPart2Rows = RowAccumulator.from_frame(dfPart1)
+
+    # Load in the modified Core 6K CSV file.
+    dfC6K = pd.read_csv(c6kPath, sep='\t')
+
+    # Determine if each Kanji in each word is one of the 6100+ most common Kanji.
+    c6kReport = kanji_coverage_report('Core6K', dfC6K, 'Kanji', supportedKanji)
+    if dropUnsupported:
+        dfC6K = dfC6K.drop(c6kReport['Row'])
+
+    print(f"There are {len(dfC6K.index)} readings in Core 6K.")
+    # Index the part dictionary rows on reading and Kanji.
+    part1Index = word_key_index(dfPart1['Reading'], dfPart1['Kanji'])
+    for reading, kanji, definition in zip(dfC6K['Reading'], dfC6K['Kanji'], dfC6K['Definition']):
+        # Add the C6K entry only if no part dictionary row has both the same
+        # reading and Kanji.
+        if (reading, kanji) not in part1Index:
+            dfPart2Rows.append(reading, kanji, definition, -1, 'Core6K')
+
+    dfPart2 = dfPart2Rows.to_frame()
+    print(f"The part dictionary now has {len(dfPart2.index)} readings.")
+    dfPart3Rows = RowAccumulator.from_frame(dfPart2)
+
+    # Load in the modified Jukujikun readings file.
+    dfJuku = pd.read_csv(jukuPath, sep='\t')
+
+    # Determine if each Kanji in each word is one of the 6100+ most common Kanji.
+    jukuReport = kanji_coverage_report('Juku', dfJuku, 'Word', supportedKanji)
+    if dropUnsupported:
+        dfJuku = dfJuku.drop(jukuReport['Row'])
+
+    print(f"There are {len(dfJuku.index)} formal and informal Jukujikun readings")
+    # Index the part dictionary rows on reading and Kanji.
+    part2Index = word_key_index(dfPart2['Reading'], dfPart2['Kanji'])
+    # Iterate on the rows of the Jukujikun readings
+    for reading, word, meaning in zip(dfJuku['Reading'], dfJuku['Word'], dfJuku['Meaning']):
+        # Add the Jukujikun entry only if no part dictionary row has both the
+        # same reading and Kanji.
+        if (reading, word) not in part2Index:
+            dfPart3Rows.append(reading, word, meaning, -1, 'Juku')
+
+    dfPart3 = dfPart3Rows.to_frame()
+    print(f"The part dictionary now has {len(dfPart3.index)} readings.")
+
+    return dfPart3
+
+
+def rank_words(dfPart3, lemmaPath):
+    # Stage: rank the part dictionary words with the 44492 word frequency list,
+    # keeping only ranked words that contain Kanji, ordered by rank.
+    # Load the 44492 Japanese words frequency file
+    df44492 = pd.read_csv(lemmaPath, sep='\t')
+
+    # The rank of a lemma is its row number in the frequency file plus 1.  When a
+    # lemma appears more than once, the last row is used.  All rows in the part
+    # dictionary with the same Kanji as a lemma receive the lemma's rank.
+    lemmaRank = pd.Series(df44492.index + 1, index=df44492['Lemma'])
+    lemmaRank = lemmaRank[~lemmaRank.index.duplicated(keep='last')]
+    newRank = dfPart3['Kanji'].map(lemmaRank)
+    rankedMask = newRank.notna()
+    # Note that if rank has already been set to a positive number,
+    # it will be overwritten.
+    overwrittenMask = rankedMask & (dfPart3['Rank'] != -1)
+    dfPart3['Rank'] = newRank.fillna(dfPart3['Rank']).astype('int64')
+    print(f"Ranking matched {rankedMask.sum()} entries, overwriting the rank of {overwrittenMask.sum()} of them.")
+
+    # Determine which words did not get ranked.
+    noRankList = dfPart3.index[dfPart3['Rank'] == -1].tolist()
+    print(f"After applying ranking, there are {len(noRankList)} entries without ranking.")
+
+    # Remove unranked words from the dictionary.
+    dfDict1 = dfPart3.drop(noRankList)
+    print(f"The initial dictionary has {len(dfDict1)} entries.")
+
+    print("Removing dictionary entries where there only Kana in the 'Kanji'.")
+    # Remove dictionary rows with 'Kanji' entries containing no Kanji, that is,
+    # no character at or above U+4E00.
+    hasKanji = dfDict1['Kanji'].str.contains('[\u4e00-\U0010ffff]', regex=True, na=False)
+    dfDict2 = dfDict1[hasKanji].sort_values('Rank', ignore_index=True)
+    print(f"There are {len(dfDict2)} entries with Kanji")
+
+    return dfDict2
+
+
+def build_dictionary_readings(dfDict2, maxRank, verbose=True):
+    # Drop the words ranked beyond maxRank and gather the remaining words
+    # under their readings.  Returns the reading-sorted DataFrame 6.
+    dropList = dfDict2.index[dfDict2['Rank'] > maxRank].tolist()
+    dfDict3 = dfDict2.drop(dropList)
+    if verbose:
+        print(f"Dropping words with rank greater than {maxRank}.")
+        print(f"There are now {len(dfDict3)} readings for words containing Kanji.")
+        print("Note that there may be multiple entries with the same reading and even")
+        print("cases with the same reading and Kanji, that have different meanings.")
+    # Create a new, empty data frame to hold the restructured data.
+    # The idea is to have a reading with one or more Kanji.
+    # The rank of each word is kept for the Kanji reverse index.
+    df5Rows = ReadingIndex(['Reading', 'WordList', 'MeaningList', 'RankList'], uniqueName='WordList',
+                           merge=merge_meanings)
+
+    wordcount = 0
+    for row_ndx, row in dfDict3.iterrows():
+        # Attempt to find the dictionary reading in DataFrame 5.
+        # Add the Kanji word and meaning to the lists for the reading, adding
+        # the reading if it is not yet present.  A word already present for the
+        # reading has the meaning appended to its existing one.
+        if df5Rows.add(row['Reading'], row['Kanji'], row['Definition'], row['Rank']):
+            wordcount += 1
+
+    df5 = df5Rows.to_frame()
+    if verbose:
+        print(f"There are {len(df5)} unique readings for {wordcount} words.")
+    df6Sort = df5.sort_values('Reading', ignore_index=True)
+
+    return df6Sort
+
+
+def fit_max_rank_to_budget(dfDict2, flashBudget, indexMode='bst', meaningCodec=None):
+    # Find the largest maxRank for which the estimated flash footprint of
+    # dictionary.h is within flashBudget bytes.  The footprint can only grow
+    # as words are added, so the word ranks are binary searched, with each
+    # probe sizing the dictionary in memory rather than building the headers.
+    rankList = sorted(dfDict2['Rank'].unique().tolist())
+    print(f"Fitting maxRank to a dictionary.h flash budget of {flashBudget} bytes.")
+    lo = 0
+    hi = len(rankList) - 1
+    best = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        df6Sort = build_dictionary_readings(dfDict2, rankList[mid], verbose=False)
+        footprint = dictionary_footprint(df6Sort, indexMode=indexMode, meaningCodec=meaningCodec).total()
+        if footprint <= flashBudget:
+            print(f"  maxRank = {rankList[mid]}: {footprint} bytes for {len(df6Sort)} readings. STILL ROOM.")
+            best = mid
+            lo = mid + 1
+        else:
+            print(f"  maxRank = {rankList[mid]}: {footprint} bytes for {len(df6Sort)} readings. TOO BIG!")
+            hi = mid - 1
+
+    if best is None:
+        raise ValueError(f"No dictionary fits in a flash budget of {flashBudget} bytes.")
+
+    print(f"maxRank = {rankList[best]} is the largest that fits the flash budget.")
+    return rankList[best]
+
+
+def train_meaning_codebook(df1Sort, dfDict2):
+    # Stage: train the meaning codebook on the Kanji meanings and the word
+    # meanings of every ranked word.  The meanings of a word listed more than
+    # once for a reading are joined, so the word meanings are taken as
+    # build_dictionary_readings() joins them at the largest rank.  A smaller
+    # maxRank only joins fewer of them, so the codebook does not depend on
+    # maxRank, and MEANING_TEXT_SIZE holds the longest meaning at any maxRank.
+    dfAll = build_dictionary_readings(dfDict2, dfDict2['Rank'].max(), verbose=False)
+    meanings = list(df1Sort['Meanings']) + [meaning for meaningList in dfAll['MeaningList']
+                                            for meaning in meaningList]
+    meaningCodec = MeaningCodebook(meanings)
+    # Check that every meaning decodes to itself.
+    meaningCodec.verify(dict.fromkeys(meanings))
+    return meaningCodec
+
 
 # Now that the dictionary is ordered according to rank, drop a desired number of
 # word with rank greater than a specified value.
@@ -1226,202 +690,361 @@ print(f"There are {len(dfDict2)} entries with Kanji")
 # maxRank = 15293 # There are 6262 readings (5671 unique) for 6241 words. TOO BIG!
 #maxRank = 15292 # There are 6260 readings (5670 unique) for 6239 words. OK!
 #maxRank = 15295 # There are 6262 readings (5671 unique) for 6241 words. TOO BIG!
-maxRank = 15294 # There are 6261 readings (5671 unique) for 6240 words. OK!
-print(f"Dropping words with rank greater than {maxRank}.")
-dropList = dfDict2.index[dfDict2['Rank'] > maxRank].tolist()
-dfDict3 = dfDict2.drop(dropList)
-print(f"There are now {len(dfDict3)} readings for words containing Kanji.")
-print("Note that there may be multiple entries with the same reading and even")
-print("cases with the same reading and Kanji, that have different meanings.")
-# Create a new, empty data frame to hold the restructured data.
-# The idea is to have a reading with one or more Kanji.
-df5 = pd.DataFrame(columns = ['Reading', 'WordList', 'MeaningList'])
-
-wordcount = 0
-for row_ndx, row in dfDict3.iterrows():
-    # Attempt to find the dictionary reading in DataFrame 5.
-    ndxList = df5.index[df5['Reading'] == row['Reading']].tolist()
-    if len(ndxList) != 0:
-        # The rewading is present and there should be only one instance.
-        ndx = ndxList[0]
-        # Check to see whether the Kanji word is already present.
-        if row['Kanji'] not in df5.iloc[ndx]['WordList']:
-            # Add the Kanji value to the word list.
-            df5.iloc[ndx]['WordList'].append(row['Kanji'])
-            # Add meaning value to list for the dictionary.
-            df5.iloc[ndx]['MeaningList'].append(row['Definition'])
-            wordcount += 1
+DEFAULT_MAX_RANK = 15294 # There are 6261 readings (5671 unique) for 6240 words. OK!
+
+# The generated files, in the order they are written, named as their stages.
+OUTPUTS = ['kana_kanji_subset', 'kanji_ms', 'kanji_md', 'onyomi', 'kunyomi', 'nanori', 'dictionary', 'kanji_index',
+           'kana_trie']
+OUTPUT_FILES = dict(kana_kanji_subset='kana_kanji_subset.txt', kanji_ms='kanji_ms.h', kanji_md='kanji_md.h',
+                    onyomi='onyomi.h', kunyomi='kunyomi.h', nanori='nanori.h', dictionary='dictionary.h',
+                    kanji_index='kanji_index.h', kana_trie='kana_trie.h')
+
+class DictionaryBuild:
+    # A build of the dictionaries from the source files in inputDir, writing
+    # the generated files to outputDir.  Each stage is run, or loaded from the
+    # stage cache, when it is first needed, so a single table or header can be
+    # built without running the rest of the pipeline, e.g.
+    #   df1Sort = DictionaryBuild('./sources').kanji_table()
+    #   DictionaryBuild(outputDir='..').run(only=['dictionary'])
+    #
+    # Options:
+    #   maxRank - The largest word frequency rank kept in dictionary.h.
+    #   flashBudget - If not None, the number of flash bytes available for
+    #       dictionary.h, and the largest maxRank that fits is found from an
+    #       estimate of the dictionary's footprint on the RP2040 instead.  The
+    #       default maxRank corresponds to a budget of 476191 bytes.
+    #   readingIndex - The index of each reading set: a balanced BST ('bst'),
+    #       searched in O(log n) node visits, a minimal perfect hash ('mph'),
+    #       which finds a reading with a single probe of its key, or an
+    #       Eytzinger array ('eytzinger'), the keys of a complete BST in
+    #       breadth-first order, searched in O(log n) compares without child
+    #       pointers.  The indexes are verified when written, and kdict.cpp
+    #       selects its lookup from the headers.
+    #   meaningCodebook - If True, the English meanings are stored encoded by
+    #       a codebook of common byte sequences trained on all of the meanings,
+    #       which meaning_text() in kdict.cpp decodes for display.  Every
+    #       meaning is checked to decode to itself.
+    #   stringPoolMode - 'dedup' stores every string of the headers (Kanji
+    #       meanings, okurigana, dictionary words and meanings) once, in a
+    #       single pool written to kanji_ms.h, and 'suffix' also stores a string
+    #       that is the tail of a longer one within the longer one.  None keeps
+    #       a meaning array per Kanji and separate string literals in the
+    #       reading headers.
+    #   kanjiIndex - If True, kanji_index.h holds a reverse index from each
+    #       Kanji to its readings and to the dictionary words containing it,
+    #       found by get_kanji_entry() in kdict.cpp with one hash probe, and
+    #       verified against the tables when written (kana_kanji_reverse.py).
+    #       Otherwise kanji_index.h is written without the index.
+    #   kanaTrieTopK - If not None, kana_trie.h holds a prefix trie over the
+    #       readings of all four sets, with the kanaTrieTopK best Kanji and
+    #       words below each node, which kana_trie_step() in kdict.cpp walks one
+    #       typed Kana at a time (kana_kanji_trie.py).  It is verified when
+    #       written.  Otherwise kana_trie.h is written without the trie.
+    #   dropUnsupportedWords - Words using Kanji outside of the supported
+    #       subset are always reported.  If True, they are also dropped from
+    #       the word lists.
+    #   parallelEmit - The generated files are independent of each other.  If
+    #       True, each is written in its own worker process, which is passed
+    #       only the sorted table and Kana map it needs.  Each file is written in
+    #       full by one worker, so the output does not depend on the scheduling
+    #       of the workers.
+    #   useStageCache - If False, every stage is rebuilt, rather than loading
+    #       the result of an unchanged stage from the stage cache in cacheDir
+    #       (outputDir/stage_cache by default).
+    #   profileStages - 'time' records the wall time, CPU time, peak RSS, and
+    #       rows in and out of each stage, and 'memory' also traces the peak
+    #       memory allocated by each stage, which slows the stages down.  The
+    #       profile is printed by run() and written to stage_profile.json.
+    def __init__(self, inputDir='.', outputDir='.', maxRank=DEFAULT_MAX_RANK, flashBudget=None,
+                 readingIndex='bst', meaningCodebook=False, stringPoolMode=None, kanjiIndex=False,
+                 kanaTrieTopK=None, dropUnsupportedWords=False, parallelEmit=False, useStageCache=True, cacheDir=None,
+                 profileStages=None):
+        if readingIndex not in ('bst', 'mph', 'eytzinger'):
+            raise ValueError(f"Unknown reading index {readingIndex!r}.")
+        if stringPoolMode not in (None, 'dedup', 'suffix'):
+            raise ValueError(f"Unknown string pool mode {stringPoolMode!r}.")
+        if kanaTrieTopK is not None and not 0 < kanaTrieTopK < 256:
+            raise ValueError(f"The Kana prefix trie keeps 1 to 255 candidates per node, not {kanaTrieTopK}.")
+        if profileStages not in (None, 'time', 'memory'):
+            raise ValueError(f"Unknown stage profile {profileStages!r}.")
+        self.inputDir = inputDir
+        self.outputDir = outputDir
+        self.maxRank = maxRank
+        self.flashBudget = flashBudget
+        self.readingIndex = readingIndex
+        self.meaningCodebook = meaningCodebook
+        self.stringPoolMode = stringPoolMode
+        self.kanjiIndex = kanjiIndex
+        self.kanaTrieTopK = kanaTrieTopK
+        self.dropUnsupportedWords = dropUnsupportedWords
+        self.parallelEmit = parallelEmit
+        self.profiler = StageProfiler(profileStages == 'memory') if profileStages is not None else None
+        if cacheDir is None:
+            cacheDir = os.path.join(outputDir, 'stage_cache')
+        self.stageCache = StageCache(cacheDir, os.path.dirname(os.path.abspath(__file__)), useStageCache,
+                                     self.profiler)
+        # Result and key of each stage run, and the tables derived from them.
+        self.stages = {}
+        self.tables = {}
+
+    def input_path(self, name):
+        return os.path.join(self.inputDir, name)
+
+    def output_path(self, name):
+        return os.path.join(self.outputDir, name)
+
+    def _stage(self, name, func, args, files=(), deps=(), params=()):
+        # Run a stage once per build.  Returns its result and stage key.
+        if name not in self.stages:
+            self.stages[name] = self.stageCache.run(name, func, args, files=files, deps=deps, params=params)
+        return self.stages[name]
+
+    def kanji(self):
+        # DataFrame 1, every Kanji extracted from Kanji Dictionary 2.  The
+        # compressed file, as downloaded from EDRDG, is used if the
+        # uncompressed one is not present.
+        kd2Path = self.input_path('kanjidic2.xml')
+        if not os.path.exists(kd2Path):
+            kd2Path = self.input_path('kanjidic2.xml.gz')
+        n5kPath = self.input_path('Novel_5K.csv')
+        return self._stage('kanji', extract_kanji, (n5kPath, kd2Path), files=[n5kPath, kd2Path])
+
+    def kanji_subset(self):
+        # Discard all Kanji with a rank of 10000, as they are too rare.
+        if 'subset' not in self.tables:
+            df1, kanjiKey = self.kanji()
+            self.tables['subset'] = df1.loc[df1['N5K_Rank'] < 10000]
+        return self.tables['subset']
+
+    def kanji_table(self):
+        # Sort the subset according to the Novel 5K frequency ranking.  This is
+        # done to allow the file content to be reduced from the end of the file
+        # and still provide the most common Kanji.  A stable sort keeps Kanji of
+        # equal rank in Kanji Dictionary 2 order.
+        if 'kanji' not in self.tables:
+            self.tables['kanji'] = self.kanji_subset().sort_values(by='N5K_Rank', kind='stable').copy()
+        return self.tables['kanji']
+
+    def readings(self):
+        # The onyomi, kunyomi, and nanori tables (df2Sort, df3Sort, df4Sort).
+        return self._stage('readings', build_reading_cross_references, (self.kanji_subset(),),
+                           deps=[self.kanji()[1]])
+
+    def words(self):
+        wordFiles = [self.input_path(name) for name in
+                     ['Core10k.csv', 'Core5kFrequencyMod3.csv', 'Core6kMod.csv', 'jukujikun_mod.txt']]
+        return self._stage('words', merge_word_sources,
+                           (self.kanji_subset(), *wordFiles, self.dropUnsupportedWords),
+                           files=wordFiles, deps=[self.kanji()[1]], params=[self.dropUnsupportedWords])
+
+    def ranking(self):
+        # dfDict2, the ranked words containing Kanji.
+        lemmaFile = self.input_path('44492-japanese-words-latin-lines-removed.txt')
+        dfPart3, wordKey = self.words()
+        return self._stage('ranking', rank_words, (dfPart3, lemmaFile), files=[lemmaFile], deps=[wordKey])
+
+    def codebook(self):
+        # The meaning codebook, or None if the meanings are not encoded.
+        if not self.meaningCodebook:
+            return None, None
+        dfDict2, rankKey = self.ranking()
+        return self._stage('codebook', train_meaning_codebook, (self.kanji_table(), dfDict2),
+                           deps=[self.kanji()[1], rankKey])
+
+    def max_rank(self):
+        # maxRank, fitted to the flash budget if one is set.
+        if self.flashBudget is None:
+            return self.maxRank
+        dfDict2, rankKey = self.ranking()
+        meaningCodec, codebookKey = self.codebook()
+        maxRank, budgetKey = self._stage('budget', fit_max_rank_to_budget,
+                                         (dfDict2, self.flashBudget, self.readingIndex, meaningCodec),
+                                         deps=[rankKey, *key_list(codebookKey)],
+                                         params=[self.flashBudget, self.readingIndex])
+        return maxRank
+
+    def dictionary_readings(self):
+        # df6Sort, the words of rank up to maxRank under their readings.
+        if 'dictionary' not in self.tables:
+            dfDict2, rankKey = self.ranking()
+            args = (dfDict2, self.max_rank())
+            if self.profiler is not None:
+                self.tables['dictionary'] = self.profiler.call('dictionary_readings', build_dictionary_readings,
+                                                               args)
+            else:
+                self.tables['dictionary'] = build_dictionary_readings(*args)
+        return self.tables['dictionary']
+
+    def string_pool(self):
+        # The string pool shared by the headers, or None.
+        if self.stringPoolMode is None:
+            return None, None
+        df2Sort, df3Sort, df4Sort = self.readings()[0]
+        meaningCodec, codebookKey = self.codebook()
+        return self._stage('strings', build_string_pool,
+                           (self.kanji_table(), df3Sort, df4Sort, self.dictionary_readings(),
+                            self.stringPoolMode == 'suffix', meaningCodec),
+                           deps=[self.kanji()[1], self.readings()[1], self.ranking()[1], *key_list(codebookKey)],
+                           params=[self.max_rank(), self.stringPoolMode])
+
+    def kana_map(self):
+        if 'kana' not in self.tables:
+            self.tables['kana'] = load_kana_map(self.input_path('kana_list.csv'))
+        return self.tables['kana']
+
+    def emitter_stage(self, name):
+        # The arguments of run_emitter() for the stage writing an output,
+        # running the stages it depends upon.
+        outPath = self.output_path(OUTPUT_FILES[name])
+        stage = dict(name=name, outputs=[outPath])
+        kanjiKey = self.kanji()[1]
+        if name == 'kana_kanji_subset':
+            return dict(stage, func=write_kana_kanji_subset, args=(self.kanji_subset(), outPath), deps=[kanjiKey])
+
+        kanaPath = self.input_path('kana_list.csv')
+        if name == 'kanji_index':
+            if not self.kanjiIndex:
+                return dict(stage, func=write_kanji_index_header,
+                            args=(None, None, None, None, None, None, outPath, False), params=[False])
+            return dict(stage, func=write_kanji_index_header,
+                        args=(self.kanji_table(), *self.readings()[0], self.dictionary_readings(), self.kana_map(),
+                              outPath),
+                        files=[kanaPath], deps=[kanjiKey, self.readings()[1], self.ranking()[1]],
+                        params=[True, self.max_rank()])
+        if name == 'kana_trie':
+            if self.kanaTrieTopK is None:
+                return dict(stage, func=write_kana_trie_header, args=(None, None, None, None, None, outPath),
+                            params=[None])
+            return dict(stage, func=write_kana_trie_header,
+                        args=(*self.readings()[0], self.dictionary_readings(), self.kana_map(), outPath,
+                              self.kanaTrieTopK),
+                        files=[kanaPath], deps=[self.readings()[1], self.ranking()[1]],
+                        params=[self.kanaTrieTopK, self.max_rank()])
+        sharedStrings, poolKey = self.string_pool() if name != 'onyomi' else (None, None)
+        meaningCodec, codebookKey = (self.codebook() if name in ('kanji_ms', 'kanji_md', 'dictionary')
+                                     else (None, None))
+        deps = [*key_list(poolKey), *key_list(codebookKey)]
+        if name in ('kanji_ms', 'kanji_md'):
+            func = write_kanji_ms if name == 'kanji_ms' else write_kanji_md
+            return dict(stage, func=func, args=(self.kanji_table(), outPath, sharedStrings, meaningCodec),
+                        deps=[kanjiKey, *deps], params=[self.stringPoolMode, self.meaningCodebook])
+        if name == 'dictionary':
+            return dict(stage, func=write_dictionary_header,
+                        args=(self.dictionary_readings(), self.kana_map(), outPath, self.readingIndex,
+                              sharedStrings, meaningCodec),
+                        files=[kanaPath], deps=[self.ranking()[1], *deps],
+                        params=[self.max_rank(), self.readingIndex, self.stringPoolMode, self.meaningCodebook])
+
+        df2Sort, df3Sort, df4Sort = self.readings()[0]
+        readingKey = self.readings()[1]
+        if name == 'onyomi':
+            return dict(stage, func=write_onyomi_header, args=(df2Sort, self.kana_map(), outPath, self.readingIndex),
+                        files=[kanaPath], deps=[readingKey], params=[self.readingIndex])
+        func, dfSort = (write_kunyomi_header, df3Sort) if name == 'kunyomi' else (write_nanori_header, df4Sort)
+        return dict(stage, func=func, args=(dfSort, self.kana_map(), outPath, self.readingIndex, sharedStrings),
+                    files=[kanaPath], deps=[readingKey, *deps], params=[self.readingIndex, self.stringPoolMode])
+
+    def run(self, only=None):
+        # Write the generated files, or only those named, and report on them.
+        for name in only or ():
+            if name not in OUTPUTS:
+                raise ValueError(f"Unknown output {name!r}, expected one of {', '.join(OUTPUTS)}.")
+        names = OUTPUTS if only is None else [name for name in OUTPUTS if name in only]
+        os.makedirs(self.outputDir, exist_ok=True)
+        emitters = [self.emitter_stage(name) for name in names]
+        if self.parallelEmit:
+            with ProcessPoolExecutor(max_workers=len(emitters)) as executor:
+                self.stageCache.run_emitters(emitters, executor)
         else:
-            # Find index of WordList matching word.
-            kndx = df5.iloc[ndx]['WordList'].index(row['Kanji'])
-            # Append definition to existing one in MeaningList at same index.
-            df5.at[ndx, 'MeaningList'][kndx] = df5.iloc[ndx]['MeaningList'][kndx] + ", " + row['Definition']
-    else:
-        # The disctionary reading is not present in DataFrame 6, so add it,
-        # as well as the kanji and meaning values.
-        new_row = pd.DataFrame([[row['Reading'], [row['Kanji']], [row['Definition']]]],
-                                columns=['Reading', 'WordList', 'MeaningList'])
-        # Add the new row into DataFrame 6.
-        df5 = pd.concat([df5, new_row], ignore_index=True)
-        wordcount += 1
-
-print(f"There are {len(df5)} unique readings for {wordcount} words.")
-df6Sort = df5.sort_values('Reading', ignore_index=True)
-
-# START OF DICTIONARY OUTPUT PROCESSING
-# Add column to hold integer value that is the decimal representation of the
-# concatenated lower bytes of the Katakana characters of the Word string.
-# After all rows are processed, none should contain the default value.
-df6Sort['kanaBytes'] = ""
-df6Sort['KanaInt'] = 0
-
-# Enumeration for describing enhancements to onyomi, kunyomi, and
-# nanori readings, and dictionary words.
-# enum affix_enum {
-#   none,   // No enhancments to reading (e.g., xyz).
-#   prefix, // Reading is a prefix (e.g., wxyz-).
-#   suffix, // Reading is a suffix (e.g., -wxyz).
-#   jword,  // Japanese word string with jukujikun or irregular reading.
-#   meaning // English meaning string for Japanese word enumerated above.
-# };
-
-# Data Type 2: Structure typedef of metadata for Okurigana (and other readings)
-# typedef struct okuri_md {
-#   const uint8_t len;      // Number of enumerations/character arrays.
-#   const affix_enum *alist; // Pointer ot array of enumerations, one for each character array.
-#   const char **clist;      // Pointer to array of character arrays, for for each enumeration.
-# } okuri_md;
-
-# Data Type 3: Structure typedef of metadata for Reading
-# typedef struct reading_md {
-#   const uint16_t len;             // Number of Okurigana and Kanji structures.
-#   const okuri_md * const * olist; // Pointer to array of okurigana metadata structures.
-#   const kanji_md * const * klist; // Pointer to array of kanji metadata structures.
-# } reading_md;
-# Data structure 3:  Array of Kanji metadata structures referenced by a
-# specific onyomi, kunyomi, or nanori.  The order of the Kanji metadata
-# structures in the list is the ascending order of Kanji frequency rank
-# The value of XXXX is the numeric represenation of the kana for the
-# onyomi, kunyomi, or nanori.
-# const kanji_md const kmXXXX[] = {&kanji_md<UCS1>, &kanji_md<UCS2>, ... &kanji_md<UCSn>};
-
-with open("dictionary.h", "w") as f:
-    print("/* dictionary.h */\n", file=f)
-    print("#ifndef AFFIX_ENUM", file=f)
-    print("#define AFFIX_ENUM", file=f)
-    print("enum affix_enum {", file=f)
-    print("  none,   // No enhancments to reading (e.g., xyz).", file=f)
-    print("  prefix, // Reading is a prefix (e.g., wxyz-).", file=f)
-    print("  suffix, // Reading is a suffix (e.g., -wxyz).", file=f)
-    print("  jword,  // Japanese word string with jukujikun or irregular reading.", file=f)
-    print("  meaning // English meaning string for Japanese word enumerated above.", file=f)
-    print("};", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef OKURI_METADATA_TYPE", file=f)
-    print("#define OKURI_METADATA_TYPE", file=f)
-    print("typedef struct okuri_md {", file=f)
-    print("  const uint8_t len;", file=f)
-    print("  const affix_enum * const alist;", file=f)
-    print("  const char **clist;", file=f)
-    print("} okuri_md;", file=f)
-    print("#endif\n", file=f)
-
-    print("#ifndef READING_METADATA_TYPE", file=f)
-    print("#define READING_METADATA_TYPE", file=f)
-    print("typedef struct reading_md {", file=f)
-    print("  const uint16_t len;", file=f)
-    print("  const okuri_md * const * olist;", file=f)
-    print("  const kanji_md * const * klist;", file=f)
-    print("} reading_md;", file=f)
-    print("#endif", file=f)
-
-    # Iterate on each dictionary to create an array of kanji metadata for each dictionary value.
-    for df6_ndx, row in df6Sort.iterrows():
-        # Convert syllables of Kana into a number string for naming and
-        # referencing of structure array.
-        kanaBytes = ""
-        for kana in row['Reading']:
-            kanaBytes = kanaBytes + kanaMap[kana]
-
-        # Convert to a byte string.
-        kanaBytesStr = bytes.fromhex(kanaBytes)
-        # Generate 32-bit hash
-        kanaInt = mmh3.hash(kanaBytesStr, signed=False)
-        # Make string of Kana bytes look like a hex number.
-        kanaBytes = hex(kanaInt)
-        # Fill KanaBytes and KanaInt columns for the row.
-        df6Sort.at[df6_ndx, 'KanaBytes'] = kanaBytes
-        df6Sort.at[df6_ndx, 'KanaInt'] = kanaInt
-
-        # Iterate on each element of affixList / okuriList for each kanji.
-        sndx = 0
-        for ndx in range(len(row['WordList'])):
-            # Generate the enumeration array.
-            print(f"const affix_enum dict_affix{kanaBytes}_{sndx:02d}[] = ", end='', file=f)
-            print(f"{open_curl}jword, meaning{close_curl};", file=f)
-            # Generate the character string list.
-            # Create a UTF-8 char strings for the okurigana.
-            print(f"const char *dict_olist{kanaBytes}_{sndx:02d}[] = ", end='', file=f)
-            jword = row['WordList'][ndx]
-            # Create a UTF-8 char strings for the Japanese word.
-            print(f"{open_curl}\"", end='', file=f)
-            odd = True
-            for nybble in [*jword.encode('utf8').hex()]:
-                if odd:
-                    print(f"\\x{nybble}", end='', file=f)
-                else:
-                    print(f"{nybble}", end='', file=f)
-
-                odd ^= True
-
-            print(f"\", \"{row['MeaningList'][ndx]}\"{close_curl};", file=f)
-            print(f"const okuri_md dict_okuri_md{kanaBytes}_{sndx:02d} = ", end='', file=f)
-            print(f"{open_curl}2, dict_affix{kanaBytes}_{sndx:02d}, ", end='', file=f)
-            print(f"dict_olist{kanaBytes}_{sndx:02d}{close_curl};", file=f)
-            sndx += 1
-
-        # Now generate array of okurigana structures of same length as kanji.
-        print(f"const okuri_md * const dict_okuri{kanaBytes}[] = ", end='', file=f)
-        delimit = '{'
-        for ndx in range(sndx):
-            print(f"{delimit}&dict_okuri_md{kanaBytes}_{ndx:02d}", end='', file=f)
-            delimit = ", "
-
-        print("};", file=f)
-        print(f"const reading_md dictionary_md{kanaBytes} = ", end='', file=f)
-        print(f"{open_curl}{len(row['WordList'])},", end='', file=f)
-        print(f" dict_okuri{kanaBytes}, NULL{close_curl};", file=f)
-
-    # Data type 3: Node for balanced binary tree.
-    # typedef struct bbt_node {
-    #   const uint32_t key;
-    #   const onyomi_md* onmd;
-    #   const bbt_node * const lnode;
-    #   const bbt_node * const rnode;
-    # };
-    print("\n#ifndef BBT_NODE_TYPE", file=f)
-    print("#define BBT_NODE_TYPE", file=f)
-    print("typedef struct bbt_node {", file=f)
-    print("  const uint32_t key;", file=f)
-    print("  const reading_md* md;", file=f)
-    print("  const bbt_node * const lnode;", file=f)
-    print("  const bbt_node * const rnode;", file=f)
-    print("} bbt_node;", file=f)
-    print("#endif", file=f)
-
-    # Pull out the KanaBytes and KanaInt colums from the sorted
-    # jukujikan DataFrame (dfJukuSort).
-    df6Sub = df6Sort[['KanaBytes', 'KanaInt']]
-    # Sort according to KanaInt.
-    df6SubSort = df6Sub.sort_values('KanaInt', ignore_index=True)
-    # Form a list from the sorted KanaBytes column.
-    dictionaryList = df6SubSort['KanaBytes'].tolist()
-    # Generate the node data structures for the Balanced Binary Structure Tree.
-    root_node = print_balanced_bst(dictionaryList, "dictionary", f)
-    print(f"const bbt_node *dictionary_root_node = &dictionary_node{root_node};", file=f)
-
-f.close()
-# END OF DICTIONARY OUTPUT PROCESSING
-
-print("Done")
+            self.stageCache.run_emitters(emitters)
+        self.print_reports(names)
+
+    def print_reports(self, names):
+        meaningCodec = self.stages.get('codebook', (None, None))[0]
+        sharedStrings = self.stages.get('strings', (None, None))[0]
+        if meaningCodec is not None:
+            print_codebook_report(meaningCodec, list(self.kanji_table()['Meanings']) +
+                                  [meaning for meaningList in self.dictionary_readings()['MeaningList']
+                                   for meaning in meaningList])
+        if sharedStrings is not None:
+            print_string_pool_report(sharedStrings)
+
+        # Report where the flash goes.  The headers are sized in the order
+        # kdict.cpp includes them, sharing one string literal pool as that
+        # translation unit does.  With a string pool, all of the strings are
+        # counted against kanji_ms.h.
+        literalPool = set()
+        pooled = sharedStrings is not None
+        footprints = []
+        if 'kanji_ms' in names:
+            footprints.append(kanji_ms_footprint(self.kanji_table(), literalPool, sharedStrings, meaningCodec))
+        if 'kanji_md' in names:
+            footprints.append(kanji_md_footprint(self.kanji_table(), literalPool))
+        if 'onyomi' in names:
+            footprints.append(onyomi_footprint(self.readings()[0][0], literalPool, self.readingIndex))
+        if 'kunyomi' in names:
+            footprints.append(kunyomi_footprint(self.readings()[0][1], literalPool, self.readingIndex, pooled))
+        if 'nanori' in names:
+            footprints.append(nanori_footprint(self.readings()[0][2], literalPool, self.readingIndex, pooled))
+        if 'dictionary' in names:
+            footprints.append(dictionary_footprint(self.dictionary_readings(), literalPool, self.readingIndex,
+                                                   pooled, meaningCodec))
+        if 'kanji_index' in names and self.kanjiIndex:
+            footprints.append(kanji_index_footprint(
+                KanjiReverseIndex(self.kanji_table(), self.readings()[0], self.dictionary_readings(),
+                                  self.kana_map()), literalPool))
+        if 'kana_trie' in names and self.kanaTrieTopK is not None:
+            footprints.append(kana_trie_footprint(
+                build_kana_trie(self.readings()[0], self.dictionary_readings(), self.kana_map(), self.kanaTrieTopK)))
+        if footprints:
+            print_footprint_report(footprints)
+
+        self.stageCache.print_output_report()
+        if self.profiler is not None:
+            self.profiler.print_summary()
+            self.profiler.write_json(self.output_path('stage_profile.json'))
+
+
+def key_list(key):
+    # The stage key of an optional stage, as a list of dependencies.
+    return [key] if key is not None else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the KanaChord Plus Kanji and dictionary headers.")
+    parser.add_argument('--input', default='.', help="directory of the source files (default: .)")
+    parser.add_argument('--output', default='.', help="directory the generated files are written to (default: .)")
+    parser.add_argument('--only', nargs='+', choices=OUTPUTS, metavar='OUTPUT',
+                        help=f"write only these outputs, running only the stages they need: {', '.join(OUTPUTS)}")
+    parser.add_argument('--max-rank', type=int, default=DEFAULT_MAX_RANK,
+                        help=f"largest word frequency rank kept in dictionary.h (default: {DEFAULT_MAX_RANK})")
+    parser.add_argument('--flash-budget', type=int, help="fit maxRank to this many bytes of dictionary.h flash")
+    parser.add_argument('--reading-index', choices=['bst', 'mph', 'eytzinger'], default='bst',
+                        help="index of the reading sets (default: bst)")
+    parser.add_argument('--meaning-codebook', action='store_true', help="encode the meanings with a codebook")
+    parser.add_argument('--string-pool', choices=['dedup', 'suffix'], help="store the strings in a shared pool")
+    parser.add_argument('--kanji-index', action='store_true',
+                        help="write the Kanji to readings and words reverse index to kanji_index.h")
+    parser.add_argument('--kana-trie', type=int, nargs='?', const=DEFAULT_TOP_K, metavar='TOP_K',
+                        help=f"write the Kana prefix trie, with TOP_K candidates per node "
+                             f"(default: {DEFAULT_TOP_K}), to kana_trie.h")
+    parser.add_argument('--drop-unsupported-words', action='store_true',
+                        help="drop words using Kanji outside of the supported subset")
+    parser.add_argument('--parallel', action='store_true', help="write the outputs in worker processes")
+    parser.add_argument('--no-cache', action='store_true', help="rebuild every stage, ignoring the stage cache")
+    parser.add_argument('--cache-dir', help="directory of the stage cache (default: OUTPUT/stage_cache)")
+    parser.add_argument('--profile', choices=['time', 'memory'], help="profile the stages")
+    args = parser.parse_args()
+
+    build = DictionaryBuild(args.input, args.output, maxRank=args.max_rank, flashBudget=args.flash_budget,
+                            readingIndex=args.reading_index, meaningCodebook=args.meaning_codebook,
+                            stringPoolMode=args.string_pool, kanjiIndex=args.kanji_index,
+                            kanaTrieTopK=args.kana_trie, dropUnsupportedWords=args.drop_unsupported_words,
+                            parallelEmit=args.parallel, useStageCache=not args.no_cache, cacheDir=args.cache_dir,
+                            profileStages=args.profile)
+    build.run(args.only)
+    print("Done")
+
+
+if __name__ == '__main__':
+    main()
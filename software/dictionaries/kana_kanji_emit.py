@@ -0,0 +1,479 @@
+import hashlib
+import os
+import mmh3
+from kana_kanji_index import MinimalPerfectHash, eytzinger_order, verify_eytzinger
+
+# Buffered writer for the generated C headers.  Each structure is rendered
+# from one of the format templates below, the rendered text is collected in
+# memory, and the header is written to its file in a single call.  Outputs
+# are only replaced when their content has changed.
+
+# Type definitions shared by the onyomi, kunyomi, nanori and dictionary
+# headers, guarded so that the headers can be included together.
+# affix_enum describes enhancements to onyomi, kunyomi, and nanori readings,
+# and dictionary words.
+# okuri_md is the metadata for Okurigana (and other readings):
+#   len   - Number of enumerations/character arrays.
+#   alist - Pointer to array of enumerations, one for each character array.
+#   clist - Pointer to array of character arrays, one for each enumeration.
+# reading_md is the metadata for a reading:
+#   len   - Number of Okurigana and Kanji structures.
+#   olist - Pointer to array of okurigana metadata structures.
+#   klist - Pointer to array of kanji metadata structures, in ascending
+#           order of Kanji frequency rank.
+READING_TYPES = """/* {name} */
+
+#ifndef AFFIX_ENUM
+#define AFFIX_ENUM
+enum affix_enum {{
+  none,   // No enhancments to reading (e.g., xyz).
+  prefix, // Reading is a prefix (e.g., wxyz-).
+  suffix, // Reading is a suffix (e.g., -wxyz).
+  jword,  // Japanese word string with jukujikun or irregular reading.
+  meaning // English meaning string for Japanese word enumerated above.
+}};
+#endif
+
+#ifndef OKURI_METADATA_TYPE
+#define OKURI_METADATA_TYPE
+typedef struct okuri_md {{
+  const uint8_t len;
+  const affix_enum * const alist;
+  const char **clist;
+}} okuri_md;
+#endif
+
+#ifndef READING_METADATA_TYPE
+#define READING_METADATA_TYPE
+typedef struct reading_md {{
+  const uint16_t len;
+  const okuri_md * const * olist;
+  const kanji_md * const * klist;
+}} reading_md;
+#endif
+"""
+
+# The reading metadata member is named rmd in onyomi.h and kunyomi.h, and
+# md in nanori.h and dictionary.h.  The first definition included wins.
+BBT_NODE_TYPE = """
+#ifndef BBT_NODE_TYPE
+#define BBT_NODE_TYPE
+typedef struct bbt_node {{
+  const uint32_t key;
+  const reading_md* {field};
+  const bbt_node * const lnode;
+  const bbt_node * const rnode;
+}} bbt_node;
+#endif
+"""
+
+KANJI_MD_TYPE = """#ifndef KANJI_METADATA_TYPE
+#define KANJI_METADATA_TYPE
+typedef struct kanji_md {
+  const uint16_t unicode;
+  const uint16_t rank;
+  const char* const meaning;
+} kanji_md;
+#endif
+
+"""
+
+KANJI_MS = 'const char kanji_ms{ucs}[] = "{meaning}";\n'
+KANJI_MD = 'const kanji_md kanji_md{ucs} = {{0x{ucs}, {rank}, {meaning}}};\n'
+AFFIX_LIST = 'const affix_enum {name}[] = {{{items}}};\n'
+CHAR_LIST = 'const char *{name}[] = {{{items}}};\n'
+OKURI_MD = 'const okuri_md {name} = {{{count}, {alist}, {clist}}};\n'
+OKURI_LIST = 'const okuri_md * const {name}[] = {{{items}}};\n'
+KANJI_LIST = 'const kanji_md * const {name}[] = {{{items}}};\n'
+READING_MD = 'const reading_md {name} = {{{count}, {olist}, {klist}}};\n'
+BBT_NODE = 'const bbt_node {prefix}_node{key} {{{key}, &{prefix}_md{key}, {lnode}, {rnode}}};\n'
+ROOT_NODE = 'const bbt_node *{prefix}_root_node = &{prefix}_node{key};\n'
+
+# Key and reading metadata arrays of the flat (pointer free) indexes.
+INDEX_KEYS = 'const uint32_t {prefix}_keys[] = {{\n  {items}}};\n'
+INDEX_RMDS = 'const reading_md * const {prefix}_rmds[] = {{\n  {items}}};\n'
+
+# Minimal perfect hash index of a reading set, emitted in place of the BST
+# when the reading index mode is 'mph'.  Defining KDICT_MPH_INDEX selects
+# get_reading_mph() in kdict.cpp.
+#   disp - 16-bit displacement seed of each bucket.
+#   keys - Key held in each slot, to reject readings not in the set.
+#   rmds - Reading metadata of each slot.
+MPH_INDEX_TYPE = """
+#ifndef MPH_INDEX_TYPE
+#define MPH_INDEX_TYPE
+#define KDICT_MPH_INDEX
+typedef struct mph_index {
+  const uint32_t salt;
+  const uint16_t size;
+  const uint16_t buckets;
+  const uint16_t * const disp;
+  const uint32_t * const keys;
+  const reading_md * const * const rmds;
+} mph_index;
+#endif
+"""
+MPH_DISP = 'const uint16_t {prefix}_disp[] = {{\n  {items}}};\n'
+MPH_INDEX = ('const mph_index {prefix}_index = {{{salt}, {size}, {buckets}, '
+             '{prefix}_disp, {prefix}_keys, {prefix}_rmds}};\n')
+
+# Eytzinger index of a reading set, emitted in place of the BST when the
+# reading index mode is 'eytzinger'.  Defining KDICT_EYTZINGER_INDEX selects
+# get_reading_eytzinger() in kdict.cpp.
+#   keys - Keys in breadth-first order of a complete BST, the children of
+#          keys[i] being keys[2i+1] and keys[2i+2].
+#   rmds - Reading metadata of each key.
+EYTZINGER_INDEX_TYPE = """
+#ifndef EYTZINGER_INDEX_TYPE
+#define EYTZINGER_INDEX_TYPE
+#define KDICT_EYTZINGER_INDEX
+typedef struct eytzinger_index {
+  const uint16_t size;
+  const uint32_t * const keys;
+  const reading_md * const * const rmds;
+} eytzinger_index;
+#endif
+"""
+EYTZINGER_INDEX = 'const eytzinger_index {prefix}_index = {{{size}, {prefix}_keys, {prefix}_rmds}};\n'
+
+class HeaderBuffer:
+    # In-memory output of a header.  It has the write() method of a file, so
+    # the text can also be added with print(..., file=buffer).
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def emit(self, template, **values):
+        self.parts.append(template.format(**values))
+
+    def save(self, outPath):
+        # Returns True if the file was updated, False if it was unchanged.
+        return save_text(outPath, ''.join(self.parts))
+
+def content_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def replace_if_changed(tmpPath, outPath):
+    # Move a newly written temporary file over outPath, unless outPath already
+    # holds the same content, in which case it is left untouched (keeping its
+    # modification time, so that the firmware build does not recompile it).
+    # os.replace() is atomic, so an interrupted run never leaves a partially
+    # written output.  Returns True if outPath was updated.
+    if os.path.exists(outPath) and content_digest(tmpPath) == content_digest(outPath):
+        os.remove(tmpPath)
+        return False
+    os.replace(tmpPath, outPath)
+    return True
+
+def save_text(outPath, text):
+    # The temporary file is in the directory of outPath, as os.replace() cannot
+    # move a file across file systems.
+    tmpPath = f"{outPath}.{os.getpid()}.tmp"
+    with open(tmpPath, "w") as f:
+        f.write(text)
+    return replace_if_changed(tmpPath, outPath)
+
+def save_bytes(outPath, data):
+    tmpPath = f"{outPath}.{os.getpid()}.tmp"
+    with open(tmpPath, "wb") as f:
+        f.write(data)
+    return replace_if_changed(tmpPath, outPath)
+
+def utf8_escape(text):
+    # Render a string as a C string literal body of hex escapes, one per
+    # UTF-8 byte (e.g. '愛' -> '\xe6\x84\x9b').
+    if not text:
+        return ''
+    return '\\x' + text.encode('utf8').hex('|').replace('|', '\\x')
+
+def c_bytes(data):
+    # Render bytes as a C string literal body.  Printable ASCII is written as
+    # it is, and other bytes as three digit octal escapes, which unlike hex
+    # escapes cannot run on into the character that follows.
+    body = []
+    for byte in data:
+        if 0x20 <= byte < 0x7f and chr(byte) not in '\\"?':
+            body.append(chr(byte))
+        else:
+            body.append(f"\\{byte:03o}")
+    return ''.join(body)
+
+def meaning_value(meaning, meaningCodec=None):
+    # A meaning as it is stored: the text, or its encoding by the meaning
+    # codebook (see kana_kanji_codebook.py).
+    return meaning if meaningCodec is None else meaningCodec.encode(meaning)
+
+def meaning_literal(meaning, meaningCodec=None):
+    # C string literal body of a meaning.  Meanings are written as they are.
+    return meaning if meaningCodec is None else c_bytes(meaningCodec.encode(meaning))
+
+def c_strings(texts, sharedStrings=None):
+    # Comma separated C string literals of the hex escaped texts, or their
+    # addresses in the string pool if there is one.
+    if sharedStrings is not None:
+        return ', '.join([sharedStrings.ref(text) for text in texts])
+    return ', '.join(['"' + utf8_escape(text) + '"' for text in texts])
+
+def kanji_refs(ucsList):
+    # Comma separated references to the metadata of the Kanji.
+    return ', '.join(['&kanji_md' + ucs.upper() for ucs in ucsList])
+
+def kana_key(reading, kanaMap):
+    # The key of a reading is the 32-bit Murmur3 hash of the concatenated
+    # lower bytes of the Unicode values of its Kana, as make_key() and
+    # murmur3_32() compute it in kdict.cpp.
+    kanaBytes = ''.join([kanaMap[kana] for kana in reading])
+    return mmh3.hash(bytes.fromhex(kanaBytes), signed=False)
+
+def bst_order(keyInts):
+    # The reading keys, as their hex names, in ascending order of key.
+    return [hex(kanaInt) for kanaInt in sorted(keyInts)]
+
+def print_balanced_bst(sList, prefix, outFile):
+    # If the list is empty, return an empty string (null pointer).
+    if not sList:
+        return 0
+    
+    # Length of list.
+    n = len(sList)
+    # Midpoint of list.
+    mid = n // 2
+    # The key for the node is the middle element of the list.
+    key = sList[mid]
+    # The left (lower) list consists of list elements to left of key.
+    lList = sList[0:mid]
+    # The right (higher) list consists of list elements to right of key.
+    rList = sList[mid+1:n]
+    # Recurse on balanced BST for the left and right lists.
+    lNode = print_balanced_bst(lList, prefix, outFile)
+    rNode = print_balanced_bst(rList, prefix, outFile)
+    
+    # Print the C structure representing the node.
+    # Data Type 4?: Node for balanced binary tree.
+    # typedef struct bbt_node {
+    #   const uint64_t key;
+    #   const reading_md* onmd;
+    #   const bbt_node * const lnode;
+    #   const bbt_node * const rnode;
+    # } bbt_node;
+    lLink = f"&{prefix}_node{lNode}" if lNode != 0 else "NULL"
+    rLink = f"&{prefix}_node{rNode}" if rNode != 0 else "NULL"
+    outFile.write(BBT_NODE.format(prefix=prefix, key=key, lnode=lLink, rnode=rLink))
+    return key
+
+def reading_keys(readings, kanaMap, setName):
+    # The keys of the readings of a set, in order.  Distinct readings must
+    # have distinct keys, as only the key is searched for in kdict.cpp.
+    keyInts = [kana_key(reading, kanaMap) for reading in readings]
+    if len(set(keyInts)) != len(keyInts):
+        byKey = {}
+        for reading, kanaInt in zip(readings, keyInts):
+            byKey.setdefault(kanaInt, []).append(reading)
+        collisions = ['/'.join(same) for same in byKey.values() if len(same) > 1]
+        raise ValueError(f"Colliding {setName} reading keys: {', '.join(collisions)}")
+    return keyInts
+
+def hex_rows(values, width, perLine=8):
+    # Comma separated hex values, perLine to a line.
+    rows = []
+    for ndx in range(0, len(values), perLine):
+        rows.append(', '.join([f"0x{value:0{width}x}" for value in values[ndx:ndx + perLine]]))
+    return ',\n  '.join(rows)
+
+def md_rows(prefix, keys, perLine=4):
+    # Comma separated references to the reading metadata of the keys.
+    mdRefs = [f"&{prefix}_md{hex(key)}" for key in keys]
+    return ',\n  '.join([', '.join(mdRefs[ndx:ndx + perLine]) for ndx in range(0, len(mdRefs), perLine)])
+
+def emit_reading_index(out, prefix, keyInts, field, indexMode):
+    # Emit the index over the reading metadata <prefix>_md<key>, in the order
+    # of keyInts.  'bst' is the balanced BST of bbt_node structures searched
+    # by get_reading(), 'mph' the minimal perfect hash tables searched by
+    # get_reading_mph(), and 'eytzinger' the breadth-first key array searched
+    # by get_reading_eytzinger() (see kana_kanji_index.py).
+    if indexMode == 'bst':
+        out.emit(BBT_NODE_TYPE, field=field)
+        # Generate the node data structures for the Balanced Binary Structure
+        # Tree, and a pointer to the root node.
+        root_node = print_balanced_bst(bst_order(keyInts), prefix, out)
+        out.emit(ROOT_NODE, prefix=prefix, key=root_node)
+    elif indexMode == 'mph':
+        mph = MinimalPerfectHash(keyInts)
+        mph.verify(keyInts)
+        out.write(MPH_INDEX_TYPE)
+        out.emit(MPH_DISP, prefix=prefix, items=hex_rows(mph.disp, 4))
+        out.emit(INDEX_KEYS, prefix=prefix, items=hex_rows(mph.slotKeys, 8))
+        out.emit(INDEX_RMDS, prefix=prefix, items=md_rows(prefix, mph.slotKeys))
+        out.emit(MPH_INDEX, prefix=prefix, salt=f"0x{mph.salt:08x}", size=mph.size, buckets=mph.buckets)
+    elif indexMode == 'eytzinger':
+        sortedKeys = sorted(keyInts)
+        eytKeys = eytzinger_order(sortedKeys)
+        verify_eytzinger(sortedKeys, eytKeys)
+        out.write(EYTZINGER_INDEX_TYPE)
+        out.emit(INDEX_KEYS, prefix=prefix, items=hex_rows(eytKeys, 8))
+        out.emit(INDEX_RMDS, prefix=prefix, items=md_rows(prefix, eytKeys))
+        out.emit(EYTZINGER_INDEX, prefix=prefix, size=len(eytKeys))
+    else:
+        raise ValueError(f"Unknown reading index mode '{indexMode}'.")
+
+def write_onyomi_header(df2Sort, kanaMap, outPath, indexMode='bst'):
+    # Stage: write the onyomi reading header (onyomi.h).
+    # START OF ONYOMI OUTPUT PROCESSING
+    # Each reading is named by its key, the hex representation of the Murmur3
+    # hash of the concatenated lower bytes of the Katakana characters of the
+    # Onyomi string.  The keys also order the nodes of the Balanced BST.
+    # The Onyomi data does not contain any okurigana, but there are Onyomi some that are
+    # suffixes. This requires creating and initializing okurigana metadata structure arrays.
+    out = HeaderBuffer()
+    out.emit(READING_TYPES, name="onyomi.h")
+    keyInts = reading_keys(df2Sort.readings, kanaMap, "onyomi")
+    anyAffix = df2Sort.any_affix()
+
+    # Iterate on each onyomi to create an array of kanji metadata for each onyomi.
+    for row, kanaInt in enumerate(keyInts):
+        kanaBytes = hex(kanaInt)
+        ucsList = df2Sort.ucs_list(row)
+
+        # For onyomi, there is only affix information. Either 'none' or 'suffix'.
+        # There is always only one affix value for each onyomi reading, further
+        # simplifying the generation script.
+        allNoneList = not anyAffix[row]
+        if not allNoneList:
+            affixList, okuriList = df2Sort.sub_lists(row)
+            for sndx, affixes in enumerate(affixList):
+                out.emit(AFFIX_LIST, name=f"on_affix{kanaBytes}_{sndx:02d}", items=', '.join(affixes))
+                out.emit(OKURI_MD, name=f"on_okuri_md{kanaBytes}_{sndx:02d}", count=1,
+                         alist=f"on_affix{kanaBytes}_{sndx:02d}", clist="NULL")
+
+            okuriRefs = ', '.join([f"&on_okuri_md{kanaBytes}_{ndx:02d}" for ndx in range(len(affixList))])
+            out.write(f"const okuri_md * on_okuri{kanaBytes}[] = {{{okuriRefs}}};\n")
+
+        out.emit(KANJI_LIST, name=f"on_kanji{kanaBytes}", items=kanji_refs(ucsList))
+        out.emit(READING_MD, name=f"onyomi_md{kanaBytes}", count=len(ucsList),
+                 olist="NULL" if allNoneList else f"on_okuri{kanaBytes}", klist=f"on_kanji{kanaBytes}")
+
+    emit_reading_index(out, "onyomi", keyInts, "rmd", indexMode)
+    # END OF ONYOMI OUTPUT PROCESSING
+    return out.save(outPath)
+
+def write_kunyomi_header(df3Sort, kanaMap, outPath, indexMode='bst', sharedStrings=None):
+    # Stage: write the kunyomi reading header (kunyomi.h).
+    # START OF KUNYOMI OUTPUT PROCESSING
+    # Readings are named and ordered by key, as for the onyomi.
+    out = HeaderBuffer()
+    out.emit(READING_TYPES, name="kunyomi.h")
+    keyInts = reading_keys(df3Sort.readings, kanaMap, "kunyomi")
+    # Determine whether all affix values of each reading are 'none', and
+    # whether all okurigana values are empty strings.
+    anyAffix = df3Sort.any_affix()
+    anyOkuri = df3Sort.any_okuri()
+
+    for row, kanaInt in enumerate(keyInts):
+        kanaBytes = hex(kanaInt)
+        ucsList = df3Sort.ucs_list(row)
+        allNoneList = not anyAffix[row]
+        allEmptyList = not anyOkuri[row]
+
+        if allNoneList == False or allEmptyList == False:
+            # Iterate on the affixes and okurigana of each kanji, a Kanji with
+            # the reading more than once having several, creating arrays of
+            # one or more affix enumeration values and UTF-8 char strings for
+            # the okurigana of a given kanji.
+            affixList, okuriList = df3Sort.sub_lists(row)
+            for sndx, (affixes, okuris) in enumerate(zip(affixList, okuriList)):
+                out.emit(AFFIX_LIST, name=f"kun_affix{kanaBytes}_{sndx:02d}", items=', '.join(affixes))
+                out.emit(CHAR_LIST, name=f"kun_olist{kanaBytes}_{sndx:02d}", items=c_strings(okuris, sharedStrings))
+                out.emit(OKURI_MD, name=f"kun_okuri_md{kanaBytes}_{sndx:02d}", count=len(affixes),
+                         alist=f"kun_affix{kanaBytes}_{sndx:02d}", clist=f"kun_olist{kanaBytes}_{sndx:02d}")
+
+            # Now generate array of okurigana structures of same length as kanji.
+            okuriRefs = ', '.join([f"&kun_okuri_md{kanaBytes}_{ndx:02d}" for ndx in range(len(ucsList))])
+            out.emit(OKURI_LIST, name=f"kun_okuri{kanaBytes}", items=okuriRefs)
+
+        # Generate the Kanji data structure for this reading.
+        out.emit(KANJI_LIST, name=f"kun_kanji{kanaBytes}", items=kanji_refs(ucsList))
+        out.emit(READING_MD, name=f"kunyomi_md{kanaBytes}", count=len(ucsList),
+                 olist="NULL" if allNoneList and allEmptyList else f"kun_okuri{kanaBytes}",
+                 klist=f"kun_kanji{kanaBytes}")
+
+    emit_reading_index(out, "kunyomi", keyInts, "rmd", indexMode)
+    # END OF KUNYOMI OUTPUT PROCESSING
+    return out.save(outPath)
+
+def write_nanori_header(df4Sort, kanaMap, outPath, indexMode='bst', sharedStrings=None):
+    # Stage: write the nanori reading header (nanori.h).
+    # START OF NANORI OUTPUT PROCESSING
+    # Readings are named and ordered by key, as for the onyomi.
+    out = HeaderBuffer()
+    out.emit(READING_TYPES, name="nanori.h")
+    keyInts = reading_keys(df4Sort.readings, kanaMap, "nanori")
+    # There are no affix values.
+    # Determine whether all okurigana values of each reading are empty strings.
+    anyOkuri = df4Sort.any_okuri()
+
+    for row, kanaInt in enumerate(keyInts):
+        kanaBytes = hex(kanaInt)
+        ucsList = df4Sort.ucs_list(row)
+        allEmptyList = not anyOkuri[row]
+
+        if allEmptyList == False:
+            # Iterate on the okurigana of each kanji, creating an array of one
+            # or more UTF-8 char strings for the okurigana.
+            affixList, okuriList = df4Sort.sub_lists(row)
+            for sndx, okuris in enumerate(okuriList):
+                out.emit(CHAR_LIST, name=f"na_olist{kanaBytes}_{sndx:02d}", items=c_strings(okuris, sharedStrings))
+                out.emit(OKURI_MD, name=f"na_okuri_md{kanaBytes}_{sndx:02d}", count=len(okuris),
+                         alist="NULL", clist=f"na_olist{kanaBytes}_{sndx:02d}")
+
+            # Now generate array of okurigana structures of same length as kanji
+            okuriRefs = ', '.join([f"&na_okuri_md{kanaBytes}_{ndx:02d}" for ndx in range(len(ucsList))])
+            out.emit(OKURI_LIST, name=f"na_okuri{kanaBytes}", items=okuriRefs)
+
+        out.emit(KANJI_LIST, name=f"na_kanji{kanaBytes}", items=kanji_refs(ucsList))
+        out.emit(READING_MD, name=f"nanori_md{kanaBytes}", count=len(ucsList),
+                 olist="NULL" if allEmptyList else f"na_okuri{kanaBytes}", klist=f"na_kanji{kanaBytes}")
+
+    emit_reading_index(out, "nanori", keyInts, "md", indexMode)
+    # END OF NANORI OUTPUT PROCESSING
+    return out.save(outPath)
+
+def write_dictionary_header(df6Sort, kanaMap, outPath, indexMode='bst', sharedStrings=None, meaningCodec=None):
+    # Stage: write the dictionary word header (dictionary.h).
+    # START OF DICTIONARY OUTPUT PROCESSING
+    # Readings are named and ordered by key, as for the onyomi.  Each word of a
+    # reading has okurigana metadata holding the Japanese word (jword) and
+    # its English meaning (meaning).  There is no Kanji metadata list.
+    out = HeaderBuffer()
+    out.emit(READING_TYPES, name="dictionary.h")
+    keyInts = reading_keys(df6Sort['Reading'], kanaMap, "dictionary")
+    if meaningCodec is not None:
+        meaningCodec.verify([meaning for meaningList in df6Sort['MeaningList'] for meaning in meaningList])
+
+    # Iterate on each dictionary reading to create the metadata of its words.
+    for kanaInt, reading, wordList, meaningList in zip(keyInts, df6Sort['Reading'], df6Sort['WordList'], df6Sort['MeaningList']):
+        kanaBytes = hex(kanaInt)
+
+        for sndx, (jword, meaning) in enumerate(zip(wordList, meaningList)):
+            # Generate the enumeration array, and the character string list of
+            # the UTF-8 Japanese word and the meaning.
+            out.emit(AFFIX_LIST, name=f"dict_affix{kanaBytes}_{sndx:02d}", items="jword, meaning")
+            if sharedStrings is not None:
+                items = c_strings([jword, meaning_value(meaning, meaningCodec)], sharedStrings)
+            else:
+                items = f"\"{utf8_escape(jword)}\", \"{meaning_literal(meaning, meaningCodec)}\""
+            out.emit(CHAR_LIST, name=f"dict_olist{kanaBytes}_{sndx:02d}", items=items)
+            out.emit(OKURI_MD, name=f"dict_okuri_md{kanaBytes}_{sndx:02d}", count=2,
+                     alist=f"dict_affix{kanaBytes}_{sndx:02d}", clist=f"dict_olist{kanaBytes}_{sndx:02d}")
+
+        # Now generate array of okurigana structures of same length as the word list.
+        okuriRefs = ', '.join([f"&dict_okuri_md{kanaBytes}_{ndx:02d}" for ndx in range(len(wordList))])
+        out.emit(OKURI_LIST, name=f"dict_okuri{kanaBytes}", items=okuriRefs)
+        out.emit(READING_MD, name=f"dictionary_md{kanaBytes}", count=len(wordList),
+                 olist=f"dict_okuri{kanaBytes}", klist="NULL")
+
+    emit_reading_index(out, "dictionary", keyInts, "md", indexMode)
+    # END OF DICTIONARY OUTPUT PROCESSING
+    return out.save(outPath)
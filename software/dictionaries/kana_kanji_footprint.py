@@ -0,0 +1,373 @@
+from kana_kanji_index import mph_bucket_count, eytzinger_depths
+
+# Flash footprint model of the generated C headers for the 32-bit ARM target
+# (RP2040, built by arm-none-eabi-gcc with -Os).  The data is never compiled
+# here, so sizes are estimated from the same DataFrames that the emitters
+# print from, mirroring the structures declared in the generated headers.
+
+# Width of a pointer, and of an enumeration.  The bare-metal ARM EABI uses
+# short enums, so affix_enum (five values) occupies a single byte.
+POINTER_SIZE = 4
+ENUM_SIZE = 1
+
+# (size, alignment) of each structure typedef in the generated headers.
+# typedef struct kanji_md {
+#   const uint16_t unicode;
+#   const uint16_t rank;
+#   const char* const meaning;
+# } kanji_md;                          // 8 bytes
+# typedef struct okuri_md {
+#   const uint8_t len;                 // 1 byte, padded to 4 for the pointer.
+#   const affix_enum * const alist;
+#   const char **clist;
+# } okuri_md;                          // 12 bytes
+# typedef struct reading_md {
+#   const uint16_t len;                // 2 bytes, padded to 4 for the pointer.
+#   const okuri_md * const * olist;
+#   const kanji_md * const * klist;
+# } reading_md;                        // 12 bytes
+# typedef struct bbt_node {
+#   const uint32_t key;
+#   const reading_md* md;
+#   const bbt_node * const lnode;
+#   const bbt_node * const rnode;
+# } bbt_node;                          // 16 bytes
+# typedef struct mph_index {
+#   const uint32_t salt;
+#   const uint16_t size;
+#   const uint16_t buckets;
+#   const uint16_t * const disp;
+#   const uint32_t * const keys;
+#   const reading_md * const * const rmds;
+# } mph_index;                         // 20 bytes
+# typedef struct eytzinger_index {
+#   const uint16_t size;               // 2 bytes, padded to 4 for the pointer.
+#   const uint32_t * const keys;
+#   const reading_md * const * const rmds;
+# } eytzinger_index;                   // 12 bytes
+# typedef struct kanji_reading {
+#   const uint16_t reading;
+#   const uint16_t posting;
+# } kanji_reading;                     // 4 bytes
+# typedef struct kanji_entry {
+#   const kanji_md * const kanji;
+#   const uint16_t readings;
+#   const uint16_t words;
+# } kanji_entry;                       // 8 bytes
+# typedef struct reverse_index {
+#   const uint32_t salt;
+#   const uint16_t size;
+#   const uint16_t buckets;
+#   ... seven pointers to the arrays.
+# } reverse_index;                     // 36 bytes
+# typedef struct trie_candidate {
+#   const uint16_t reading;
+#   const uint16_t posting;
+# } trie_candidate;                    // 4 bytes
+# typedef struct trie_node {
+#   const uint16_t candidates;
+#   const uint16_t child;
+#   const uint8_t children;
+#   const uint8_t count;
+# } trie_node;                         // 6 bytes
+# typedef struct prefix_trie {
+#   const uint16_t size;               // 2 bytes, padded to 4 for the pointer.
+#   ... five pointers to the arrays.
+# } prefix_trie;                       // 24 bytes
+STRUCT_LAYOUT = {
+    'kanji_md': (8, 4),
+    'okuri_md': (12, 4),
+    'reading_md': (12, 4),
+    'bbt_node': (16, 4),
+    'mph_index': (20, 4),
+    'eytzinger_index': (12, 4),
+    'kanji_reading': (4, 2),
+    'kanji_entry': (8, 4),
+    'reverse_index': (36, 4),
+    'trie_candidate': (4, 2),
+    'trie_node': (6, 2),
+    'prefix_trie': (24, 4),
+}
+
+class FlashLayout:
+    # Tally of the data objects of a generated header.  Objects are placed
+    # one after another, in the order they are emitted, each aligned to its
+    # alignment, so the alignment padding between them is counted as well.
+    # String literals are pooled: the compiler emits one copy of identical
+    # literals in a translation unit, and kdict.cpp includes every header.
+    # Arrays of non-const pointers (e.g. 'const char *list[]') are placed in
+    # .data, which costs flash for the initial values and the same in RAM.
+    # Headers included in the same translation unit share a stringPool, in
+    # which case a literal is counted against the first header that uses it.
+    # The strings of a pooled layout are in the string pool of kanji_ms.h
+    # (see kana_kanji_strings.py), so are not counted.
+    def __init__(self, name, stringPool=None, pooled=False):
+        self.name = name
+        self.pooled = pooled
+        self.offset = 0
+        self.padding = 0
+        self.ramBytes = 0
+        self.kindBytes = {}
+        self.kindCount = {}
+        self.strings = set() if stringPool is None else stringPool
+        self.bstNodes = 0
+        self.mphSlots = 0
+        self.eytzingerNodes = 0
+
+    def _tally(self, kind, size):
+        self.kindBytes[kind] = self.kindBytes.get(kind, 0) + size
+        self.kindCount[kind] = self.kindCount.get(kind, 0) + 1
+
+    def place(self, kind, size, align, ram=False):
+        if ram:
+            # .data objects are not interleaved with the .rodata objects.
+            self.ramBytes += size
+        else:
+            pad = -self.offset % align
+            self.padding += pad
+            self.offset += pad + size
+        self._tally(kind, size)
+
+    def place_struct(self, kind):
+        size, align = STRUCT_LAYOUT[kind]
+        self.place(kind, size, align)
+
+    def place_pointers(self, kind, count, ram=False):
+        self.place(kind, count * POINTER_SIZE, POINTER_SIZE, ram)
+
+    def place_string(self, text):
+        # A string literal with its terminating NUL.  Only the first copy of
+        # a literal occupies flash.
+        if self.pooled or text in self.strings:
+            return
+        self.strings.add(text)
+        size = len(text) if type(text) == bytes else len(text.encode('utf8'))
+        self._tally('string literal', size + 1)
+
+    def place_bst(self, count):
+        # The balanced BST of one node per reading, and the (non-const) root
+        # node pointer.
+        for ndx in range(count):
+            self.place_struct('bbt_node')
+        self.place_pointers('bbt_node *', 1, ram=True)
+        self.bstNodes = count
+
+    def place_mph(self, count):
+        # The minimal perfect hash tables: a 16-bit seed per bucket, and the
+        # key and reading metadata pointer of each slot, then the mph_index.
+        self.place('uint16_t[]', mph_bucket_count(count) * 2, 2)
+        self.place('uint32_t[]', count * 4, 4)
+        self.place_pointers('reading_md *[]', count)
+        self.place_struct('mph_index')
+        self.mphSlots = count
+
+    def place_eytzinger(self, count):
+        # The key and reading metadata pointer arrays in breadth-first order,
+        # then the eytzinger_index.  There are no child pointers.
+        self.place('uint32_t[]', count * 4, 4)
+        self.place_pointers('reading_md *[]', count)
+        self.place_struct('eytzinger_index')
+        self.eytzingerNodes = count
+
+    def place_index(self, count, indexMode='bst'):
+        if indexMode == 'mph':
+            self.place_mph(count)
+        elif indexMode == 'eytzinger':
+            self.place_eytzinger(count)
+        else:
+            self.place_bst(count)
+
+    def rodata(self):
+        # .rodata bytes, including the alignment padding but not the strings.
+        return self.offset
+
+    def total(self):
+        # Flash bytes: .rodata objects with padding, .data initial values,
+        # and the string literal pool.
+        return self.offset + self.ramBytes + self.kindBytes.get('string literal', 0)
+
+def bst_depths(count):
+    # Depth of each node of the balanced BST that print_balanced_bst() builds
+    # over count sorted keys, with the root at depth 0.  A search for a key
+    # present in the tree visits depth + 1 nodes.
+    depths = []
+    def visit(n, depth):
+        if n == 0:
+            return
+        mid = n // 2
+        depths.append(depth)
+        visit(mid, depth + 1)
+        visit(n - mid - 1, depth + 1)
+    visit(count, 0)
+    return depths
+
+def kanji_ms_footprint(df1Sort, stringPool=None, sharedStrings=None, meaningCodec=None):
+    # Model of kanji_ms.h.  The meaning strings are char arrays, not literals,
+    # so they are neither pooled nor padded (byte aligned at -Os).  With a
+    # string pool, the header is the single char array of the pool.  With a
+    # meaning codebook, the meanings are encoded, and the codebook precedes
+    # them.
+    layout = FlashLayout('kanji_ms.h', stringPool)
+    if meaningCodec is not None:
+        layout.place('uint16_t[]', 2 * (len(meaningCodec.expansions) + 1), 2)
+        layout.place('char[]', meaningCodec.tokens_size() + 1, 1)
+    if sharedStrings is not None:
+        layout.place('char[]', sharedStrings.size, 1)
+        return layout
+    for meaning in df1Sort['Meanings']:
+        data = meaning.encode('utf8') if meaningCodec is None else meaningCodec.encode(meaning)
+        layout.place('char[]', len(data) + 1, 1)
+    return layout
+
+def kanji_md_footprint(df1Sort, stringPool=None):
+    # Model of kanji_md.h, one kanji_md structure per Kanji.
+    layout = FlashLayout('kanji_md.h', stringPool)
+    for ndx in range(len(df1Sort)):
+        layout.place_struct('kanji_md')
+    return layout
+
+def onyomi_footprint(df2Sort, stringPool=None, indexMode='bst'):
+    # Model of the data emitted to onyomi.h by write_onyomi_header().
+    layout = FlashLayout('onyomi.h', stringPool)
+    anyAffix = df2Sort.any_affix()
+    for row in range(len(df2Sort)):
+        postings = df2Sort.readingStart[row + 1] - df2Sort.readingStart[row]
+        if anyAffix[row]:
+            for posting in range(postings):
+                layout.place('affix_enum[]', ENUM_SIZE, ENUM_SIZE)
+                layout.place_struct('okuri_md')
+            # const okuri_md * on_okuri<key>[] is not const, so is in .data.
+            layout.place_pointers('okuri_md *[]', postings, ram=True)
+        layout.place_pointers('kanji_md *[]', postings)
+        layout.place_struct('reading_md')
+
+    layout.place_index(len(df2Sort), indexMode)
+    return layout
+
+def kunyomi_footprint(df3Sort, stringPool=None, indexMode='bst', pooled=False):
+    # Model of the data emitted to kunyomi.h by write_kunyomi_header().
+    layout = FlashLayout('kunyomi.h', stringPool, pooled)
+    anyAffix = df3Sort.any_affix()
+    anyOkuri = df3Sort.any_okuri()
+    for row in range(len(df3Sort)):
+        postings = df3Sort.readingStart[row + 1] - df3Sort.readingStart[row]
+        if anyAffix[row] or anyOkuri[row]:
+            affixList, okuriList = df3Sort.sub_lists(row)
+            for affixes, okuris in zip(affixList, okuriList):
+                layout.place('affix_enum[]', len(affixes) * ENUM_SIZE, ENUM_SIZE)
+                for text in okuris:
+                    layout.place_string(text)
+                layout.place_pointers('char *[]', len(okuris), ram=True)
+                layout.place_struct('okuri_md')
+            layout.place_pointers('okuri_md *[]', postings)
+        layout.place_pointers('kanji_md *[]', postings)
+        layout.place_struct('reading_md')
+
+    layout.place_index(len(df3Sort), indexMode)
+    return layout
+
+def nanori_footprint(df4Sort, stringPool=None, indexMode='bst', pooled=False):
+    # Model of the data emitted to nanori.h by write_nanori_header().
+    layout = FlashLayout('nanori.h', stringPool, pooled)
+    anyOkuri = df4Sort.any_okuri()
+    for row in range(len(df4Sort)):
+        postings = df4Sort.readingStart[row + 1] - df4Sort.readingStart[row]
+        if anyOkuri[row]:
+            affixList, okuriList = df4Sort.sub_lists(row)
+            for okuris in okuriList:
+                for text in okuris:
+                    layout.place_string(text)
+                layout.place_pointers('char *[]', len(okuris), ram=True)
+                layout.place_struct('okuri_md')
+            layout.place_pointers('okuri_md *[]', postings)
+        layout.place_pointers('kanji_md *[]', postings)
+        layout.place_struct('reading_md')
+
+    layout.place_index(len(df4Sort), indexMode)
+    return layout
+
+def dictionary_footprint(df6Sort, stringPool=None, indexMode='bst', pooled=False, meaningCodec=None):
+    # Model of the data emitted to dictionary.h by write_dictionary_header().
+    layout = FlashLayout('dictionary.h', stringPool, pooled)
+    for words, meanings in zip(df6Sort['WordList'], df6Sort['MeaningList']):
+        for word, meaning in zip(words, meanings):
+            # const affix_enum dict_affix<key>_<n>[] = {jword, meaning};
+            layout.place('affix_enum[]', 2 * ENUM_SIZE, ENUM_SIZE)
+            # const char *dict_olist<key>_<n>[] = {"<word>", "<meaning>"};
+            layout.place_string(word)
+            layout.place_string(meaning if meaningCodec is None else meaningCodec.encode(meaning))
+            layout.place_pointers('char *[]', 2, ram=True)
+            # const okuri_md dict_okuri_md<key>_<n> = {2, ...};
+            layout.place_struct('okuri_md')
+
+        # const okuri_md * const dict_okuri<key>[] = {...};
+        layout.place_pointers('okuri_md *[]', len(words))
+        # const reading_md dictionary_md<key> = {...};
+        layout.place_struct('reading_md')
+
+    layout.place_index(len(df6Sort), indexMode)
+    return layout
+
+def kanji_index_footprint(index, stringPool=None):
+    # Model of the data emitted to kanji_index.h by write_kanji_index_header(),
+    # from its KanjiReverseIndex.
+    layout = FlashLayout('kanji_index.h', stringPool)
+    # const char * const kanji_index_kana[] = {"<kana>", ...};
+    for kana in index.kana:
+        layout.place_string(kana)
+    layout.place_pointers('char *[]', len(index.kana))
+    layout.place_pointers('reading_md *[]', len(index.rmds))
+    layout.place('kanji_reading[]', len(index.readingNumber) * STRUCT_LAYOUT['kanji_reading'][0],
+                 STRUCT_LAYOUT['kanji_reading'][1])
+    layout.place_pointers('okuri_md *[]', len(index.words))
+    # One entry per Kanji, and the entry ending the ranges.
+    layout.place('kanji_entry[]', (len(index.ucs) + 1) * STRUCT_LAYOUT['kanji_entry'][0],
+                 STRUCT_LAYOUT['kanji_entry'][1])
+    layout.place('uint16_t[]', len(index.mph.disp) * 2, 2)
+    layout.place('uint16_t[]', index.mph.size * 2, 2)
+    layout.place_struct('reverse_index')
+    layout.mphSlots = index.mph.size
+    return layout
+
+def kana_trie_footprint(trie):
+    # Model of the data emitted to kana_trie.h by write_kana_trie_header(),
+    # from its KanaTrie.  There are no strings.
+    layout = FlashLayout('kana_trie.h')
+    layout.place('uint8_t[]', len(trie), 1)
+    layout.place('uint8_t[]', len(trie), 1)
+    layout.place('trie_node[]', len(trie) * STRUCT_LAYOUT['trie_node'][0], STRUCT_LAYOUT['trie_node'][1])
+    layout.place('trie_candidate[]', len(trie.candidates) * STRUCT_LAYOUT['trie_candidate'][0],
+                 STRUCT_LAYOUT['trie_candidate'][1])
+    layout.place_pointers('reading_md *[]', len(trie.rmds))
+    layout.place_struct('prefix_trie')
+    return layout
+
+def print_footprint_report(layouts):
+    # Print the estimated flash footprint of each header, broken down by the
+    # kind of data object, followed by the depth statistics of its BST
+    # or Eytzinger array, or the size of its minimal perfect hash.
+    print("Estimated flash footprint of the generated headers (RP2040, -Os):")
+    print(f"  {'Header':<14}{'Flash':>10}{'.rodata':>10}{'Padding':>10}{'Strings':>10}{'.data/RAM':>11}")
+    for layout in layouts:
+        print(f"  {layout.name:<14}{layout.total():>10}{layout.rodata():>10}{layout.padding:>10}"
+              f"{layout.kindBytes.get('string literal', 0):>10}{layout.ramBytes:>11}")
+    print(f"  {'Total':<14}{sum(layout.total() for layout in layouts):>10}"
+          f"{sum(layout.rodata() for layout in layouts):>10}{sum(layout.padding for layout in layouts):>10}"
+          f"{sum(layout.kindBytes.get('string literal', 0) for layout in layouts):>10}"
+          f"{sum(layout.ramBytes for layout in layouts):>11}")
+
+    for layout in layouts:
+        print(f"  {layout.name}:")
+        for kind in sorted(layout.kindBytes, key=layout.kindBytes.get, reverse=True):
+            print(f"    {kind:<16}{layout.kindCount[kind]:>8} objects{layout.kindBytes[kind]:>10} bytes")
+        if layout.bstNodes:
+            depths = bst_depths(layout.bstNodes)
+            print(f"    BST of {layout.bstNodes} nodes: depth {max(depths) + 1}, "
+                  f"{sum(depths) / len(depths) + 1:.2f} nodes visited per successful search on average.")
+        if layout.mphSlots:
+            print(f"    Minimal perfect hash of {layout.mphSlots} slots in {mph_bucket_count(layout.mphSlots)} "
+                  f"buckets: 1 key compared per search.")
+        if layout.eytzingerNodes:
+            depths = eytzinger_depths(layout.eytzingerNodes)
+            print(f"    Eytzinger array of {layout.eytzingerNodes} keys: depth {max(depths) + 1}, "
+                  f"{sum(depths) / len(depths) + 1:.2f} keys compared per successful search on average.")
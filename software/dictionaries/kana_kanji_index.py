@@ -0,0 +1,173 @@
+# Alternative layouts of the reading indexes, replacing the balanced BST of
+# bbt_node structures.  Each reading set (onyomi, kunyomi, nanori, and
+# dictionary) is indexed by the 32-bit Murmur3 keys of its readings.  The
+# functions here build the tables that the header writers emit, and are the
+# Python reference for the lookups done by kdict.cpp.
+
+MASK32 = 0xffffffff
+GOLDEN32 = 0x9e3779b1
+
+def fmix32(h):
+    # Murmur3 32-bit finalizer, as at the end of murmur3_32() in kdict.cpp.
+    h ^= h >> 16
+    h = (h * 0x85ebca6b) & MASK32
+    h ^= h >> 13
+    h = (h * 0xc2b2ae35) & MASK32
+    h ^= h >> 16
+    return h
+
+# Minimal perfect hash (CHD, compress, hash, and displace).  The keys are
+# spread over buckets of about MPH_BUCKET_SIZE keys each, and every bucket
+# has a 16-bit displacement seed chosen so that its keys land on free slots
+# of a table with exactly one slot per key:
+#   bucket = (key ^ salt) % buckets
+#   slot = fmix32(key ^ (disp[bucket] * GOLDEN32)) % size
+# The key held in the slot is compared with the searched key, so a reading
+# that is not in the set is rejected.  The salt is only changed from 0 if
+# some bucket cannot be placed with any seed.
+MPH_BUCKET_SIZE = 4
+MPH_SEEDS = 1 << 16
+MPH_SALTS = 16
+
+def mph_bucket_count(size):
+    return max(1, (size + MPH_BUCKET_SIZE - 1) // MPH_BUCKET_SIZE)
+
+def mph_bucket(key, salt, buckets):
+    return (key ^ salt) % buckets
+
+def mph_slot(key, seed, size):
+    return fmix32(key ^ ((seed * GOLDEN32) & MASK32)) % size
+
+class MinimalPerfectHash:
+    # The tables of a minimal perfect hash over a list of unique keys.
+    # slotKeys holds the key in each slot, and slotIndex its position in the
+    # list of keys, so that the reading metadata can be placed to match.
+    def __init__(self, keys):
+        self.size = len(keys)
+        self.buckets = mph_bucket_count(self.size)
+        for attempt in range(MPH_SALTS):
+            self.salt = (attempt * GOLDEN32) & MASK32
+            if self._place(keys):
+                return
+        raise ValueError(f"No minimal perfect hash found for {self.size} keys.")
+
+    def _place(self, keys):
+        bucketKeys = [[] for ndx in range(self.buckets)]
+        for ndx, key in enumerate(keys):
+            bucketKeys[mph_bucket(key, self.salt, self.buckets)].append(ndx)
+
+        self.disp = [0] * self.buckets
+        self.slotIndex = [None] * self.size
+        # Place the largest buckets first, while most of the slots are free.
+        for bucket in sorted(range(self.buckets), key=lambda b: len(bucketKeys[b]), reverse=True):
+            members = bucketKeys[bucket]
+            if not members:
+                break
+            for seed in range(MPH_SEEDS):
+                slots = {mph_slot(keys[ndx], seed, self.size) for ndx in members}
+                if len(slots) == len(members) and all(self.slotIndex[slot] is None for slot in slots):
+                    for ndx in members:
+                        self.slotIndex[mph_slot(keys[ndx], seed, self.size)] = ndx
+                    self.disp[bucket] = seed
+                    break
+            else:
+                return False
+
+        self.slotKeys = [keys[ndx] for ndx in self.slotIndex]
+        return True
+
+    def lookup(self, key):
+        # Reference of get_reading_mph() in kdict.cpp.  Returns the position
+        # in the list of keys, or None if the key is not in the set.
+        seed = self.disp[mph_bucket(key, self.salt, self.buckets)]
+        slot = mph_slot(key, seed, self.size)
+        if self.slotKeys[slot] == key:
+            return self.slotIndex[slot]
+        return None
+
+    def verify(self, keys):
+        # Every key must resolve to its own position.
+        for ndx, key in enumerate(keys):
+            if self.lookup(key) != ndx:
+                raise ValueError(f"Minimal perfect hash lookup of key {key:#x} failed.")
+
+# Eytzinger layout: the keys of a complete binary search tree stored in
+# breadth-first order in one array, with the children of position i at
+# 2i+1 and 2i+2, so that no child pointers are needed.  The search walks
+# one contiguous array from the front, which the RP2040 XIP cache favours
+# over bbt_node structures spread through flash.
+def eytzinger_order(sortedKeys):
+    # Fill the positions in an in-order walk of the implicit tree, so that
+    # an in-order walk of the array gives back the sorted keys.
+    eytKeys = [None] * len(sortedKeys)
+    source = iter(sortedKeys)
+    def fill(pos):
+        if pos < len(eytKeys):
+            fill(2 * pos + 1)
+            eytKeys[pos] = next(source)
+            fill(2 * pos + 2)
+    fill(0)
+    return eytKeys
+
+def eytzinger_search(eytKeys, key):
+    # Reference of get_reading_eytzinger() in kdict.cpp.  Returns the
+    # position of the key, or None, and the number of keys compared.
+    pos = 0
+    visits = 0
+    while pos < len(eytKeys):
+        visits += 1
+        if key == eytKeys[pos]:
+            return pos, visits
+        pos = 2 * pos + 1 + (key > eytKeys[pos])
+    return None, visits
+
+def bst_search(sortedKeys, key):
+    # Model of get_reading() over the tree that print_balanced_bst() emits,
+    # whose root is the middle key, sortedKeys[len // 2], of each sub-list.
+    # Returns the index of the key in sortedKeys, or None, and the number of
+    # nodes visited.
+    lo = 0
+    hi = len(sortedKeys)
+    visits = 0
+    while lo < hi:
+        mid = lo + (hi - lo) // 2
+        visits += 1
+        if key == sortedKeys[mid]:
+            return mid, visits
+        if key < sortedKeys[mid]:
+            hi = mid
+        else:
+            lo = mid + 1
+    return None, visits
+
+def eytzinger_inorder(eytKeys):
+    keys = []
+    def walk(pos):
+        if pos < len(eytKeys):
+            walk(2 * pos + 1)
+            keys.append(eytKeys[pos])
+            walk(2 * pos + 2)
+    walk(0)
+    return keys
+
+def verify_eytzinger(sortedKeys, eytKeys):
+    # The Eytzinger array must hold the keys of the balanced BST in the same
+    # (ascending) in-order sequence, and both searches must agree on every
+    # key and on the keys just either side of it, which are not in the set
+    # unless they are its neighbours.
+    if eytzinger_inorder(eytKeys) != list(sortedKeys):
+        raise ValueError("Eytzinger array is not in the order of the balanced BST keys.")
+    keySet = set(sortedKeys)
+    for key in sortedKeys:
+        for probe in (key, (key - 1) & MASK32, (key + 1) & MASK32):
+            bstIndex, bstVisits = bst_search(sortedKeys, probe)
+            eytPos, eytVisits = eytzinger_search(eytKeys, probe)
+            bstKey = None if bstIndex is None else sortedKeys[bstIndex]
+            eytKey = None if eytPos is None else eytKeys[eytPos]
+            if bstKey != eytKey or (eytKey is None and probe in keySet):
+                raise ValueError(f"Eytzinger search of key {probe:#x} differs from the BST search.")
+
+def eytzinger_depths(count):
+    # Depth of each position of an Eytzinger array of count keys, with the
+    # root at depth 0.  A search for a key present visits depth + 1 keys.
+    return [(pos + 1).bit_length() - 1 for pos in range(count)]
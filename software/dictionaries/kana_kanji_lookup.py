@@ -0,0 +1,240 @@
+import argparse
+import os
+import time
+from collections import OrderedDict, namedtuple
+from kana_kanji_dictionary import DEFAULT_MAX_RANK, DictionaryBuild
+from kana_kanji_replay import load_corpus_readings
+
+# Desktop lookup of the generated dictionaries.  The reading sets are held in
+# memory as the generator builds them (the onyomi, kunyomi, and nanori posting
+# lists, and the dictionary readings), and are queried by reading, as
+# kdict.cpp queries the headers, so that candidate lists can be prototyped
+# and tested on a host without the C headers.  Results are immutable tuples,
+# kept in an LRU cache of the most recent queries.
+#
+#   lookup_onyomi(), lookup_kunyomi(), lookup_nanori() - The Kanji of a
+#       reading, in klist order (by rank), with their affixes and okurigana.
+#       Onyomi are in Katakana, and may be queried in Hiragana, as make_key()
+#       moves Hiragana up to Katakana for an onyomi key.
+#   lookup_word() - The dictionary words of a reading, in olist order.
+#   candidates() - The list build_kanji_list_data() builds for a reading: the
+#       dictionary words, then the Kanji of the three reading sets merged by
+#       rank, a tie going to the kunyomi, then the onyomi.
+#   lookup_batch() - Any of the above for a list of readings, each distinct
+#       reading being looked up once.
+
+KanjiCandidate = namedtuple('KanjiCandidate', ['kanji', 'ucs', 'rank', 'meaning', 'affixes', 'okurigana'])
+WordCandidate = namedtuple('WordCandidate', ['word', 'meaning', 'rank'])
+
+# The reading sets, in the order build_kanji_list_data() breaks rank ties.
+KANJI_SETS = ['kunyomi', 'onyomi', 'nanori']
+DEFAULT_CACHE_SIZE = 16384
+
+def onyomi_kana(kana):
+    # Hiragana moved up to the Katakana of the onyomi.
+    return ''.join([chr(ord(char) + 0x60) if 0x3041 <= ord(char) < 0x30a0 else char for char in kana])
+
+class LruCache:
+    # The results of the maxSize most recently used keys.  A maxSize of 0
+    # disables the cache.
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        # Returns whether the key was found, and its value.
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True, self.entries[key]
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        if self.maxSize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        return self.hits / max(self.hits + self.misses, 1)
+
+class DictionaryLookup:
+    # Built from the sorted Kanji table, the onyomi, kunyomi, and nanori
+    # posting lists, and the dictionary readings, as DictionaryBuild makes
+    # them, so the candidates are those written to the headers.
+    def __init__(self, df1Sort, df2Sort, df3Sort, df4Sort, df6Sort, cacheSize=DEFAULT_CACHE_SIZE):
+        self.meaningOf = {int(ucs, 16): meaning for ucs, meaning in zip(df1Sort['UCS'], df1Sort['Meanings'])}
+        self.readingSets = dict(onyomi=df2Sort, kunyomi=df3Sort, nanori=df4Sort)
+        self.readingRow = {setName: {reading: row for row, reading in enumerate(postingLists.readings)}
+                           for setName, postingLists in self.readingSets.items()}
+        self.wordRow = {reading: row for row, reading in enumerate(df6Sort['Reading'])}
+        self.wordLists = list(df6Sort['WordList'])
+        self.meaningLists = list(df6Sort['MeaningList'])
+        self.rankLists = list(df6Sort['RankList'])
+        self.cache = LruCache(cacheSize)
+
+    @classmethod
+    def from_build(cls, build, cacheSize=DEFAULT_CACHE_SIZE):
+        # From the tables of a DictionaryBuild, built or loaded from its stage
+        # cache as needed.
+        return cls(build.kanji_table(), *build.readings()[0], build.dictionary_readings(), cacheSize)
+
+    def _kanji(self, setName, reading):
+        row = self.readingRow[setName].get(reading)
+        if row is None:
+            return ()
+        postingLists = self.readingSets[setName]
+        postings = range(postingLists.readingStart[row], postingLists.readingStart[row + 1])
+        affixList, okuriList = postingLists.sub_lists(row)
+        return tuple([KanjiCandidate(chr(postingLists.ucs[posting]), int(postingLists.ucs[posting]),
+                                     int(postingLists.rank[posting]),
+                                     self.meaningOf[int(postingLists.ucs[posting])], tuple(affixes),
+                                     tuple(okuris))
+                      for posting, affixes, okuris in zip(postings, affixList, okuriList)])
+
+    def _words(self, reading):
+        row = self.wordRow.get(reading)
+        if row is None:
+            return ()
+        return tuple([WordCandidate(word, meaning, int(rank)) for word, meaning, rank
+                      in zip(self.wordLists[row], self.meaningLists[row], self.rankLists[row])])
+
+    def _candidates(self, reading):
+        # Merge as build_kanji_list_data() does, taking the head of the set
+        # of strictly lowest rank, in KANJI_SETS order.
+        lists = {setName: self._kanji(setName, onyomi_kana(reading) if setName == 'onyomi' else reading)
+                 for setName in KANJI_SETS}
+        merged = [('dictionary', word) for word in self._words(reading)]
+        heads = dict.fromkeys(KANJI_SETS, 0)
+        while True:
+            lowestSet = None
+            for setName in KANJI_SETS:
+                if heads[setName] < len(lists[setName]):
+                    if lowestSet is None or \
+                            lists[setName][heads[setName]].rank < lists[lowestSet][heads[lowestSet]].rank:
+                        lowestSet = setName
+            if lowestSet is None:
+                return tuple(merged)
+            merged.append((lowestSet, lists[lowestSet][heads[lowestSet]]))
+            heads[lowestSet] += 1
+
+    def lookup(self, setName, reading):
+        # The candidates of a reading in a set ('onyomi', 'kunyomi', 'nanori',
+        # 'dictionary', or 'all' for candidates()).  Only the result of the
+        # query is cached, not the set lookups candidates() is merged from.
+        if setName == 'onyomi':
+            reading = onyomi_kana(reading)
+        key = (setName, reading)
+        found, result = self.cache.get(key)
+        if found:
+            return result
+        if setName == 'dictionary':
+            result = self._words(reading)
+        elif setName == 'all':
+            result = self._candidates(reading)
+        elif setName in self.readingSets:
+            result = self._kanji(setName, reading)
+        else:
+            raise ValueError(f"Unknown reading set {setName!r}.")
+        self.cache.put(key, result)
+        return result
+
+    def lookup_onyomi(self, reading):
+        return self.lookup('onyomi', reading)
+
+    def lookup_kunyomi(self, reading):
+        return self.lookup('kunyomi', reading)
+
+    def lookup_nanori(self, reading):
+        return self.lookup('nanori', reading)
+
+    def lookup_word(self, reading):
+        return self.lookup('dictionary', reading)
+
+    def candidates(self, reading):
+        return self.lookup('all', reading)
+
+    def lookup_batch(self, readings, setName='all'):
+        # The results of a list of readings, in order.
+        results = {reading: self.lookup(setName, reading) for reading in dict.fromkeys(readings)}
+        return [results[reading] for reading in readings]
+
+def benchmark(lookup, readings, repeat=3):
+    # Queries per second of candidates() over the readings, without the
+    # cache, then repeated with it, then as one batch per pass.  Returns
+    # (mode, queries, seconds, hit rate) of each.
+    report = []
+    cacheSize = lookup.cache.maxSize
+    for mode in ['uncached', 'cached', 'batch']:
+        lookup.cache = LruCache(0 if mode == 'uncached' else cacheSize)
+        start = time.perf_counter()
+        for ndx in range(repeat):
+            if mode == 'batch':
+                lookup.lookup_batch(readings)
+            else:
+                for reading in readings:
+                    lookup.candidates(reading)
+        report.append((mode, repeat * len(readings), time.perf_counter() - start,
+                       lookup.cache.hit_rate() if mode != 'uncached' else None))
+    lookup.cache = LruCache(cacheSize)
+    return report
+
+def print_benchmark_report(report, corpusName, cacheSize):
+    print(f"Lookup throughput of {corpusName} readings (candidates(), LRU cache of {cacheSize} results):")
+    print(f"  {'Mode':<10}{'Queries':>9}{'Seconds':>9}{'Queries/s':>11}{'Hit %':>7}")
+    for mode, queries, seconds, hitRate in report:
+        hits = f"{100 * hitRate:.1f}" if hitRate is not None else '-'
+        print(f"  {mode:<10}{queries:>9}{seconds:>9.3f}{queries / max(seconds, 1e-9):>11.0f}{hits:>7}")
+    print("  A cached query of a reading seen before is one dictionary lookup.  Passes over the corpus")
+    print("  are a cyclic scan, the worst case of an LRU cache, so a cache smaller than the distinct")
+    print("  readings of the corpus misses every query.  A batch looks up each distinct reading once.")
+
+def print_candidates(lookup, reading):
+    print(f"{reading}:")
+    for setName, candidate in lookup.candidates(reading):
+        if setName == 'dictionary':
+            print(f"  {setName:<11}{candidate.word} ({candidate.rank}) {candidate.meaning}")
+        else:
+            okurigana = ', '.join([text for text in candidate.okurigana if text])
+            print(f"  {setName:<11}{candidate.kanji} ({candidate.rank}){' ' + okurigana if okurigana else ''} "
+                  f"{candidate.meaning}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Look up readings in the generated dictionaries, or measure "
+                                                 "the lookup throughput over a corpus of readings.")
+    parser.add_argument('--input', default='.', help="directory of the source files (default: .)")
+    parser.add_argument('--max-rank', type=int, default=DEFAULT_MAX_RANK,
+                        help=f"largest word frequency rank kept in dictionary.h (default: {DEFAULT_MAX_RANK})")
+    parser.add_argument('--drop-unsupported-words', action='store_true',
+                        help="drop words using Kanji outside of the supported subset")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                        help=f"results kept in the LRU cache (default: {DEFAULT_CACHE_SIZE})")
+    parser.add_argument('--query', nargs='+', metavar='READING', help="print the candidates of these readings")
+    parser.add_argument('--corpus', default='./Core10k.csv', help="tab separated word list to benchmark with")
+    parser.add_argument('--column', default='Reading', help="column of the readings in the corpus")
+    parser.add_argument('--repeat', type=int, default=3, help="passes over the corpus (default: 3)")
+    args = parser.parse_args()
+
+    lookup = DictionaryLookup.from_build(DictionaryBuild(args.input, maxRank=args.max_rank,
+                                                         dropUnsupportedWords=args.drop_unsupported_words),
+                                         args.cache_size)
+    if args.query:
+        for reading in args.query:
+            print_candidates(lookup, reading)
+    else:
+        print_benchmark_report(benchmark(lookup, load_corpus_readings(args.corpus, args.column), args.repeat),
+                               os.path.basename(args.corpus), args.cache_size)
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+# Compact posting lists of the onyomi, kunyomi, and nanori cross references.
+# Rather than Python lists in object DataFrame cells, a reading set is held
+# in compressed sparse row form:
+#   readings      - The readings, in ascending order.
+#   readingStart  - Postings readingStart[r]:readingStart[r + 1] are those
+#                   of reading r, one per Kanji with the reading, in order
+#                   of frequency rank.
+#   rank, ucs     - The Novel 5K rank and Unicode value of each posting.
+#   subStart      - Sub-postings subStart[p]:subStart[p + 1] are the affix
+#                   and okurigana of posting p.  A Kanji with a kunyomi more
+#                   than once has a sub-posting for each.
+#   affix, okuri  - The affix code of each sub-posting, and its okurigana as
+#                   an index of okuriText, the distinct okurigana.
+# Affix codes are in the order of the names, as are the okurigana indexes,
+# the okurigana being sorted.
+AFFIXES = ['none', 'prefix', 'suffix']
+AFFIX_CODES = {name: code for code, name in enumerate(AFFIXES)}
+
+def sorted_codes(values):
+    # The index of each value in the sorted distinct values, and those values.
+    # The values are hashed, so only the distinct values are compared.
+    codes, uniques = pd.factorize(np.array(values, dtype=object), sort=True)
+    return codes.astype(np.int32), list(uniques)
+
+def rank_order(readingOf, rank, ucs):
+    # The order of the entries of a reading set, shared by the reading sets:
+    # by reading, then by rank, then by Unicode value, then in the order
+    # they were found.  Every key is an integer array, so a single stable
+    # lexsort orders all of the postings of all of the readings, and ties
+    # are broken the same way whatever the input order of the readings.
+    return np.lexsort((np.arange(len(rank)), ucs, rank, readingOf))
+
+class PostingLists:
+    # Built from one entry per reading of a Kanji, in the order they are
+    # found.  With mergeKanji, the entries of a Kanji for the same reading are
+    # the sub-postings of one posting, in the order they were found, and
+    # otherwise each entry is a posting.  The postings are ordered by
+    # rank_order().
+    def __init__(self, readings, rank, ucs, affix=None, okuri=None, mergeKanji=False):
+        count = len(readings)
+        readingOf, self.readings = sorted_codes(readings)
+        rank = np.array(rank, dtype=np.int32)
+        ucs = np.array(ucs, dtype=np.uint32)
+        affix = np.array([AFFIX_CODES[name] for name in affix] if affix is not None else [0] * count,
+                         dtype=np.uint8)
+        if okuri is not None:
+            okuriOf, self.okuriText = sorted_codes(okuri)
+        else:
+            okuriOf, self.okuriText = np.zeros(count, dtype=np.int32), ['']
+
+        order = rank_order(readingOf, rank, ucs)
+        readingOf = readingOf[order]
+        ucs = ucs[order]
+        self.affix = affix[order]
+        self.okuri = okuriOf[order]
+        # A posting starts at each entry, or, with mergeKanji, at each change
+        # of reading or Kanji, the entries of a Kanji being adjacent.
+        newPosting = np.ones(count, dtype=bool)
+        if mergeKanji and count:
+            newPosting[1:] = (readingOf[1:] != readingOf[:-1]) | (ucs[1:] != ucs[:-1])
+        postingHead = np.flatnonzero(newPosting)
+        self.subStart = np.r_[postingHead, count].astype(np.int32)
+        self.rank = rank[order][postingHead]
+        self.ucs = ucs[postingHead]
+        self.readingStart = np.searchsorted(readingOf[postingHead],
+                                            np.arange(len(self.readings) + 1)).astype(np.int32)
+
+    def __len__(self):
+        return len(self.readings)
+
+    def posting_count(self):
+        return len(self.ucs)
+
+    def reading_of_subs(self):
+        # The reading of each sub-posting.
+        return np.repeat(np.arange(len(self)), np.diff(self.subStart[self.readingStart]))
+
+    def any_affix(self):
+        # Whether each reading has a sub-posting with an affix other than none.
+        return np.bincount(self.reading_of_subs(), weights=self.affix != 0, minlength=len(self)) > 0
+
+    def any_okuri(self):
+        # Whether each reading has a sub-posting with okurigana.
+        empty = self.okuriText.index('') if '' in self.okuriText else -1
+        return np.bincount(self.reading_of_subs(), weights=self.okuri != empty, minlength=len(self)) > 0
+
+    def ucs_list(self, row):
+        # The Unicode values of the Kanji of a reading, as upper case hex.
+        return [f"{ucs:X}" for ucs in self.ucs[self.readingStart[row]:self.readingStart[row + 1]]]
+
+    def sub_lists(self, row):
+        # The affix names and okurigana of each posting of a reading.
+        affixes = []
+        okuris = []
+        for posting in range(self.readingStart[row], self.readingStart[row + 1]):
+            subs = slice(self.subStart[posting], self.subStart[posting + 1])
+            affixes.append([AFFIXES[code] for code in self.affix[subs]])
+            okuris.append([self.okuriText[ndx] for ndx in self.okuri[subs]])
+        return affixes, okuris
+
+    def reading_okurigana(self, row):
+        # The okurigana of every sub-posting of a reading, in order.
+        subs = slice(self.subStart[self.readingStart[row]], self.subStart[self.readingStart[row + 1]])
+        return [self.okuriText[ndx] for ndx in self.okuri[subs]]
+
+    def nbytes(self):
+        # Memory held by the arrays and strings.
+        arrays = [self.readingStart, self.rank, self.ucs, self.subStart, self.affix, self.okuri]
+        return (sum(array.nbytes for array in arrays) +
+                sum(len(text.encode('utf8')) + 1 for text in self.readings + self.okuriText))
@@ -0,0 +1,89 @@
+import json
+import time
+import tracemalloc
+import pandas as pd
+from kana_kanji_postings import PostingLists
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the peak RSS is not reported.
+    resource = None
+
+# Timing and memory profile of the stages of the dictionary generator.  Each
+# stage run through the StageCache is measured for wall time, CPU time of the
+# process running it, and the rows of the tables it is given and returns.
+# The peak resident set size of that process so far is also recorded, and, if
+# traceMemory is set, the peak of the memory allocated by Python during the
+# stage (tracemalloc, which slows the stages down noticeably).  A stage loaded
+# from the stage cache is recorded as cached, with the time taken to load it.
+
+def count_rows(value):
+    # Rows (readings of posting lists) of the DataFrames in a value, or in a
+    # tuple or list of values.
+    if isinstance(value, (pd.DataFrame, PostingLists)):
+        return len(value)
+    if isinstance(value, (tuple, list)):
+        return sum(count_rows(item) for item in value)
+    return 0
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(func, args, traceMemory=False):
+    # Call func(*args), returning its result and the measurements.  Runs in
+    # the worker process when the stage is run by an executor.
+    startedTracing = traceMemory and not tracemalloc.is_tracing()
+    if startedTracing:
+        tracemalloc.start()
+    wallStart = time.perf_counter()
+    cpuStart = time.process_time()
+    result = func(*args)
+    metrics = dict(wall=time.perf_counter() - wallStart, cpu=time.process_time() - cpuStart,
+                   peakTracedMb=None, peakRssMb=peak_rss_mb(),
+                   rowsIn=count_rows(list(args)), rowsOut=count_rows(result))
+    if startedTracing:
+        metrics['peakTracedMb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return result, metrics
+
+class StageProfiler:
+    def __init__(self, traceMemory=False):
+        self.traceMemory = traceMemory
+        self.records = []
+        self.start = time.perf_counter()
+
+    def add(self, name, metrics, cached=False):
+        self.records.append(dict(stage=name, cached=cached, **metrics))
+
+    def call(self, name, func, args):
+        # Run and record a step that is not cached.
+        result, metrics = measure(func, args, self.traceMemory)
+        self.add(name, metrics)
+        return result
+
+    def loaded(self, name, seconds, result=None):
+        # Record a stage loaded from the stage cache.
+        self.add(name, dict(wall=seconds, cpu=None, peakTracedMb=None, peakRssMb=peak_rss_mb(),
+                            rowsIn=None, rowsOut=count_rows(result)), cached=True)
+
+    def write_json(self, outPath):
+        report = dict(totalWall=time.perf_counter() - self.start, traceMemory=self.traceMemory,
+                      peakRssMb=peak_rss_mb(), stages=self.records)
+        with open(outPath, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    def print_summary(self):
+        def number(value, form):
+            return format(value, form) if value is not None else '-'
+        print("Stage profile:")
+        print(f"  {'Stage':<20}{'Cached':>7}{'Wall s':>9}{'CPU s':>9}{'Traced MB':>11}{'RSS MB':>9}"
+              f"{'Rows in':>9}{'Rows out':>9}")
+        for record in self.records:
+            print(f"  {record['stage']:<20}{'yes' if record['cached'] else 'no':>7}"
+                  f"{number(record['wall'], '.3f'):>9}{number(record['cpu'], '.3f'):>9}"
+                  f"{number(record['peakTracedMb'], '.1f'):>11}{number(record['peakRssMb'], '.1f'):>9}"
+                  f"{number(record['rowsIn'], 'd'):>9}{number(record['rowsOut'], 'd'):>9}")
+        print(f"  {'Total':<20}{'':>7}{time.perf_counter() - self.start:>9.3f}")
@@ -0,0 +1,227 @@
+import argparse
+import os
+import re
+import time
+import pandas as pd
+from kana_kanji_index import MASK32, fmix32, mph_bucket, mph_slot
+
+# Host-side reference model of the reading lookup in kdict.cpp.  The indexes
+# are loaded from the generated headers (in whichever layout they were
+# written: balanced BST, minimal perfect hash, or Eytzinger array), and a
+# corpus of readings is replayed through make_key(), murmur3_32(), and the
+# search of each index, counting the nodes (keys) visited, so that index
+# layouts can be compared without flashing the RP2040.
+
+# The reading sets in the order build_kanji_list_data() looks them up, and
+# whether make_key() is called with onyomiKey set.
+READING_SETS = [('kunyomi', False), ('onyomi', True), ('nanori', False), ('dictionary', False)]
+
+# make_key() builds the key bytes in a uint8_t key[20] array.
+MAX_KANA = 20
+
+def murmur_32_scramble(k):
+    k = (k * 0xcc9e2d51) & MASK32
+    k = ((k << 15) | (k >> 17)) & MASK32
+    return (k * 0x1b873593) & MASK32
+
+def murmur3_32(key, seed=0):
+    # murmur3_32() of kdict.cpp, reading the blocks of four bytes little
+    # endian as memcpy() does on the RP2040.  The length is a uint8_t.
+    h = seed
+    blockEnd = len(key) & ~3
+    for ndx in range(0, blockEnd, 4):
+        h ^= murmur_32_scramble(int.from_bytes(key[ndx:ndx + 4], 'little'))
+        h = ((h << 13) | (h >> 19)) & MASK32
+        h = (h * 5 + 0xe6546b64) & MASK32
+    k = 0
+    for byte in reversed(key[blockEnd:]):
+        k = (k << 8) | byte
+    h ^= murmur_32_scramble(k)
+    h ^= len(key) & 0xff
+    return fmix32(h)
+
+def make_key(kanaList, onyomiKey):
+    # make_key() of kdict.cpp: the lowest byte of the Unicode value of each
+    # Kana, with Hiragana moved up to the Katakana bytes for an onyomi key.
+    key = bytearray()
+    for kana in kanaList:
+        lowHex = kana & 0x00ff
+        if onyomiKey and lowHex < 0x00a0:
+            lowHex += 0x0060
+        key.append(lowHex & 0xff)
+    return murmur3_32(bytes(key), 0)
+
+class BstIndex:
+    # The bbt_node structures of a header, by key, and the root node.
+    layout = 'bst'
+
+    def __init__(self, nodes, root):
+        self.nodes = nodes
+        self.root = root
+        self.size = len(nodes)
+
+    def keys(self):
+        return list(self.nodes)
+
+    def search(self, key):
+        # get_reading(): returns whether the key was found, and the number
+        # of nodes visited.
+        node = self.root
+        visits = 0
+        while node is not None:
+            visits += 1
+            if key == node:
+                return True, visits
+            lNode, rNode = self.nodes[node]
+            node = lNode if key < node else rNode
+        return False, visits
+
+class MphIndex:
+    # The minimal perfect hash tables of a header.
+    layout = 'mph'
+
+    def __init__(self, salt, buckets, disp, slotKeys):
+        self.salt = salt
+        self.buckets = buckets
+        self.disp = disp
+        self.slotKeys = slotKeys
+        self.size = len(slotKeys)
+
+    def keys(self):
+        return list(self.slotKeys)
+
+    def search(self, key):
+        # get_reading_mph(): one key compared.
+        seed = self.disp[mph_bucket(key, self.salt, self.buckets)]
+        return self.slotKeys[mph_slot(key, seed, self.size)] == key, 1
+
+class EytzingerIndex:
+    # The breadth-first key array of a header.
+    layout = 'eytzinger'
+
+    def __init__(self, eytKeys):
+        self.eytKeys = eytKeys
+        self.size = len(eytKeys)
+
+    def keys(self):
+        return list(self.eytKeys)
+
+    def search(self, key):
+        # get_reading_eytzinger().
+        pos = 0
+        visits = 0
+        while pos < self.size:
+            visits += 1
+            if key == self.eytKeys[pos]:
+                return True, visits
+            pos = 2 * pos + 1 + (key > self.eytKeys[pos])
+        return False, visits
+
+BBT_NODE_RE = re.compile(r'const bbt_node (\w+)_node(0x[0-9a-f]+) \{0x[0-9a-f]+, &\w+, '
+                         r'(?:&\w+_node(0x[0-9a-f]+)|NULL), (?:&\w+_node(0x[0-9a-f]+)|NULL)\};')
+ROOT_NODE_RE = re.compile(r'const bbt_node \*(\w+)_root_node = &\w+_node(0x[0-9a-f]+);')
+UINT_ARRAY_RE = re.compile(r'const uint(?:16|32)_t (\w+)_(disp|keys)\[\] = \{([^}]*)\};')
+MPH_INDEX_RE = re.compile(r'const mph_index (\w+)_index = \{(0x[0-9a-f]+), (\d+), (\d+),')
+EYTZINGER_INDEX_RE = re.compile(r'const eytzinger_index (\w+)_index = \{(\d+),')
+
+def hex_or_none(text):
+    return int(text, 16) if text else None
+
+def load_reading_index(headerPath, prefix):
+    # Load the index of a reading set from its generated header, detecting
+    # the layout it was written in.
+    with open(headerPath, encoding='utf8') as f:
+        text = f.read()
+    arrays = {}
+    for name, kind, items in UINT_ARRAY_RE.findall(text):
+        if name == prefix:
+            arrays[kind] = [int(item, 16) for item in items.replace('\n', '').split(',') if item.strip()]
+
+    for name, salt, size, buckets in MPH_INDEX_RE.findall(text):
+        if name == prefix:
+            return MphIndex(int(salt, 16), int(buckets), arrays['disp'], arrays['keys'])
+    for name, size in EYTZINGER_INDEX_RE.findall(text):
+        if name == prefix:
+            return EytzingerIndex(arrays['keys'])
+
+    nodes = {}
+    for name, key, lNode, rNode in BBT_NODE_RE.findall(text):
+        if name == prefix:
+            nodes[int(key, 16)] = (hex_or_none(lNode), hex_or_none(rNode))
+    for name, root in ROOT_NODE_RE.findall(text):
+        if name == prefix:
+            return BstIndex(nodes, int(root, 16))
+    raise ValueError(f"No {prefix} reading index found in {headerPath}.")
+
+def load_reading_indexes(headerDir):
+    return {prefix: load_reading_index(os.path.join(headerDir, f"{prefix}.h"), prefix)
+            for prefix, onyomiKey in READING_SETS}
+
+def load_corpus_readings(corpusPath, column='Reading'):
+    # The readings of a tab separated word list, such as Core10k.csv.
+    dfCorpus = pd.read_csv(corpusPath, sep='\t')
+    return [reading for reading in dfCorpus[column] if type(reading) == str and reading]
+
+def index_depths(index):
+    # Visits of a successful search for every key of the index.
+    depths = []
+    for key in index.keys():
+        found, visits = index.search(key)
+        if not found:
+            raise ValueError(f"Key {key:#x} of the {index.layout} index is not found by its search.")
+        depths.append(visits)
+    return depths
+
+def replay(indexes, readings):
+    # Look up every reading in every index, as build_kanji_list_data() does.
+    # Returns the statistics of each reading set.
+    stats = {}
+    for prefix, onyomiKey in READING_SETS:
+        index = indexes[prefix]
+        depths = index_depths(index)
+        entry = dict(layout=index.layout, size=index.size, lookups=0, hits=0, visits=0, hitVisits=0,
+                     worstVisits=0, tooLong=0, depthMean=sum(depths) / max(len(depths), 1),
+                     depthWorst=max(depths, default=0))
+        start = time.perf_counter()
+        for reading in readings:
+            kanaList = [ord(kana) for kana in reading]
+            if len(kanaList) > MAX_KANA:
+                # Would overflow the key[] buffer of make_key().
+                entry['tooLong'] += 1
+                continue
+            found, visits = index.search(make_key(kanaList, onyomiKey))
+            entry['lookups'] += 1
+            entry['visits'] += visits
+            entry['worstVisits'] = max(entry['worstVisits'], visits)
+            if found:
+                entry['hits'] += 1
+                entry['hitVisits'] += visits
+        entry['seconds'] = time.perf_counter() - start
+        stats[prefix] = entry
+    return stats
+
+def print_replay_report(stats, corpusName):
+    print(f"Replay of {corpusName} readings through the firmware lookup:")
+    print(f"  {'Index':<12}{'Layout':<11}{'Keys':>6}{'Depth':>7}{'Avg':>7}{'Lookups':>9}{'Hits':>7}"
+          f"{'Hit %':>7}{'Visits':>9}{'Avg':>6}{'Hit avg':>8}{'Worst':>6}{'us/lookup':>10}")
+    for prefix, entry in stats.items():
+        lookups = max(entry['lookups'], 1)
+        print(f"  {prefix:<12}{entry['layout']:<11}{entry['size']:>6}{entry['depthWorst']:>7}"
+              f"{entry['depthMean']:>7.2f}{entry['lookups']:>9}{entry['hits']:>7}"
+              f"{100 * entry['hits'] / lookups:>7.1f}{entry['visits']:>9}{entry['visits'] / lookups:>6.2f}"
+              f"{entry['hitVisits'] / max(entry['hits'], 1):>8.2f}{entry['worstVisits']:>6}"
+              f"{1e6 * entry['seconds'] / lookups:>10.2f}")
+        if entry['tooLong']:
+            print(f"    {entry['tooLong']} readings longer than {MAX_KANA} Kana were skipped.")
+    print("  Depth and Avg are the worst and average visits of a successful search over every key of an")
+    print("  index; Visits, Avg, Hit avg, and Worst are those of the replayed lookups.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a corpus of readings through a host model "
+                                                 "of the reading lookup of kdict.cpp.")
+    parser.add_argument('--headers', default='.', help="directory of the generated headers")
+    parser.add_argument('--corpus', default='./Core10k.csv', help="tab separated word list")
+    parser.add_argument('--column', default='Reading', help="column of the readings in the corpus")
+    args = parser.parse_args()
+    print_replay_report(replay(load_reading_indexes(args.headers), load_corpus_readings(args.corpus, args.column)),
+                        os.path.basename(args.corpus))
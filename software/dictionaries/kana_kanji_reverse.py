@@ -0,0 +1,288 @@
+import argparse
+import os
+import re
+import numpy as np
+from kana_kanji_emit import HeaderBuffer, hex_rows, kana_key, reading_keys, utf8_escape
+from kana_kanji_index import MinimalPerfectHash, mph_bucket, mph_slot
+
+# Reverse index from a Kanji to its readings and to the dictionary words
+# written with it (kanji_index.h).  The reading headers only go from a
+# reading to its Kanji and words, so without it the firmware would have to
+# scan every reading_md to find the readings of a Kanji.  With it,
+# get_kanji_entry() in kdict.cpp finds the entry of a Kanji with one probe of
+# a minimal perfect hash over the Kanji Unicode values (kana_kanji_index.py).
+#
+# The readings of the three reading sets are numbered together: the onyomi
+# first, then the kunyomi from KANJI_INDEX_KUNYOMI, then the nanori from
+# KANJI_INDEX_NANORI, each set in the order of its header.  Reading n has its
+# Kana in kanji_index_kana[n] and its metadata in kanji_index_rmds[n].
+#   kanji_reading - A reading of a Kanji, and the posting of the Kanji, its
+#                   position in the klist (and olist) of the reading.
+#   kanji_entry   - A Kanji, in kanji_md.h (frequency rank) order.  Its
+#                   readings are readings[readings] up to the readings of the
+#                   next entry, in reading number order, and likewise its
+#                   words, in order of word frequency rank.  A last entry with
+#                   a NULL Kanji ends the ranges of the last Kanji.
+#   reverse_index - The hash, whose slots hold entry indexes, and the arrays.
+# The offsets are 16-bit, which is checked when the index is built.
+READING_SETS = ['onyomi', 'kunyomi', 'nanori']
+
+KANJI_INDEX_TYPES = """
+#ifndef KANJI_READING_TYPE
+#define KANJI_READING_TYPE
+typedef struct kanji_reading {
+  const uint16_t reading;
+  const uint16_t posting;
+} kanji_reading;
+#endif
+
+#ifndef KANJI_ENTRY_TYPE
+#define KANJI_ENTRY_TYPE
+typedef struct kanji_entry {
+  const kanji_md * const kanji;
+  const uint16_t readings;
+  const uint16_t words;
+} kanji_entry;
+#endif
+
+#ifndef REVERSE_INDEX_TYPE
+#define REVERSE_INDEX_TYPE
+typedef struct reverse_index {
+  const uint32_t salt;
+  const uint16_t size;
+  const uint16_t buckets;
+  const uint16_t * const disp;
+  const uint16_t * const slots;
+  const kanji_entry * const entries;
+  const kanji_reading * const readings;
+  const okuri_md * const * const words;
+  const char * const * const kana;
+  const reading_md * const * const rmds;
+} reverse_index;
+#endif
+
+"""
+KANJI_INDEX_DEFINES = """#define KDICT_KANJI_INDEX
+#define KANJI_INDEX_KUNYOMI {kunyomi}
+#define KANJI_INDEX_NANORI {nanori}
+"""
+# Written in place of the index when it is not generated, so that kdict.cpp
+# can always include kanji_index.h.
+KANJI_INDEX_STUB = "/* kanji_index.h */\n\n// The Kanji reverse index is not generated (see --kanji-index).\n"
+
+INDEX_ARRAY = 'const {type} kanji_index_{name}[] = {{\n  {items}}};\n'
+KANJI_INDEX = ('const reverse_index kanji_index = {{{salt}, {size}, {buckets}, kanji_index_disp, '
+               'kanji_index_slots, kanji_index_entries, kanji_index_readings, kanji_index_words, '
+               'kanji_index_kana, kanji_index_rmds}};\n')
+
+def item_rows(items, perLine):
+    # Comma separated items, perLine to a line.
+    return ',\n  '.join([', '.join(items[ndx:ndx + perLine]) for ndx in range(0, len(items), perLine)])
+
+def word_symbol(kanaInt, sndx):
+    # The okuri_md of a word in dictionary.h, as write_dictionary_header()
+    # names it.
+    return f"dict_okuri_md{hex(kanaInt)}_{sndx:02d}"
+
+def word_kanji(word):
+    # The distinct characters of a word, in order.
+    return list(dict.fromkeys(word))
+
+class KanjiReverseIndex:
+    # Built from the sorted Kanji table, the onyomi, kunyomi, and nanori
+    # posting lists, and the dictionary readings, as they are written to the
+    # headers.  Words only count the Kanji of the table.
+    def __init__(self, df1Sort, readingSets, df6Sort, kanaMap):
+        self.ucs = [ucs.upper() for ucs in df1Sort['UCS']]
+        ucsInts = np.array([int(ucs, 16) for ucs in self.ucs], dtype=np.uint32)
+        byUcs = np.argsort(ucsInts)
+
+        # One row per posting of every reading set, numbering the readings of
+        # the sets together.
+        self.kana = []
+        self.rmds = []
+        self.setStart = []
+        entries, numbers, postings = [], [], []
+        for setName, postingLists in zip(READING_SETS, readingSets):
+            self.setStart.append(len(self.kana))
+            keyInts = reading_keys(postingLists.readings, kanaMap, setName)
+            readingOf = np.repeat(np.arange(len(postingLists)), np.diff(postingLists.readingStart))
+            found = byUcs[np.searchsorted(ucsInts[byUcs], postingLists.ucs).clip(0, len(byUcs) - 1)]
+            if not np.array_equal(ucsInts[found], postingLists.ucs):
+                raise ValueError(f"The {setName} readings have Kanji that are not in kanji_md.h.")
+            entries.append(found)
+            numbers.append(readingOf + len(self.kana))
+            postings.append(np.arange(postingLists.posting_count()) - postingLists.readingStart[readingOf])
+            self.kana += list(postingLists.readings)
+            self.rmds += [f"{setName}_md{hex(kanaInt)}" for kanaInt in keyInts]
+        entries, numbers, postings = np.concatenate(entries), np.concatenate(numbers), np.concatenate(postings)
+        order = np.lexsort((numbers, entries))
+        self.readingNumber = numbers[order]
+        self.readingPosting = postings[order]
+        self.readingStart = np.searchsorted(entries[order], np.arange(len(self.ucs) + 1))
+
+        # One row per Kanji of every dictionary word.
+        kanjiEntry = {kanji: ndx for ndx, kanji in enumerate(df1Sort['Kanji'])}
+        wordKeys = reading_keys(df6Sort['Reading'], kanaMap, "dictionary")
+        wordEntry, wordRank, symbols = [], [], []
+        for kanaInt, wordList, rankList in zip(wordKeys, df6Sort['WordList'], df6Sort['RankList']):
+            for sndx, (word, rank) in enumerate(zip(wordList, rankList)):
+                for kanji in word_kanji(word):
+                    if kanji in kanjiEntry:
+                        wordEntry.append(kanjiEntry[kanji])
+                        wordRank.append(rank)
+                        symbols.append(word_symbol(kanaInt, sndx))
+        order = np.lexsort((np.arange(len(wordEntry)), wordRank, wordEntry))
+        self.words = [symbols[ndx] for ndx in order]
+        self.wordStart = np.searchsorted(np.array(wordEntry, dtype=np.int64)[order], np.arange(len(self.ucs) + 1))
+
+        for name, count in [("Kanji", len(self.ucs)), ("readings", len(self.kana)),
+                            ("Kanji readings", len(self.readingNumber)), ("Kanji words", len(self.words))]:
+            if count > 0xffff:
+                raise ValueError(f"Too many {name} ({count}) for the 16-bit offsets of the Kanji reverse index.")
+        self.mph = MinimalPerfectHash(list(ucsInts))
+        self.mph.verify(list(ucsInts))
+
+    def render(self):
+        out = HeaderBuffer()
+        out.write("/* kanji_index.h */\n\n")
+        out.emit(KANJI_INDEX_DEFINES, kunyomi=self.setStart[1], nanori=self.setStart[2])
+        out.write(KANJI_INDEX_TYPES)
+        out.emit(INDEX_ARRAY, type='char * const', name='kana',
+                 items=item_rows([f'"{utf8_escape(kana)}"' for kana in self.kana], 4))
+        out.emit(INDEX_ARRAY, type='reading_md * const', name='rmds',
+                 items=item_rows([f"&{symbol}" for symbol in self.rmds], 4))
+        out.emit(INDEX_ARRAY, type='kanji_reading', name='readings',
+                 items=item_rows([f"{{{number}, {posting}}}" for number, posting
+                                  in zip(self.readingNumber, self.readingPosting)], 8))
+        out.emit(INDEX_ARRAY, type='okuri_md * const', name='words',
+                 items=item_rows([f"&{symbol}" for symbol in self.words], 4))
+        kanjiRefs = [f"&kanji_md{ucs}" for ucs in self.ucs] + ["NULL"]
+        out.emit(INDEX_ARRAY, type='kanji_entry', name='entries',
+                 items=item_rows([f"{{{ref}, {readings}, {words}}}" for ref, readings, words
+                                  in zip(kanjiRefs, self.readingStart, self.wordStart)], 4))
+        out.emit(INDEX_ARRAY, type='uint16_t', name='disp', items=hex_rows(self.mph.disp, 4))
+        out.emit(INDEX_ARRAY, type='uint16_t', name='slots', items=hex_rows(self.mph.slotIndex, 4))
+        out.emit(KANJI_INDEX, salt=f"0x{self.mph.salt:08x}", size=self.mph.size, buckets=self.mph.buckets)
+        return ''.join(out.parts)
+
+def expected_kanji_index(df1Sort, readingSets, df6Sort, kanaMap):
+    # The readings (Kana, reading metadata, posting) and words of each Kanji,
+    # found by scanning the reading sets and the dictionary in full.
+    readings = {ucs.upper(): [] for ucs in df1Sort['UCS']}
+    for setName, postingLists in zip(READING_SETS, readingSets):
+        for row, reading in enumerate(postingLists.readings):
+            symbol = f"{setName}_md{hex(kana_key(reading, kanaMap))}"
+            for posting, ucs in enumerate(postingLists.ucs_list(row)):
+                readings[ucs].append((reading, symbol, posting))
+    words = {ucs: [] for ucs in readings}
+    for reading, wordList, rankList in zip(df6Sort['Reading'], df6Sort['WordList'], df6Sort['RankList']):
+        kanaInt = kana_key(reading, kanaMap)
+        for sndx, (word, rank) in enumerate(zip(wordList, rankList)):
+            for kanji in word_kanji(word):
+                if f"{ord(kanji):X}" in words:
+                    words[f"{ord(kanji):X}"].append((rank, word_symbol(kanaInt, sndx)))
+    # sorted() is stable, so words of equal rank stay in dictionary order.
+    return readings, {ucs: [symbol for rank, symbol in sorted(found, key=lambda pair: pair[0])]
+                      for ucs, found in words.items()}
+
+def parse_array(text, name):
+    match = re.search(r"kanji_index_" + name + r"\[\] = \{\n(.*?)\};", text, re.S)
+    if match is None:
+        raise ValueError(f"kanji_index.h has no kanji_index_{name}[].")
+    return match.group(1)
+
+def parse_define(text, name):
+    match = re.search(r"#define " + name + r" (\d+)", text)
+    if match is None:
+        raise ValueError(f"kanji_index.h does not define {name}.")
+    return int(match.group(1))
+
+def verify_kanji_index(text, df1Sort, readingSets, df6Sort, kanaMap):
+    # Check the text of kanji_index.h against a scan of the tables it was
+    # built from: every Kanji must have an entry, in kanji_md.h order, with
+    # exactly its readings and words, every Kanji must be found by the hash as
+    # get_kanji_entry() computes it, and no other CJK character may be.
+    # Returns the numbers of entries, Kanji readings, and Kanji words.
+    kana = [bytes.fromhex(body.replace('\\x', '')).decode('utf8')
+            for body in re.findall(r'"([^"]*)"', parse_array(text, 'kana'))]
+    rmds = re.findall(r"&(\w+)", parse_array(text, 'rmds'))
+    readings = [(int(number), int(posting))
+                for number, posting in re.findall(r"\{(\d+), (\d+)\}", parse_array(text, 'readings'))]
+    words = re.findall(r"&(\w+)", parse_array(text, 'words'))
+    entries = [(None if ref == 'NULL' else ucs, int(start), int(wordStart)) for ref, ucs, start, wordStart
+               in re.findall(r"\{(&kanji_md([0-9A-F]+)|NULL), (\d+), (\d+)\}", parse_array(text, 'entries'))]
+    disp = [int(value, 16) for value in re.findall(r"0x([0-9a-f]+)", parse_array(text, 'disp'))]
+    slots = [int(value, 16) for value in re.findall(r"0x([0-9a-f]+)", parse_array(text, 'slots'))]
+    match = re.search(r"const reverse_index kanji_index = \{0x([0-9a-f]+), (\d+), (\d+),", text)
+    if match is None:
+        raise ValueError("kanji_index.h has no kanji_index.")
+    salt, size, buckets = int(match.group(1), 16), int(match.group(2)), int(match.group(3))
+    setStart = [0, parse_define(text, 'KANJI_INDEX_KUNYOMI'), parse_define(text, 'KANJI_INDEX_NANORI'), len(kana)]
+
+    expectedReadings, expectedWords = expected_kanji_index(df1Sort, readingSets, df6Sort, kanaMap)
+    ucsList = [ucs.upper() for ucs in df1Sort['UCS']]
+    if [ucs for ucs, start, wordStart in entries] != ucsList + [None]:
+        raise ValueError("The Kanji reverse index entries are not in kanji_md.h order.")
+    if len(rmds) != len(kana) or entries[-1][1:] != (len(readings), len(words)):
+        raise ValueError("The Kanji reverse index arrays do not match in length.")
+    for setName, first, last in zip(READING_SETS, setStart, setStart[1:]):
+        if any(not symbol.startswith(setName + '_md') for symbol in rmds[first:last]):
+            raise ValueError(f"The {setName} readings of the Kanji reverse index are out of place.")
+    for ndx, ucs in enumerate(ucsList):
+        found = [(kana[number], rmds[number], posting)
+                 for number, posting in readings[entries[ndx][1]:entries[ndx + 1][1]]]
+        if found != expectedReadings[ucs]:
+            raise ValueError(f"The Kanji reverse index has the wrong readings for U+{ucs}.")
+        if words[entries[ndx][2]:entries[ndx + 1][2]] != expectedWords[ucs]:
+            raise ValueError(f"The Kanji reverse index has the wrong words for U+{ucs}.")
+
+    # The lookup of get_kanji_entry(), over the whole CJK block.
+    entryOf = {int(ucs, 16): ndx for ndx, ucs in enumerate(ucsList)}
+    for key in range(0x3400, 0xa000):
+        entry = slots[mph_slot(key, disp[mph_bucket(key, salt, buckets)], size)]
+        found = entry if int(entries[entry][0], 16) == key else None
+        if found != entryOf.get(key):
+            raise ValueError(f"The Kanji reverse index lookup of U+{key:X} failed.")
+    return len(ucsList), len(readings), len(words)
+
+def write_kanji_index_header(df1Sort, df2Sort, df3Sort, df4Sort, df6Sort, kanaMap, outPath, enabled=True):
+    # Stage: write the Kanji reverse index header (kanji_index.h), verified
+    # against the tables before it is saved.
+    out = HeaderBuffer()
+    if not enabled:
+        out.write(KANJI_INDEX_STUB)
+        return out.save(outPath)
+    readingSets = (df2Sort, df3Sort, df4Sort)
+    text = KanjiReverseIndex(df1Sort, readingSets, df6Sort, kanaMap).render()
+    verify_kanji_index(text, df1Sort, readingSets, df6Sort, kanaMap)
+    out.write(text)
+    return out.save(outPath)
+
+
+def main():
+    # The tables are built as the generator builds them, so the options that
+    # change them must match those the header was generated with.
+    from kana_kanji_dictionary import DEFAULT_MAX_RANK, DictionaryBuild
+    parser = argparse.ArgumentParser(description="Verify kanji_index.h against the tables it was generated from.")
+    parser.add_argument('--headers', default='.', help="directory of the generated headers (default: .)")
+    parser.add_argument('--input', default='.', help="directory of the source files (default: .)")
+    parser.add_argument('--max-rank', type=int, default=DEFAULT_MAX_RANK,
+                        help=f"largest word frequency rank kept in dictionary.h (default: {DEFAULT_MAX_RANK})")
+    parser.add_argument('--drop-unsupported-words', action='store_true',
+                        help="drop words using Kanji outside of the supported subset")
+    args = parser.parse_args()
+
+    with open(os.path.join(args.headers, 'kanji_index.h')) as f:
+        text = f.read()
+    if 'KDICT_KANJI_INDEX' not in text:
+        print("kanji_index.h holds no Kanji reverse index.")
+        return
+    build = DictionaryBuild(args.input, maxRank=args.max_rank, dropUnsupportedWords=args.drop_unsupported_words)
+    entries, readings, words = verify_kanji_index(text, build.kanji_table(), build.readings()[0],
+                                                  build.dictionary_readings(), build.kana_map())
+    print(f"kanji_index.h verified: {entries} Kanji, {readings} Kanji readings, {words} Kanji words.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import numpy as np
+from kana_kanji_emit import c_bytes, meaning_value, utf8_escape
+
+# Global string pool of the generated headers.  Every Kanji meaning, kunyomi
+# and nanori okurigana, and dictionary word and meaning is stored once in a
+# single char array, kdict_strings[], emitted to kanji_ms.h in place of the
+# per-Kanji meaning arrays, and the structures point into it.  Identical
+# strings are stored once, and optionally a string that is the tail of a
+# longer one (e.g. "run" of "to run") points at the tail of the longer one,
+# as both end with the same NUL.  Meanings encoded by the meaning codebook
+# are pooled as bytes.
+STRING_POOL = 'kdict_strings'
+
+class StringPool:
+    # texts is every string referenced by the headers, in the order they are
+    # emitted, repeats included.  separateBytes is the flash taken by the
+    # same strings without the pool, for the report.
+    def __init__(self, texts, shareSuffixes=False, separateBytes=0):
+        self.shareSuffixes = shareSuffixes
+        self.separateBytes = separateBytes
+        self.references = len(texts)
+        self.referenceBytes = sum(len(pool_bytes(text)) + 1 for text in texts)
+        unique = list(dict.fromkeys(texts))
+        encoded = {text: pool_bytes(text) for text in unique}
+        self.uniqueBytes = sum(len(data) + 1 for data in encoded.values())
+
+        # A string is stored inside the longest string that ends with it.
+        # Sorted by reversed bytes, a string that is the tail of others sorts
+        # just before them, so each string only needs to be compared with the
+        # next one.
+        owner = {text: text for text in unique}
+        if shareSuffixes:
+            byTail = sorted(unique, key=lambda text: encoded[text][::-1])
+            for ndx in range(len(byTail) - 2, -1, -1):
+                if encoded[byTail[ndx + 1]].endswith(encoded[byTail[ndx]]):
+                    owner[byTail[ndx]] = owner[byTail[ndx + 1]]
+
+        # Stored strings in the order of first use.
+        self.entries = [text for text in unique if owner[text] == text]
+        entryOffsets = {}
+        self.size = 0
+        for text in self.entries:
+            entryOffsets[text] = self.size
+            self.size += len(encoded[text]) + 1
+        self.offsets = {text: entryOffsets[owner[text]] + len(encoded[owner[text]]) - len(encoded[text])
+                        for text in unique}
+
+    def ref(self, text):
+        # C expression of the address of a string.
+        return f"{STRING_POOL} + {self.offsets[text]}"
+
+    def render(self):
+        # Definition of the pool, one string literal per stored string.  The
+        # strings are separated by explicit NULs, and the last one ends with
+        # the NUL of the array.  ASCII strings are written as they are, as the
+        # meanings always were, and others as hex escapes.
+        literals = []
+        for ndx, text in enumerate(self.entries):
+            if type(text) == bytes:
+                body = c_bytes(text)
+            elif text.isascii() and '\\' not in text and '"' not in text:
+                body = text
+            else:
+                body = utf8_escape(text)
+            literals.append('"' + body + ('\\0' if ndx < len(self.entries) - 1 else '') + '"')
+        return (f"/* String pool: {len(self.entries)} strings, {self.size} bytes. */\n"
+                f"const char {STRING_POOL}[] =\n  " + ('\n  '.join(literals) if literals else '""') + ";\n")
+
+def pool_bytes(text):
+    return text if type(text) == bytes else text.encode('utf8')
+
+def build_string_pool(df1Sort, df3Sort, df4Sort, df6Sort, shareSuffixes, meaningCodec=None):
+    # Stage: gather the strings of every header into one pool.  The strings
+    # are taken in the order the headers emit them.  Without the pool, each
+    # Kanji meaning is a char array of its own, while identical string
+    # literals are merged by the compiler, kdict.cpp including every header.
+    meanings = [meaning_value(meaning, meaningCodec) for meaning in df1Sort['Meanings']]
+    literals = []
+    for row in np.flatnonzero(df3Sort.any_affix() | df3Sort.any_okuri()):
+        literals.extend(df3Sort.reading_okurigana(row))
+    for row in np.flatnonzero(df4Sort.any_okuri()):
+        literals.extend(df4Sort.reading_okurigana(row))
+    for wordList, meaningList in zip(df6Sort['WordList'], df6Sort['MeaningList']):
+        for word, meaning in zip(wordList, meaningList):
+            literals.extend([word, meaning_value(meaning, meaningCodec)])
+
+    separateBytes = (sum(len(pool_bytes(text)) + 1 for text in meanings) +
+                     sum(len(pool_bytes(text)) + 1 for text in set(literals)))
+    return StringPool(meanings + literals, shareSuffixes, separateBytes)
+
+def print_string_pool_report(pool):
+    print(f"String pool ({'deduplicated, shared suffixes' if pool.shareSuffixes else 'deduplicated'}):")
+    print(f"  {pool.references} string references, {pool.referenceBytes} bytes as separate strings.")
+    print(f"  {len(pool.offsets)} distinct strings, {pool.uniqueBytes} bytes.")
+    print(f"  {len(pool.entries)} strings stored in {pool.size} bytes.")
+    print(f"  {pool.separateBytes - pool.size} bytes saved against the headers without the pool "
+          f"({pool.separateBytes} bytes of meaning arrays and merged literals).")
@@ -0,0 +1,431 @@
+import argparse
+import bisect
+import os
+import re
+import time
+from kana_kanji_emit import HeaderBuffer, hex_rows, reading_keys
+from kana_kanji_replay import READING_SETS, MAX_KANA, load_corpus_readings, load_reading_indexes, make_key
+
+# Prefix trie over the readings of the onyomi, kunyomi, nanori, and dictionary
+# sets (kana_trie.h), so that candidates can be offered while a reading is
+# still being typed.  make_key() hashes a whole reading, so a hash or BST
+# lookup has to start again at every keystroke, whereas kana_trie_step() in
+# kdict.cpp extends the prefix typed so far by one Kana, with a binary search
+# of the labels of the children of one node.
+#
+# The trie is walked with the bytes that make_key() takes from the typed
+# Kana, the lowest byte of each Unicode value.  The onyomi are in Katakana,
+# and are entered as the Hiragana typed for them (make_key() moves Hiragana
+# up to the Katakana bytes for an onyomi key), so one walk covers every set.
+# The nodes are in breadth-first order, the root being node 0, and the
+# children of a node are consecutive nodes, in ascending order of label.
+#   labels     - The byte of the edge into each node.
+#   sets       - For each node, bit (1 << readingType) of each reading set
+#                that has the prefix of the node as a reading.
+#   trie_node  - The first child and number of children of a node, and its
+#                candidates, the topK best candidates of the readings
+#                starting with its prefix, at candidates[candidates].  Nodes
+#                with the same candidates share one list.
+#   trie_candidate - A Kanji or word, as a reading and a posting: the
+#                reading numbered as in the Kanji reverse index, with the
+#                dictionary readings from KANA_TRIE_DICTIONARY, and the
+#                position in its klist, or olist for a word.
+# The node and candidate offsets are 16-bit, which is checked when the trie
+# is built.
+# Candidates are ordered as build_kanji_list_data() orders a reading's list:
+# dictionary words first, by word frequency rank, then Kanji, by Kanji rank.
+# A Kanji or word reached through several readings is kept once, with its
+# first reading.
+
+# readingType of kdict.h, and the byte offset of Katakana from Hiragana.
+READING_TYPES = dict(kunyomi=1, onyomi=2, nanori=3, dictionary=4)
+TRIE_SETS = ['onyomi', 'kunyomi', 'nanori', 'dictionary']
+KATAKANA_OFFSET = 0x60
+DEFAULT_TOP_K = 8
+
+KANA_TRIE_TYPES = """
+#ifndef TRIE_CANDIDATE_TYPE
+#define TRIE_CANDIDATE_TYPE
+typedef struct trie_candidate {
+  const uint16_t reading;
+  const uint16_t posting;
+} trie_candidate;
+#endif
+
+#ifndef TRIE_NODE_TYPE
+#define TRIE_NODE_TYPE
+typedef struct trie_node {
+  const uint16_t candidates;
+  const uint16_t child;
+  const uint8_t children;
+  const uint8_t count;
+} trie_node;
+#endif
+
+#ifndef PREFIX_TRIE_TYPE
+#define PREFIX_TRIE_TYPE
+typedef struct prefix_trie {
+  const uint16_t size;
+  const uint8_t * const labels;
+  const uint8_t * const sets;
+  const trie_node * const nodes;
+  const trie_candidate * const candidates;
+  const reading_md * const * const rmds;
+} prefix_trie;
+#endif
+
+"""
+KANA_TRIE_DEFINES = """#define KDICT_KANA_TRIE
+#define KANA_TRIE_KUNYOMI {kunyomi}
+#define KANA_TRIE_NANORI {nanori}
+#define KANA_TRIE_DICTIONARY {dictionary}
+#define KANA_TRIE_TOP_K {topK}
+#define KANA_TRIE_ROOT 0
+#define KANA_TRIE_NONE 0xffff
+"""
+# Written in place of the trie when it is not generated, so that kdict.cpp
+# can always include kana_trie.h.
+KANA_TRIE_STUB = "/* kana_trie.h */\n\n// The Kana prefix trie is not generated (see --kana-trie).\n"
+
+TRIE_ARRAY = 'const {type} kana_trie_{name}[] = {{\n  {items}}};\n'
+KANA_TRIE = ('const prefix_trie kana_trie = {{{size}, kana_trie_labels, kana_trie_sets, kana_trie_nodes, '
+             'kana_trie_candidates, kana_trie_rmds}};\n')
+
+def item_rows(items, perLine):
+    # Comma separated items, perLine to a line.
+    return ',\n  '.join([', '.join(items[ndx:ndx + perLine]) for ndx in range(0, len(items), perLine)])
+
+def typed_bytes(reading, kanaMap, onyomi=False):
+    # The bytes of a reading as they are typed, Katakana onyomi as Hiragana.
+    data = bytearray()
+    for kana in reading:
+        byte = int(kanaMap[kana], 16)
+        if onyomi and 0xa1 <= byte <= 0xf6:
+            byte -= KATAKANA_OFFSET
+        data.append(byte)
+    return bytes(data)
+
+def reading_candidates(readingSets, df6Sort, kanaMap):
+    # Each reading of the four sets, numbered in order: its set, typed bytes,
+    # reading metadata, and candidates.  A candidate is (order key, identity,
+    # (reading, posting)), the identity being the Kanji or the word.  Also
+    # returns the first reading number of each set.
+    readings = []
+    setStart = []
+    for setName, postingLists in zip(TRIE_SETS, readingSets):
+        setStart.append(len(readings))
+        keyInts = reading_keys(postingLists.readings, kanaMap, setName)
+        for row, (reading, kanaInt) in enumerate(zip(postingLists.readings, keyInts)):
+            number = len(readings)
+            first = postingLists.readingStart[row]
+            candidates = [((1, int(postingLists.rank[posting]), number, posting - first),
+                           ('kanji', int(postingLists.ucs[posting])), (number, posting - first))
+                          for posting in range(first, postingLists.readingStart[row + 1])]
+            readings.append((setName, typed_bytes(reading, kanaMap, setName == 'onyomi'),
+                             f"{setName}_md{hex(kanaInt)}", candidates))
+    setStart.append(len(readings))
+    keyInts = reading_keys(df6Sort['Reading'], kanaMap, "dictionary")
+    for reading, kanaInt, wordList, rankList in zip(df6Sort['Reading'], keyInts, df6Sort['WordList'],
+                                                    df6Sort['RankList']):
+        number = len(readings)
+        candidates = [((0, int(rank), number, sndx), ('word', word), (number, sndx))
+                      for sndx, (word, rank) in enumerate(zip(wordList, rankList))]
+        readings.append(('dictionary', typed_bytes(reading, kanaMap), f"dictionary_md{hex(kanaInt)}",
+                         candidates))
+    return readings, setStart
+
+def top_candidates(candidates, topK):
+    # The first topK distinct Kanji and words, in order.
+    best = []
+    seen = set()
+    for candidate in sorted(candidates):
+        if candidate[1] not in seen:
+            seen.add(candidate[1])
+            best.append(candidate)
+            if len(best) == topK:
+                break
+    return best
+
+class KanaTrie:
+    # The arrays of kana_trie.h, built by build_kana_trie() or loaded from a
+    # header by load_kana_trie(), and the reference of the walk done by
+    # kana_trie_step().
+    def __init__(self, labels, sets, child, children, count, offset, candidates, rmds, setStart, topK):
+        self.labels = labels
+        self.sets = sets
+        self.child = child
+        self.children = children
+        self.count = count
+        self.offset = offset
+        self.candidates = candidates
+        self.rmds = rmds
+        self.setStart = setStart
+        self.topK = topK
+
+    def __len__(self):
+        return len(self.labels)
+
+    def step(self, node, kana):
+        # kana_trie_step(): the node of the prefix extended by the Unicode
+        # value kana, or None, and the number of labels compared.
+        if node is None:
+            return None, 0
+        label = kana & 0xff
+        low = self.child[node]
+        end = low + self.children[node]
+        high = end
+        compares = 0
+        while low < high:
+            mid = (low + high) // 2
+            compares += 1
+            if self.labels[mid] < label:
+                low = mid + 1
+            else:
+                high = mid
+        if low < end:
+            compares += 1
+            if self.labels[low] == label:
+                return low, compares
+        return None, compares
+
+    def walk(self, text, node=0):
+        # The node of a typed prefix, one step per Kana, or None.
+        for kana in text:
+            node = self.step(node, ord(kana))[0]
+        return node
+
+    def node_candidates(self, node):
+        # The (reading, posting) candidates of a node.
+        return self.candidates[self.offset[node]:self.offset[node] + self.count[node]]
+
+    def reading_set(self, number):
+        # The set of a reading number.
+        for setName, first, last in zip(TRIE_SETS, self.setStart, self.setStart[1:] + [len(self.rmds)]):
+            if first <= number < last:
+                return setName
+        raise ValueError(f"Reading number {number} is out of range.")
+
+    def render(self):
+        out = HeaderBuffer()
+        out.write("/* kana_trie.h */\n\n")
+        out.emit(KANA_TRIE_DEFINES, kunyomi=self.setStart[1], nanori=self.setStart[2],
+                 dictionary=self.setStart[3], topK=self.topK)
+        out.write(KANA_TRIE_TYPES)
+        out.emit(TRIE_ARRAY, type='uint8_t', name='labels', items=hex_rows(self.labels, 2, 16))
+        out.emit(TRIE_ARRAY, type='uint8_t', name='sets', items=hex_rows(self.sets, 2, 16))
+        out.emit(TRIE_ARRAY, type='trie_node', name='nodes',
+                 items=item_rows([f"{{{offset}, {child}, {children}, {count}}}" for offset, child, children, count
+                                  in zip(self.offset, self.child, self.children, self.count)], 4))
+        out.emit(TRIE_ARRAY, type='trie_candidate', name='candidates',
+                 items=item_rows([f"{{{number}, {posting}}}" for number, posting in self.candidates], 8))
+        out.emit(TRIE_ARRAY, type='reading_md * const', name='rmds',
+                 items=item_rows([f"&{symbol}" for symbol in self.rmds], 4))
+        out.emit(KANA_TRIE, size=len(self))
+        return ''.join(out.parts)
+
+def build_kana_trie(readingSets, df6Sort, kanaMap, topK=DEFAULT_TOP_K):
+    readings, setStart = reading_candidates(readingSets, df6Sort, kanaMap)
+    # Every prefix of every reading is a node.  In order of length, then of
+    # bytes, the nodes are breadth-first, with the children of a node
+    # consecutive and in ascending order of label.
+    prefixes = sorted({typed[:end] for setName, typed, symbol, candidates in readings
+                       for end in range(len(typed) + 1)}, key=lambda prefix: (len(prefix), prefix))
+    nodeOf = {prefix: node for node, prefix in enumerate(prefixes)}
+    if len(prefixes) > 0xffff or len(readings) > 0xffff or topK > 0xff:
+        raise ValueError(f"The Kana prefix trie of {len(prefixes)} nodes and {len(readings)} readings, "
+                         f"with {topK} candidates per node, does not fit its 16-bit and 8-bit fields.")
+
+    labels = [prefix[-1] if prefix else 0 for prefix in prefixes]
+    sets = [0] * len(prefixes)
+    child = [0] * len(prefixes)
+    children = [0] * len(prefixes)
+    own = [[] for prefix in prefixes]
+    for prefix in prefixes[1:]:
+        parent = nodeOf[prefix[:-1]]
+        if children[parent] == 0:
+            child[parent] = nodeOf[prefix]
+        children[parent] += 1
+    if max(children) > 0xff:
+        raise ValueError("A node of the Kana prefix trie has more than 255 children.")
+    for setName, typed, symbol, candidates in readings:
+        node = nodeOf[typed]
+        sets[node] |= 1 << READING_TYPES[setName]
+        own[node] += candidates
+
+    # The best candidates of a node are the best of its own and those of its
+    # children, so the lists are merged from the leaves up.
+    best = [None] * len(prefixes)
+    for node in reversed(range(len(prefixes))):
+        merged = list(own[node])
+        for childNode in range(child[node], child[node] + children[node]):
+            merged += best[childNode]
+        best[node] = top_candidates(merged, topK)
+
+    # Nodes with the same list share it.
+    listOffset = {}
+    candidates = []
+    offset = []
+    for nodeBest in best:
+        refs = tuple(ref for key, identity, ref in nodeBest)
+        if refs not in listOffset:
+            listOffset[refs] = len(candidates)
+            candidates += refs
+        offset.append(listOffset[refs])
+    if len(candidates) > 0xffff:
+        raise ValueError(f"The {len(candidates)} candidates of the Kana prefix trie do not fit its 16-bit offsets.")
+    return KanaTrie(labels, sets, child, children, [len(nodeBest) for nodeBest in best], offset, candidates,
+                    [symbol for setName, typed, symbol, candidates in readings], setStart, topK)
+
+def parse_array(text, name):
+    match = re.search(r"kana_trie_" + name + r"\[\] = \{\n(.*?)\};", text, re.S)
+    if match is None:
+        raise ValueError(f"kana_trie.h has no kana_trie_{name}[].")
+    return match.group(1)
+
+def parse_define(text, name):
+    match = re.search(r"#define " + name + r" (\d+)", text)
+    if match is None:
+        raise ValueError(f"kana_trie.h does not define {name}.")
+    return int(match.group(1))
+
+def load_kana_trie(text):
+    # The KanaTrie of the text of kana_trie.h.
+    labels = [int(value, 16) for value in re.findall(r"0x([0-9a-f]+)", parse_array(text, 'labels'))]
+    sets = [int(value, 16) for value in re.findall(r"0x([0-9a-f]+)", parse_array(text, 'sets'))]
+    nodes = [tuple(int(field) for field in node)
+             for node in re.findall(r"\{(\d+), (\d+), (\d+), (\d+)\}", parse_array(text, 'nodes'))]
+    candidates = [(int(number), int(posting))
+                  for number, posting in re.findall(r"\{(\d+), (\d+)\}", parse_array(text, 'candidates'))]
+    rmds = re.findall(r"&(\w+)", parse_array(text, 'rmds'))
+    setStart = [0] + [parse_define(text, f"KANA_TRIE_{name.upper()}") for name in TRIE_SETS[1:]]
+    offset, child, children, count = [list(field) for field in zip(*nodes)]
+    return KanaTrie(labels, sets, child, children, count, offset, candidates, rmds, setStart,
+                    parse_define(text, 'KANA_TRIE_TOP_K'))
+
+def verify_kana_trie(trie, readingSets, df6Sort, kanaMap):
+    # Check a trie against the readings: the candidates of the node of every
+    # prefix must be the best of all of the readings with that prefix, found
+    # by a scan of the sorted readings, the reading sets of the node must be
+    # those with the prefix as a reading, and a step with any other label
+    # next to those of the children must fail.  Returns the number of nodes.
+    readings, setStart = reading_candidates(readingSets, df6Sort, kanaMap)
+    if trie.setStart != setStart or trie.rmds != [symbol for setName, typed, symbol, candidates in readings]:
+        raise ValueError("The Kana prefix trie readings are not those of the reading sets.")
+    byTyped = sorted(readings, key=lambda reading: reading[1])
+    typedList = [typed for setName, typed, symbol, candidates in byTyped]
+
+    visited = 0
+    pending = [(0, b'')]
+    while pending:
+        node, prefix = pending.pop()
+        visited += 1
+        first = last = bisect.bisect_left(typedList, prefix)
+        while last < len(typedList) and typedList[last].startswith(prefix):
+            last += 1
+        found = [candidate for setName, typed, symbol, candidates in byTyped[first:last] for candidate in candidates]
+        expected = [ref for key, identity, ref in top_candidates(found, trie.topK)]
+        if trie.node_candidates(node) != expected:
+            raise ValueError(f"The Kana prefix trie has the wrong candidates for prefix {prefix.hex() or '(empty)'}.")
+        sets = 0
+        for setName, typed, symbol, candidates in byTyped[first:last]:
+            if typed == prefix:
+                sets |= 1 << READING_TYPES[setName]
+        if trie.sets[node] != sets:
+            raise ValueError(f"The Kana prefix trie has the wrong reading sets for prefix {prefix.hex() or '(empty)'}.")
+
+        labels = [trie.labels[childNode]
+                  for childNode in range(trie.child[node], trie.child[node] + trie.children[node])]
+        if labels != sorted(set(labels)):
+            raise ValueError(f"The children of prefix {prefix.hex() or '(empty)'} are not in ascending order of label.")
+        for label in labels:
+            pending.append((trie.step(node, label)[0], prefix + bytes([label])))
+            for other in (label - 1, label + 1):
+                if 0 <= other <= 0xff and other not in labels and trie.step(node, other)[0] is not None:
+                    raise ValueError(f"The Kana prefix trie steps from prefix {prefix.hex() or '(empty)'} on {other:#x}.")
+    if visited != len(trie):
+        raise ValueError(f"The Kana prefix trie has {len(trie)} nodes, but {visited} are reachable.")
+    for setName, typed, symbol, candidates in readings:
+        node = 0
+        for byte in typed:
+            node = trie.step(node, byte)[0]
+        if node is None or not trie.sets[node] & (1 << READING_TYPES[setName]):
+            raise ValueError(f"The {setName} reading {symbol} is not found in the Kana prefix trie.")
+    return visited
+
+def write_kana_trie_header(df2Sort, df3Sort, df4Sort, df6Sort, kanaMap, outPath, topK=None):
+    # Stage: write the Kana prefix trie header (kana_trie.h), with topK
+    # candidates per node, verified before it is saved.  Without topK, the
+    # header is written without the trie.
+    out = HeaderBuffer()
+    if topK is None:
+        out.write(KANA_TRIE_STUB)
+        return out.save(outPath)
+    readingSets = (df2Sort, df3Sort, df4Sort)
+    text = build_kana_trie(readingSets, df6Sort, kanaMap, topK).render()
+    verify_kana_trie(load_kana_trie(text), readingSets, df6Sort, kanaMap)
+    out.write(text)
+    return out.save(outPath)
+
+def replay_keystrokes(trie, indexes, readings):
+    # Type every reading one Kana at a time.  At each keystroke, the trie is
+    # stepped once from the node of the previous one, while the hash-and-search
+    # lookup hashes the whole prefix again and searches the four reading
+    # indexes, as build_kanji_list_data() does.  Returns the statistics of both.
+    trieStats = dict(keystrokes=0, found=0, compares=0, candidates=0, seconds=0.0)
+    start = time.perf_counter()
+    for reading in readings:
+        node = 0
+        for kana in reading:
+            node, compares = trie.step(node, ord(kana))
+            trieStats['keystrokes'] += 1
+            trieStats['compares'] += compares
+            if node is not None:
+                trieStats['found'] += 1
+                trieStats['candidates'] += trie.count[node]
+    trieStats['seconds'] = time.perf_counter() - start
+
+    hashStats = dict(keystrokes=0, found=0, compares=0, hashed=0, seconds=0.0)
+    start = time.perf_counter()
+    for reading in readings:
+        kanaList = [ord(kana) for kana in reading]
+        for end in range(1, min(len(kanaList), MAX_KANA) + 1):
+            hashStats['keystrokes'] += 1
+            anyFound = False
+            for prefix, onyomiKey in READING_SETS:
+                found, visits = indexes[prefix].search(make_key(kanaList[:end], onyomiKey))
+                hashStats['hashed'] += end
+                hashStats['compares'] += visits
+                anyFound = anyFound or found
+            hashStats['found'] += anyFound
+    hashStats['seconds'] = time.perf_counter() - start
+    return trieStats, hashStats
+
+def print_keystroke_report(trie, trieStats, hashStats, corpusName):
+    print(f"Keystroke replay of {corpusName} readings ({len(trie)} trie nodes, top {trie.topK} candidates):")
+    print(f"  {'Lookup':<16}{'Keystrokes':>11}{'Found':>8}{'Compares':>10}{'Avg':>7}{'Kana hashed':>13}"
+          f"{'us/key':>8}")
+    for name, stats in [('Trie step', trieStats), ('Hash and search', hashStats)]:
+        keystrokes = max(stats['keystrokes'], 1)
+        print(f"  {name:<16}{stats['keystrokes']:>11}{stats['found']:>8}{stats['compares']:>10}"
+              f"{stats['compares'] / keystrokes:>7.2f}{stats.get('hashed', 0):>13}"
+              f"{1e6 * stats['seconds'] / keystrokes:>8.2f}")
+    print(f"  The trie found candidates at {trieStats['found']} keystrokes, "
+          f"{trieStats['candidates'] / max(trieStats['found'], 1):.2f} on average; the hash and search only finds")
+    print("  complete readings.  Times are of the Python models, for comparison only.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a corpus of readings keystroke by keystroke through "
+                                                 "the Kana prefix trie and the reading indexes.")
+    parser.add_argument('--headers', default='.', help="directory of the generated headers")
+    parser.add_argument('--corpus', default='./Core10k.csv', help="tab separated word list")
+    parser.add_argument('--column', default='Reading', help="column of the readings in the corpus")
+    args = parser.parse_args()
+    with open(os.path.join(args.headers, 'kana_trie.h'), encoding='utf8') as f:
+        text = f.read()
+    if 'KDICT_KANA_TRIE' not in text:
+        raise SystemExit("kana_trie.h holds no Kana prefix trie (generate it with --kana-trie).")
+    trie = load_kana_trie(text)
+    trieStats, hashStats = replay_keystrokes(trie, load_reading_indexes(args.headers),
+                                             load_corpus_readings(args.corpus, args.column))
+    print_keystroke_report(trie, trieStats, hashStats, os.path.basename(args.corpus))
@@ -620,11 +620,11 @@ void build_kanji_list(void) {
           // Convert Unicode value to UTF8 string.
           hexUCS2utf8str(utf8str, klist_data[i].kmd->unicode);
           // Create a button for the Kanji list.
-          btn = make_list_button(utf8str, klist_data[i].kmd->meaning, color);
+          btn = make_list_button(utf8str, meaning_text(klist_data[i].kmd->meaning), color);
           break;
         case DICTIONARY:
           // Create a button for the Kanji list.
-          btn = make_list_button(klist_data[i].omd->clist[0], klist_data[i].omd->clist[1], color);
+          btn = make_list_button(klist_data[i].omd->clist[0], meaning_text(klist_data[i].omd->clist[1]), color);
           break;
       }
 
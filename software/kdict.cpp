@@ -28,6 +28,8 @@ This file is part of KanaChordPlus Keyboard.
 #include "kunyomi.h"
 #include "nanori.h"
 #include "dictionary.h"
+#include "kanji_index.h"
+#include "kana_trie.h"
 
 kanji_list_data klist_data[500];
 uint16_t totalListSize;
@@ -69,6 +71,147 @@ reading_md* get_reading(uint32_t key, bbt_node *parent_node) {
   return (metadata);
 }
 
+/**
+ * Function: mph_slot - The slot of a key in a minimal perfect hash table (see
+ * kana_kanji_index.py).  The bucket of the key selects a displacement seed,
+ * which selects the one slot that can hold the key.
+ * Input:
+ *   key - Key to look up.
+ *   salt, buckets, *disp, size - Salt, bucket count, displacement seed of
+ *     each bucket, and slot count of the table.
+ * Output:
+ *   Slot of the key, to be checked against the key held in the slot.
+ */
+static inline uint16_t mph_slot(uint32_t key, uint32_t salt, uint16_t buckets, const uint16_t *disp,
+                                uint16_t size) {
+  uint32_t h = key ^ (disp[(key ^ salt) % buckets] * 0x9e3779b1);
+  // Murmur3 finalizer, as in murmur3_32().
+  h ^= h >> 16;
+  h *= 0x85ebca6b;
+  h ^= h >> 13;
+  h *= 0xc2b2ae35;
+  h ^= h >> 16;
+  return (h % size);
+}
+
+#ifdef KDICT_MPH_INDEX
+/**
+ * Function: get_reading_mph - Look up the provided Kana key in the minimal
+ * perfect hash index of a reading set, emitted in place of the BST when the
+ * headers are generated with the 'mph' reading index.  The bucket of the key
+ * selects a displacement seed, which selects the one slot that can hold the
+ * key.  The key of the slot is compared, so a key not in the set is rejected.
+ * Input:
+ *   key - Kana key encoded as an unsigned 32-bit number.
+ *   *index - Minimal perfect hash index of the reading set.
+ * Output:
+ *   Pointer to Kanji reading metadata or null pointer if a reading is not found.
+ */
+reading_md* get_reading_mph(uint32_t key, const mph_index *index) {
+  uint16_t slot = mph_slot(key, index->salt, index->buckets, index->disp, index->size);
+  if (index->keys[slot] != key) {
+    return (NULL);
+  }
+  return ((reading_md *) index->rmds[slot]);
+}
+#endif
+
+#ifdef KDICT_KANJI_INDEX
+/**
+ * Function: get_kanji_entry - Look up a Kanji in the reverse index of
+ * kanji_index.h, generated with --kanji-index, with one probe of its minimal
+ * perfect hash.  The readings of the entry are
+ * kanji_index.readings[entry->readings] up to entry[1].readings: each names
+ * a reading (kanji_index.kana[] and kanji_index.rmds[], onyomi below
+ * KANJI_INDEX_KUNYOMI, nanori from KANJI_INDEX_NANORI) and the position of
+ * the Kanji in its klist and olist.  The dictionary words containing the
+ * Kanji are kanji_index.words[entry->words] up to entry[1].words, most
+ * common first.
+ * Input:
+ *   unicode - Unicode value of the Kanji.
+ * Output:
+ *   Pointer to the entry of the Kanji or null pointer if it is not supported.
+ */
+const kanji_entry *get_kanji_entry(uint16_t unicode) {
+  uint16_t slot = mph_slot(unicode, kanji_index.salt, kanji_index.buckets, kanji_index.disp, kanji_index.size);
+  const kanji_entry *entry = &kanji_index.entries[kanji_index.slots[slot]];
+  if (entry->kanji->unicode != unicode) {
+    return (NULL);
+  }
+  return (entry);
+}
+#endif
+
+#ifdef KDICT_KANA_TRIE
+/**
+ * Function: kana_trie_step - Extend the Kana typed so far by one Kana in the
+ * prefix trie of kana_trie.h, generated with --kana-trie.  Unlike make_key(),
+ * which hashes the whole reading, each keystroke takes one binary search of
+ * the labels of the children of the current node, which are in ascending
+ * order.  The onyomi are in the trie as the Hiragana typed for them.  The
+ * node of the prefix has kana_trie.nodes[node].count candidates, the best
+ * Kanji and words of the readings starting with it, at
+ * kana_trie.candidates[kana_trie.nodes[node].candidates].  Each names a
+ * reading (kana_trie.rmds[], dictionary readings from KANA_TRIE_DICTIONARY)
+ * and the position of the Kanji in its klist, or of the word in its olist.
+ * kana_trie.sets[node] has bit (1 << readingType) set for each reading set
+ * that has the prefix itself as a reading.
+ * Input:
+ *   node - Trie node of the Kana typed so far, KANA_TRIE_ROOT for none.
+ *   kana - Unicode value of the Kana typed.
+ * Output:
+ *   Trie node of the extended Kana, or KANA_TRIE_NONE if no reading starts
+ *   with them.
+ */
+uint16_t kana_trie_step(uint16_t node, uint16_t kana) {
+  if (node == KANA_TRIE_NONE) {
+    return (KANA_TRIE_NONE);
+  }
+  uint8_t label = kana & 0x00ff; // Only need lowest byte, as in make_key().
+  uint16_t low = kana_trie.nodes[node].child;
+  uint16_t end = low + kana_trie.nodes[node].children;
+  uint16_t high = end;
+  while (low < high) {
+    uint16_t mid = (low + high) / 2;
+    if (kana_trie.labels[mid] < label) {
+      low = mid + 1;
+    } else {
+      high = mid;
+    }
+  }
+  if (low < end && kana_trie.labels[low] == label) {
+    return (low);
+  }
+  return (KANA_TRIE_NONE);
+}
+#endif
+
+#ifdef KDICT_EYTZINGER_INDEX
+/**
+ * Function: get_reading_eytzinger - Search the Eytzinger index of a reading
+ * set, emitted in place of the BST when the headers are generated with the
+ * 'eytzinger' reading index.  The keys are the nodes of a complete BST in
+ * breadth-first order, so the children of keys[i] are keys[2i+1] and
+ * keys[2i+2], and the search reads one contiguous array.
+ * Input:
+ *   key - Kana key encoded as an unsigned 32-bit number.
+ *   *index - Eytzinger index of the reading set.
+ * Output:
+ *   Pointer to Kanji reading metadata or null pointer if a reading is not found.
+ */
+reading_md* get_reading_eytzinger(uint32_t key, const eytzinger_index *index) {
+  uint32_t i = 0;
+  while (i < index->size) {
+    if (key == index->keys[i]) {
+      return ((reading_md *) index->rmds[i]);
+    }
+    // Left child if the key is lower, right child if it is higher.
+    i = 2 * i + 1 + (key > index->keys[i]);
+  }
+  return (NULL);
+}
+#endif
+
 
 /**
  * Function: murmer_32_scramble
@@ -163,7 +306,13 @@ reading_md* getKunyomiReading(uint16_t *kanaList, uint8_t kanaCount) {
   // Convert Kana to key appropriate for Kunyomi reading.
   uint32_t key = make_key(kanaList, kanaCount, false);
   // Obtain reading and return result.
+#if defined(KDICT_MPH_INDEX)
+  return(get_reading_mph(key, &kunyomi_index));
+#elif defined(KDICT_EYTZINGER_INDEX)
+  return(get_reading_eytzinger(key, &kunyomi_index));
+#else
   return(get_reading(key, (bbt_node *) kunyomi_root_node));
+#endif
 }
 
 /**
@@ -179,7 +328,13 @@ reading_md* getOnyomiReading(uint16_t *kanaList, uint8_t kanaCount) {
   // Convert Kana to key appropriate for Onyomi reading.
   uint32_t key = make_key(kanaList, kanaCount, true);
   // Obtain reading and return result.
+#if defined(KDICT_MPH_INDEX)
+  return(get_reading_mph(key, &onyomi_index));
+#elif defined(KDICT_EYTZINGER_INDEX)
+  return(get_reading_eytzinger(key, &onyomi_index));
+#else
   return(get_reading(key, (bbt_node *) onyomi_root_node));
+#endif
 }
 
 /**
@@ -195,7 +350,13 @@ reading_md* getNanoriReading(uint16_t *kanaList, uint8_t kanaCount) {
   // Convert Kana to key appropriate for Nanori reading.
   uint32_t key = make_key(kanaList, kanaCount, false);
   // Obtain reading and return result.
+#if defined(KDICT_MPH_INDEX)
+  return(get_reading_mph(key, &nanori_index));
+#elif defined(KDICT_EYTZINGER_INDEX)
+  return(get_reading_eytzinger(key, &nanori_index));
+#else
   return(get_reading(key, (bbt_node *) nanori_root_node));
+#endif
 }
 
 /**
@@ -211,7 +372,58 @@ reading_md* getDictionaryReading(uint16_t *kanaList, uint8_t kanaCount) {
   // Convert Kana to key appropriate for Nanori reading.
   uint32_t key = make_key(kanaList, kanaCount, false);
   // Obtain reading and return result.
+#if defined(KDICT_MPH_INDEX)
+  return(get_reading_mph(key, &dictionary_index));
+#elif defined(KDICT_EYTZINGER_INDEX)
+  return(get_reading_eytzinger(key, &dictionary_index));
+#else
   return(get_reading(key, (bbt_node *) dictionary_root_node));
+#endif
+}
+
+/**
+ * Function: meaning_text - Obtain the text of a Kanji or dictionary word
+ * meaning.  When the headers are generated with a meaning codebook, the
+ * meanings are stored encoded, and are decoded here as follows:
+ *   0x01 b    - The byte b itself (a byte 0x80-0xff of a non-ASCII meaning).
+ *   0x80-0xff - Codebook token (byte - 0x80), which expands to the bytes of
+ *               meaning_tokens[] from meaning_token_offsets[token] up to
+ *               meaning_token_offsets[token + 1].
+ *   Others    - The ASCII character itself, up to the terminating NUL.
+ * Otherwise the meaning is the text.
+ * Input:
+ *   *meaning - Meaning string of a kanji_md structure or a dictionary word.
+ * Output:
+ *   Pointer to the text of the meaning.  A decoded meaning is held in a
+ *   buffer that the next call overwrites.
+ */
+const char *meaning_text(const char *meaning) {
+#ifdef KDICT_MEANING_CODEBOOK
+  static char text[MEANING_TEXT_SIZE];
+  const uint8_t *code = (const uint8_t *) meaning;
+  uint16_t len = 0;
+
+  while (*code != 0) {
+    if (*code == 0x01) {
+      // Escaped byte.
+      code++;
+      text[len++] = (char) *code;
+    } else if (*code >= 0x80) {
+      // Codebook token.
+      uint16_t first = meaning_token_offsets[*code - 0x80];
+      uint16_t last = meaning_token_offsets[*code - 0x80 + 1];
+      memcpy(&text[len], &meaning_tokens[first], last - first);
+      len += last - first;
+    } else {
+      text[len++] = (char) *code;
+    }
+    code++;
+  }
+  text[len] = '\0';
+  return (text);
+#else
+  return (meaning);
+#endif
 }
 
 /**
@@ -65,6 +65,23 @@ typedef struct bbt_node {
 } bbt_node;
 #endif
 
+#ifndef KANJI_READING_TYPE
+#define KANJI_READING_TYPE
+typedef struct kanji_reading {
+  const uint16_t reading;
+  const uint16_t posting;
+} kanji_reading;
+#endif
+
+#ifndef KANJI_ENTRY_TYPE
+#define KANJI_ENTRY_TYPE
+typedef struct kanji_entry {
+  const kanji_md * const kanji;
+  const uint16_t readings;
+  const uint16_t words;
+} kanji_entry;
+#endif
+
 #ifndef READING_TYPE_ENUM
 #define READING_TYPE_ENUM
   // enum readingType { NONE, KUNYOMI, ONYOMI, NANORI, JUKUJIKUN, IRREGULAR };
@@ -81,3 +98,8 @@ extern kanji_list_data klist_data[500];
 extern uint16_t totalListSize;
 
 void build_kanji_list_data(uint16_t *kanaList, uint8_t kanaCount);
+const char *meaning_text(const char *meaning);
+// Only defined when kanji_index.h holds the reverse index (--kanji-index).
+const kanji_entry *get_kanji_entry(uint16_t unicode);
+// Only defined when kana_trie.h holds the prefix trie (--kana-trie).
+uint16_t kana_trie_step(uint16_t node, uint16_t kana);